@@ -0,0 +1,105 @@
+# armed_request.py
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+
+# finalize() で、最後の接続確認の後に残しておく余裕 (リクエストの作り直しとスピン開始までの誤差)
+FINALIZE_MARGIN_SECONDS = 0.05
+# 最後の接続確認に使える時間がこれより短ければ、確認を省く
+MIN_PING_TIMEOUT_SECONDS = 0.1
+
+class ArmedRequest:
+    """
+    販売開始前に「撃つだけ」の状態まで準備したリクエスト。
+    DNS解決・TCP/TLS接続の確立・フォームのエンコード・ヘッダーのマージを事前に済ませ、
+    待機中は軽いリクエストで接続を温め続ける。T0 では温まったソケットに書き込むだけになる。
+    """
+
+    def __init__(self, session, url, data, headers, method='POST', keepalive_interval=10, timeout=5):
+        self.session = session
+        self.url = url
+        self.data = data
+        self.headers = headers
+        self.method = method
+        self.keepalive_interval = keepalive_interval
+        self.timeout = timeout
+
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.origin = f"{parts.scheme}://{parts.netloc}/"
+
+        self.prepared = None
+        self.cold_ms = None
+        self.warm_ms = None
+        self._stop_event = threading.Event()
+        self._keepalive_thread = None
+
+    def _ping(self, timeout=None):
+        """接続維持用の軽いリクエスト (HEAD) を送り、所要時間(ミリ秒)を返す"""
+        start = time.perf_counter()
+        self.session.head(self.origin, timeout=timeout or self.timeout, allow_redirects=False)
+        return (time.perf_counter() - start) * 1000.0
+
+    def prepare(self):
+        """フォームのエンコードとヘッダーのマージを済ませた PreparedRequest を作り直す"""
+        request = requests.Request(self.method, self.url, data=self.data, headers=self.headers)
+        self.prepared = self.session.prepare_request(request)
+        return self.prepared
+
+    def arm(self):
+        """DNS解決・接続確立・リクエスト構築を行い、キープアライブを開始する"""
+        print(f"--- リクエストの事前準備 (Armed Request) を開始します: {self.host} ---")
+        try:
+            start = time.perf_counter()
+            socket.getaddrinfo(self.host, self.port, proto=socket.IPPROTO_TCP)
+            dns_ms = (time.perf_counter() - start) * 1000.0
+
+            # 1回目は DNS + TCP + TLS を含むコールドな接続、2回目はプール済みの接続
+            self.cold_ms = self._ping()
+            self.warm_ms = self._ping()
+            print(f"  DNS解決: {dns_ms:.1f} ms / 初回接続: {self.cold_ms:.1f} ms / 接続済み: {self.warm_ms:.1f} ms")
+            print(f"-> 接続確立にかかる約 {self.cold_ms - self.warm_ms:.1f} ms を販売開始前に済ませました。")
+        except (OSError, requests.exceptions.RequestException) as e:
+            print(f"⚠️ 事前接続に失敗しました (T0 で通常どおり接続します): {e}")
+
+        self.prepare()
+        self._stop_event.clear()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+        self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        while not self._stop_event.wait(self.keepalive_interval):
+            try:
+                self._ping()
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ キープアライブに失敗しました: {e}")
+
+    def finalize(self, budget=None):
+        """
+        発火直前に呼ぶ。キープアライブを止め、最後にもう一度接続を温めてから
+        (キープアライブ中に更新されたCookieを含めて) リクエストを作り直す。
+        :param budget: 使ってよい秒数 (スピン開始まで)。停止待ちと最後の接続確認はこの中に収め、
+                       時間が足りなければ接続確認を省く。None なら self.timeout まで待つ。
+        """
+        deadline = time.monotonic() + (self.timeout if budget is None else budget)
+        self._stop_event.set()
+        if self._keepalive_thread:
+            # 送信中のキープアライブが終わらなくても待ち続けない (接続プールが別の接続を使う)
+            self._keepalive_thread.join(timeout=max(0.0, (deadline - time.monotonic()) / 2))
+        # 最後の接続確認は残り時間の半分まで (接続と応答待ちで timeout が2回かかりうるため半分ずつ)
+        ping_timeout = (deadline - time.monotonic()) / 2 - FINALIZE_MARGIN_SECONDS
+        if ping_timeout > MIN_PING_TIMEOUT_SECONDS:
+            try:
+                self._ping(timeout=(ping_timeout / 2, ping_timeout / 2))
+            except requests.exceptions.RequestException:
+                pass
+        else:
+            print("⚠️ 発火までの時間が足りないため、最後の接続確認を省きました。")
+        self.prepare()
+
+    def fire(self):
+        """準備済みのリクエストをそのまま送信する"""
+        return self.session.send(self.prepared, timeout=self.timeout)
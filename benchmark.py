@@ -0,0 +1,172 @@
+# benchmark.py
+"""
+ローカルのスタンドインサーバー(mock_server)に対して main.py を N 回実行し、
+販売開始時刻(T0)から「注文を確定する」が押されるまでの時間を計測する。
+
+使い方: python benchmark.py --runs 5 --cart-latency-ms 30
+       python benchmark.py --page-load    (高速ページモードの有無で商品・かごページの読み込みを比較)
+"""
+import argparse
+import configparser
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from mock_server import MockRakutenServer
+
+# ナビゲーションと全サブリソースの転送量、読み込み完了までの時間を返す
+_PAGE_METRICS_JS = """
+var nav = performance.getEntriesByType('navigation')[0];
+var bytes = nav.transferSize;
+performance.getEntriesByType('resource').forEach(function (r) { bytes += r.transferSize; });
+return {load_ms: nav.loadEventEnd - nav.startTime, bytes: bytes};
+"""
+
+def _percentile(values, pct):
+    """最近傍法によるパーセンタイル"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _write_config(base_config, server, sale_datetime, headless, path, work_dir):
+    """
+    config.ini を元に、スタンドインサーバーへ向けた一時設定ファイルを作る。
+    ログイン状態・セレクタの実績・トレースは work_dir (一時フォルダ) に保存し、本番用のファイルを上書きしない。
+    """
+    config = configparser.RawConfigParser()
+    config.optionxform = str  # キーの大文字小文字を保持する
+    config.read(base_config, 'utf-8')
+    overrides = server.config_overrides()
+    overrides.setdefault('SETTINGS', {}).update({
+        'HeadlessMode': 'true' if headless else 'false',
+        'NotificationMethod': 'none',
+        'SaleStartTime': sale_datetime.strftime('%H:%M:%S'),
+        'SaleDayRollover': 'false',
+        'ClockSyncEnabled': 'false',
+        'SessionFile': os.path.join(work_dir, 'cookies.pkl'),
+        'SelectorStatsFile': os.path.join(work_dir, 'selector_stats.json'),
+        'TraceDirectory': os.path.join(work_dir, 'traces'),
+    })
+    # スタンドインサーバーに対しては本当に注文しても問題ない
+    overrides.setdefault('PURCHASE', {})['AutoPurchaseEnabled'] = 'true'
+    for section, values in overrides.items():
+        if not config.has_section(section):
+            config.add_section(section)
+        for key, value in values.items():
+            config.set(section, key, value)
+    with open(path, 'w', encoding='utf-8') as f:
+        config.write(f)
+
+def run_once(server, base_config, lead_seconds, headless, timeout):
+    """1回分の実行。T0 → 注文確定 の秒数 (失敗時は None) を返す"""
+    # SaleStartTime は秒単位なので、起動・ログインに必要な時間を見込んで次の整数秒に合わせる
+    sale_datetime = (datetime.now() + timedelta(seconds=lead_seconds + 1)).replace(microsecond=0)
+    sale_epoch = sale_datetime.timestamp()
+    server.reset(sale_at=sale_epoch)
+
+    with tempfile.TemporaryDirectory(prefix='rakuten_bench_') as work_dir:
+        config_path = os.path.join(work_dir, 'config.ini')
+        _write_config(base_config, server, sale_datetime, headless, config_path, work_dir)
+        try:
+            subprocess.run(
+                [sys.executable, 'main.py', '--config', config_path],
+                timeout=timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except subprocess.TimeoutExpired:
+            print("  ⚠️ タイムアウトしました。")
+
+    commit_at = server.first_event('commit')
+    if commit_at is None:
+        return None
+    return commit_at - sale_epoch
+
+def measure_page_loads(urls, runs, fast_page_mode, headless):
+    """商品・かごページを runs 回ずつ読み込み、読み込み時間(ms)と転送量(byte)の中央値を返す"""
+    from driver_setup import setup_driver
+
+    driver = setup_driver(headless=headless, fast_page_mode=fast_page_mode)
+    results = {}
+    try:
+        for name, url in urls.items():
+            loads, sizes = [], []
+            for _ in range(runs):
+                driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+                driver.get(url)
+                metrics = driver.execute_script(_PAGE_METRICS_JS)
+                loads.append(metrics['load_ms'])
+                sizes.append(metrics['bytes'])
+            results[name] = (statistics.median(loads), statistics.median(sizes))
+    finally:
+        driver.quit()
+    return results
+
+def run_page_load_benchmark(server, runs, headless, urls=None):
+    """高速ページモード (リソース遮断) の有無で、ページの読み込み時間と転送量を比較する"""
+    urls = urls or {'商品ページ': f"{server.base_url}/item/", '買い物かご': f"{server.base_url}/cart/"}
+    baseline = measure_page_loads(urls, runs, False, headless)
+    filtered = measure_page_loads(urls, runs, True, headless)
+
+    print("\n" + "=" * 70)
+    print(f"{'ページ':<10}{'遮断なし':>24}{'高速ページモード':>28}")
+    for name in urls:
+        (base_ms, base_bytes), (fast_ms, fast_bytes) = baseline[name], filtered[name]
+        print(f"{name:<10}{base_ms:>10.1f} ms {base_bytes / 1024:>8.1f} KB"
+              f"{fast_ms:>14.1f} ms {fast_bytes / 1024:>8.1f} KB")
+    print("=" * 70)
+
+def main():
+    parser = argparse.ArgumentParser(description='T0 → 注文確定 のベンチマーク')
+    parser.add_argument('--runs', type=int, default=5, help='実行回数')
+    parser.add_argument('--config', default='config.ini', help='元にする設定ファイル')
+    parser.add_argument('--lead-seconds', type=int, default=30, help='起動から T0 までの余裕(秒)')
+    parser.add_argument('--timeout', type=int, default=120, help='1回あたりの最大実行時間(秒)')
+    parser.add_argument('--cart-latency-ms', type=int, default=0, help='cartAdd の応答遅延(ミリ秒)')
+    parser.add_argument('--page-latency-ms', type=int, default=0, help='各ページの応答遅延(ミリ秒)')
+    parser.add_argument('--cart-results', default='0', help='T0 以降に cartAdd が順に返す resultCode (カンマ区切り)')
+    parser.add_argument('--show-browser', action='store_true', help='ブラウザを表示して実行する')
+    parser.add_argument('--page-load', action='store_true', help='高速ページモードの有無でページ読み込みを比較する')
+    parser.add_argument('--product-url', help='--page-load で計測する商品ページ (既定: スタンドインサーバー)')
+    parser.add_argument('--cart-url', help='--page-load で計測する買い物かごページ (既定: スタンドインサーバー)')
+    args = parser.parse_args()
+
+    server = MockRakutenServer(
+        cart_results=args.cart_results.split(','),
+        cart_latency_ms=args.cart_latency_ms, page_latency_ms=args.page_latency_ms,
+    ).start()
+    print(f"スタンドインサーバー: {server.base_url}")
+
+    if args.page_load:
+        urls = None
+        if args.product_url and args.cart_url:
+            urls = {'商品ページ': args.product_url, '買い物かご': args.cart_url}
+        run_page_load_benchmark(server, args.runs, not args.show_browser, urls)
+        server.shutdown()
+        return
+
+    results = []
+    for run in range(1, args.runs + 1):
+        print(f"[{run}/{args.runs}] 実行中...")
+        elapsed = run_once(server, args.config, args.lead_seconds, not args.show_browser, args.timeout)
+        if elapsed is None:
+            print("  ❌ 注文確定まで到達しませんでした。")
+        else:
+            print(f"  T0 → 注文確定: {elapsed * 1000:.1f} ms")
+            results.append(elapsed * 1000)
+        time.sleep(1)
+
+    server.shutdown()
+    print("\n" + "=" * 50)
+    print(f"成功: {len(results)}/{args.runs} 回")
+    if results:
+        print(f"  p50: {statistics.median(results):.1f} ms")
+        print(f"  p99: {_percentile(results, 99):.1f} ms")
+        print(f"  最小: {min(results):.1f} ms / 最大: {max(results):.1f} ms")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    main()
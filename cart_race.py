@@ -0,0 +1,33 @@
+# cart_race.py
+import threading
+from contextlib import contextmanager
+
+class CartAddGate:
+    """
+    API と UIクリックの2経路で同時にカート追加を試みる (CartAddMode = race) ときの調停役。
+    カート追加の送信から結果の確認までを turn() の中で行うことで、同時に送信中の追加を常に1つに限る。
+    どちらかが成功 (win) した後、または結果が不明になった (abort) 後は、turn() は送信を許可しない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.winner = None                  # 先に成功した経路 ('api' / 'ui')
+        self.aborted = False                # 結果が不明なカート追加があり、以降の送信を止めたか
+        self.decided = threading.Event()    # 勝者が決まるか中止したらセットされる (負けた側の待機を打ち切る)
+
+    @contextmanager
+    def turn(self):
+        """with gate.turn() as allowed: のように使う。allowed が False なら既に決着しているので送信しない"""
+        with self._lock:
+            yield self.winner is None and not self.aborted
+
+    def win(self, path):
+        """turn() の中で、成功を確認した経路が呼ぶ"""
+        if self.winner is None:
+            self.winner = path
+            self.decided.set()
+
+    def abort(self):
+        """turn() の中で、送信したカート追加の結果を確認できなかった経路が呼ぶ (もう一方の送信も止める)"""
+        self.aborted = True
+        self.decided.set()
@@ -0,0 +1,81 @@
+# cart_retry.py
+import random
+import time
+
+# --- cartAdd 応答の分類 ---
+SUCCESS = 'success'      # カートに追加された
+RETRYABLE = 'retryable'  # 販売開始前など、すぐに再送すれば成功しうる
+PERMANENT = 'permanent'  # 売り切れ・購入数の上限など、再送しても成功しない
+TRANSPORT = 'transport'  # 通信エラー・混雑 (429/5xx)・JSON以外の応答
+
+# resultCode が設定のいずれにも含まれない場合に、メッセージの文言で判定するためのキーワード
+_PERMANENT_KEYWORDS = ('売り切れ', '在庫がありません', '上限', 'ログインしてください')
+_RETRYABLE_KEYWORDS = ('販売開始前', '販売期間外', 'しばらくしてから')
+
+# 混雑・一時的な障害を示すステータス
+_TRANSPORT_STATUSES = (408, 429, 500, 502, 503, 504)
+
+def classify_cart_response(response, success_codes=('0',), retryable_codes=(), permanent_codes=()):
+    """
+    cartAdd の応答を4種類に分類する。
+    success_codes に含まれる resultCode が明示的に返った場合だけを成功とみなす。
+    :return: (分類, 表示用の詳細)
+    """
+    if response.status_code in _TRANSPORT_STATUSES:
+        return TRANSPORT, f"HTTP {response.status_code}"
+    if response.status_code != 200:
+        return PERMANENT, f"HTTP {response.status_code}"
+
+    try:
+        res_json = response.json()
+    except ValueError:
+        # エラーページ(HTML)などが返った場合は、成功とはみなさず再送する
+        return TRANSPORT, "応答がJSONではありません"
+    if not isinstance(res_json, dict):
+        return TRANSPORT, "応答の形式が想定と異なります"
+
+    if "resultCode" not in res_json:
+        # {} や {"error": ...} など、カートに入ったかを判断できない応答
+        return TRANSPORT, f"resultCode がありません: {str(res_json)[:100]}"
+
+    result_code = str(res_json["resultCode"])
+    message = str(res_json.get("resultMessage", "")).replace("<br>", " ")
+    detail = f"{result_code} {message}".strip()
+    if result_code in success_codes:
+        return SUCCESS, detail
+    if result_code in permanent_codes:
+        return PERMANENT, detail
+    if result_code in retryable_codes:
+        return RETRYABLE, detail
+    if any(keyword in message for keyword in _PERMANENT_KEYWORDS):
+        return PERMANENT, detail
+    if any(keyword in message for keyword in _RETRYABLE_KEYWORDS):
+        return RETRYABLE, detail
+    # 未知のコードは、販売開始直後の一時的なものとみなして再送する
+    return RETRYABLE, detail
+
+class RetrySchedule:
+    """
+    再送の間隔を決める。初回は短く、失敗するたびに multiplier 倍 (上限 max_ms) に延ばし、
+    ±jitter の割合でばらつかせる。最初の送信から budget_seconds を超える再送は行わない。
+    """
+
+    def __init__(self, budget_seconds=5.0, initial_ms=50, max_ms=500, multiplier=1.5, jitter=0.2):
+        self.budget_seconds = budget_seconds
+        self.initial_ms = initial_ms
+        self.max_ms = max(max_ms, initial_ms)
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.started = time.monotonic()
+        self._delay_ms = initial_ms
+
+    def next_delay(self):
+        """次の送信までの待ち時間(秒)。時間切れの場合は None"""
+        delay = self._delay_ms / 1000.0 * random.uniform(1 - self.jitter, 1 + self.jitter)
+        self._delay_ms = min(self.max_ms, self._delay_ms * self.multiplier)
+        if time.monotonic() + delay - self.started > self.budget_seconds:
+            return None
+        return delay
+
+    def elapsed(self):
+        return time.monotonic() - self.started
@@ -0,0 +1,114 @@
+# clock_sync.py
+import sys
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+def _sample(session, url, timeout):
+    """
+    1回分の計測。リクエスト送信前後のローカル時刻と、サーバーの Date ヘッダー(秒単位)を返す。
+    """
+    t0 = time.time()
+    response = session.head(url, timeout=timeout, allow_redirects=False)
+    t1 = time.time()
+    date_header = response.headers.get('Date')
+    if not date_header:
+        raise ValueError(f"Date ヘッダーがありません ({url})")
+    server_second = parsedate_to_datetime(date_header).timestamp()
+    return t0, t1, server_second
+
+def estimate_offset(url, samples=12, timeout=3, session=None):
+    """
+    指定ホストの時計とローカル時計のずれ(offset = サーバー - ローカル, 秒)を推定する。
+
+    Date ヘッダーは1秒単位のため、1回の計測で分かるのは
+    「サーバー時刻 S 秒台の瞬間が、ローカルの [t0, t1] のどこかにあった」ことだけ。
+    つまり offset は [S - t1, S + 1 - t0] の範囲に入る。
+    次の計測はサーバー側の秒の切り替わり直前に届くよう送信時刻を調整し、
+    範囲の共通部分を取ることで誤差を RTT 程度まで絞り込む。
+    """
+    session = session or requests.Session()
+    url = _origin(url)
+    low, high = float('-inf'), float('inf')
+    rtts = []
+
+    # 1回目はコネクション確立を含むため、計測には使わない
+    session.head(url, timeout=timeout, allow_redirects=False)
+
+    for _ in range(samples):
+        if rtts:
+            # 推定中の offset で、サーバー時刻が次の整数秒を迎えるローカル時刻を狙う
+            # (1回目の計測後の範囲は 1秒 + RTT あるため、範囲の幅によらず狙う。狙うたびに範囲はほぼ半分になる)
+            mid = (low + high) / 2
+            half_rtt = min(rtts) / 2
+            now = time.time()
+            boundary = int(now + mid) + 1 - mid
+            send_at = boundary - half_rtt
+            while send_at - now < 0.05:
+                send_at += 1.0
+            time.sleep(send_at - now)
+
+        t0, t1, server_second = _sample(session, url, timeout)
+        rtts.append(t1 - t0)
+        new_low = max(low, server_second - t1)
+        new_high = min(high, server_second + 1 - t0)
+        if new_low > new_high:
+            # 矛盾した計測 (サーバーの揺らぎなど) は捨てる
+            continue
+        low, high = new_low, new_high
+
+    if low == float('-inf'):
+        raise ValueError(f"有効な計測が得られませんでした ({url})")
+
+    return {
+        'url': url,
+        'offset': (low + high) / 2,
+        'low': low,
+        'high': high,
+        'error': (high - low) / 2,
+        'rtt_ms': min(rtts) * 1000.0,
+        'samples': len(rtts),
+    }
+
+def sync_server_clock(config, urls):
+    """
+    カート・商品ページのホストの時計を計測し、最も誤差の小さい推定値を採用する。
+    計測に失敗した場合や誤差が大きすぎる場合は 0 (ローカル時計をそのまま使う) を返す。
+    """
+    samples = config.get('clock_sync_samples', 12)
+    max_error_ms = config.get('clock_sync_max_error_ms', 50)
+
+    print("\n--- サーバー時計との時刻同期を開始します ---")
+    results = []
+    for url in dict.fromkeys(_origin(u) for u in urls if u):
+        try:
+            result = estimate_offset(url, samples=samples)
+            results.append(result)
+            print(f"  {result['url']}: ずれ {result['offset'] * 1000:+.1f} ms "
+                  f"(誤差 ±{result['error'] * 1000:.1f} ms, RTT {result['rtt_ms']:.1f} ms)")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"  ⚠️ {url} の計測に失敗しました: {e}")
+
+    if not results:
+        print("-> 時刻同期に失敗したため、ローカル時計で待機します。")
+        return 0.0
+
+    best = min(results, key=lambda r: r['error'])
+    if best['error'] * 1000 > max_error_ms:
+        print(f"-> 誤差が大きすぎるため (±{best['error'] * 1000:.1f} ms)、ローカル時計で待機します。")
+        return 0.0
+
+    print(f"-> サーバー時計のずれ {best['offset'] * 1000:+.1f} ms を補正して発火します。")
+    return best['offset']
+
+if __name__ == '__main__':
+    # 使い方: python clock_sync.py http://127.0.0.1:8080/ [URL ...]
+    for target in sys.argv[1:]:
+        r = estimate_offset(target)
+        print(f"{r['url']}: offset {r['offset'] * 1000:+.1f} ms, "
+              f"範囲 [{r['low'] * 1000:+.1f}, {r['high'] * 1000:+.1f}] ms, RTT {r['rtt_ms']:.1f} ms")
@@ -1,13 +1,55 @@
 import sys
 import configparser
 import os
+from datetime import datetime
 
-def load_config():
-    """設定ファイル(config.ini)を読み込み、辞書として返す"""
-    config_file = 'config.ini'
+class ConfigError(Exception):
+    """設定ファイルの内容が不正であることを示す"""
+
+def load_browser_settings(config_file='config.ini'):
+    """
+    ブラウザの起動に必要な設定だけを読み込む。
+    設定全体の検証を待たずにChromeの起動を始めるために使う (項目がなければ既定値)。
+    """
+    config = configparser.RawConfigParser()
+    config.read(config_file, 'utf-8')
+    return {
+        'headless': config.getboolean('SETTINGS', 'HeadlessMode', fallback=True),
+        'width': config.getint('SETTINGS', 'WindowWidth', fallback=1920),
+        'height': config.getint('SETTINGS', 'WindowHeight', fallback=1080),
+        'driver_path': config.get('SETTINGS', 'ChromeDriverPath', fallback='').strip() or None,
+        'offline': config.getboolean('SETTINGS', 'OfflineDriverMode', fallback=False),
+        'profile_dir': config.get('SETTINGS', 'ChromeProfileDir', fallback='').strip() or None,
+        'fast_page_mode': config.getboolean('SETTINGS', 'FastPageMode', fallback=False),
+        'blocked_url_patterns': [p for p in config.get('SETTINGS', 'BlockedUrlPatterns', fallback='').split(',') if p.strip()],
+        'page_load_strategy': config.get('SETTINGS', 'PageLoadStrategy', fallback='normal').strip().lower(),
+        'prelaunch': config.getboolean('SETTINGS', 'PrelaunchBrowser', fallback=True),
+    }
+
+def _load_watchlist(config, default_max_price):
+    """[WATCH:名前] セクションを、監視する商品のリストとして読み込む"""
+    watchlist = []
+    for section in config.sections():
+        if not section.upper().startswith('WATCH:'):
+            continue
+        watchlist.append({
+            'name': section.split(':', 1)[1].strip() or section,
+            'url': config.get(section, 'URL'),
+            'max_price': config.getint(section, 'MaxPrice', fallback=default_max_price),
+            'sku_preference': [v.strip() for v in config.get(section, 'SkuPreference', fallback='').split(',') if v.strip()],
+            'max_quantity': max(1, config.getint(section, 'MaxQuantity', fallback=1)),
+        })
+    return watchlist
+
+def parse_config(config_file='config.ini', verbose=True):
+    """
+    設定ファイル(config.ini)を読み込んで検証し、辞書として返す。
+    内容が不正な場合は ConfigError を送出する (プログラムは終了しない)。
+    verbose が False の場合は、通知設定などの案内を表示しない (実行中の再読み込み用)。
+    """
+    log = print if verbose else (lambda *args: None)
     if not os.path.exists(config_file):
-        print(f"エラー: 設定ファイル '{config_file}' が見つかりません。")
-        sys.exit(1)
+        raise ConfigError(f"設定ファイル '{config_file}' が見つかりません。")
 
     config = configparser.RawConfigParser()
     config.read(config_file, 'utf-8')
@@ -19,22 +61,57 @@ def load_config():
             'interval': config.getint('SETTINGS', 'CheckIntervalSeconds'),
             'wait_timeout': config.getint('SETTINGS', 'WaitTimeoutSeconds'),
             'notification_method': config.get('SETTINGS', 'NotificationMethod', fallback='none').lower(),
+            'notification_flush_seconds': config.getfloat('SETTINGS', 'NotificationFlushSeconds', fallback=10.0),
             'window_width': config.getint('SETTINGS', 'WindowWidth', fallback=1920),
             'window_height': config.getint('SETTINGS', 'WindowHeight', fallback=1080),
             'persistent_mode': config.getboolean('SETTINGS', 'PersistentMode', fallback=False),
+            'restock_max_interval_seconds': config.getfloat('SETTINGS', 'RestockMaxIntervalSeconds', fallback=10.0),
+            'session_reuse_enabled': config.getboolean('SETTINGS', 'SessionReuseEnabled', fallback=True),
+            'session_file': config.get('SETTINGS', 'SessionFile', fallback='cookies.pkl'),
+            'http_product_fetch': config.getboolean('SETTINGS', 'HttpProductFetch', fallback=True),
             'sale_start_time': config.get('SETTINGS', 'SaleStartTime'),
             'pre_sale_wait_seconds': config.getint('SETTINGS', 'PreSaleWaitSeconds', fallback=180),
             'polling_interval_ms': config.getint('SETTINGS', 'PollingIntervalMilliseconds', fallback=100),
+            'fire_lead_ms': config.getint('SETTINGS', 'FireLeadMilliseconds', fallback=0),
+            'spin_window_ms': config.getint('SETTINGS', 'SpinWindowMilliseconds', fallback=20),
+            'sale_day_rollover': config.getboolean('SETTINGS', 'SaleDayRollover', fallback=True),
+            'config_hot_reload': config.getboolean('SETTINGS', 'ConfigHotReload', fallback=True),
+            'clock_sync_enabled': config.getboolean('SETTINGS', 'ClockSyncEnabled', fallback=True),
+            'clock_sync_samples': config.getint('SETTINGS', 'ClockSyncSamples', fallback=12),
+            'clock_sync_max_error_ms': config.getint('SETTINGS', 'ClockSyncMaxErrorMilliseconds', fallback=50),
+            'armed_request_enabled': config.getboolean('SETTINGS', 'ArmedRequestEnabled', fallback=True),
+            'armed_keepalive_seconds': config.getint('SETTINGS', 'ArmedKeepAliveSeconds', fallback=10),
+            'armed_finalize_seconds': config.getfloat('SETTINGS', 'ArmedFinalizeSeconds', fallback=2.0),
+            'cart_prestage_enabled': config.getboolean('SETTINGS', 'CartPrestageEnabled', fallback=True),
+            'sudo_refresh_seconds': config.getint('SETTINGS', 'SudoRefreshSecondsBeforeSale', fallback=60),
+            'session_keepalive_seconds': config.getint('SETTINGS', 'SessionKeepAliveSeconds', fallback=300),
+            'cart_add_mode': config.get('SETTINGS', 'CartAddMode', fallback='api').strip().lower(),
+            'race_ui_confirm_seconds': config.getfloat('SETTINGS', 'RaceUiConfirmSeconds', fallback=3.0),
+            'cart_retry_budget_seconds': config.getfloat('SETTINGS', 'CartRetryBudgetSeconds', fallback=5.0),
+            'cart_retry_initial_ms': config.getint('SETTINGS', 'CartRetryInitialMilliseconds', fallback=50),
+            'cart_retry_max_ms': config.getint('SETTINGS', 'CartRetryMaxMilliseconds', fallback=500),
+            'cart_retry_jitter': config.getfloat('SETTINGS', 'CartRetryJitter', fallback=0.2),
+            'cart_success_codes': [c.strip() for c in config.get('SETTINGS', 'CartSuccessCodes', fallback='0').split(',') if c.strip()],
+            'cart_retryable_codes': [c.strip() for c in config.get('SETTINGS', 'CartRetryableCodes', fallback='R00100').split(',') if c.strip()],
+            'cart_permanent_codes': [c.strip() for c in config.get('SETTINGS', 'CartPermanentCodes', fallback='R00200,R00300,R00900').split(',') if c.strip()],
+            'cookie_sync_verify': config.getboolean('SETTINGS', 'CookieSyncVerify', fallback=False),
+            'trace_enabled': config.getboolean('SETTINGS', 'TraceEnabled', fallback=True),
+            'trace_dir': config.get('SETTINGS', 'TraceDirectory', fallback='traces'),
+            'selector_stats_file': config.get('SETTINGS', 'SelectorStatsFile', fallback='selector_stats.json'),
             'max_price': config.getint('PRODUCT', 'MaxPrice'),
             'auto_purchase': config.getboolean('PURCHASE', 'AutoPurchaseEnabled'),
+            'http_checkout_enabled': config.getboolean('PURCHASE', 'HttpCheckoutEnabled', fallback=False),
             'login_id': config.get('ACCOUNT_INFO', 'LoginID'),
             'password': config.get('ACCOUNT_INFO', 'Password').strip('"\''),
             'base_url': config.get('URLS', 'BaseURL'),
             'login_url': config.get('URLS', 'LoginPageURL'),
             'target_product_url': config.get('URLS', 'TargetProductURL'),
             'cart_url': config.get('URLS', 'CartURL'),
+            'order_history_url': config.get('URLS', 'OrderHistoryURL', fallback='https://order.my.rakuten.co.jp/'),
             'ss_success_path': config.get('FILE_PATHS', 'SuccessScreenshot'),
             'ss_error_path': config.get('FILE_PATHS', 'ErrorScreenshot'),
+            'screenshot_scale': config.getfloat('FILE_PATHS', 'ScreenshotScale', fallback=0.5),
+            'screenshot_quality': config.getint('FILE_PATHS', 'ScreenshotQuality', fallback=70),
         }
         
         # ★★★★★ ここからが修正箇所 ★★★★★
@@ -43,56 +120,86 @@ def load_config():
         method = settings['notification_method']
         
         if method == 'line':
-            print("通知方法: LINE")
+            log("通知方法: LINE")
             token = config.get('LINE', 'ChannelAccessToken', fallback='').strip()
             group_id = config.get('LINE', 'TargetGroupID', fallback='').strip()
             
             # バリデーションチェック
             is_valid = True
             if not token or token.startswith("ここに"):
-                print("警告: config.ini の [LINE] ChannelAccessToken が正しく設定されていません。")
+                log("警告: config.ini の [LINE] ChannelAccessToken が正しく設定されていません。")
                 is_valid = False
             if not group_id or not group_id.startswith(('C', 'U')): # GroupIDは'C', UserIDは'U'で始まる
-                print("警告: config.ini の [LINE] TargetGroupID が正しく設定されていません。")
+                log("警告: config.ini の [LINE] TargetGroupID が正しく設定されていません。")
                 is_valid = False
 
             if is_valid:
                 settings['token'] = token
                 settings['group_id'] = group_id
             else:
-                print("-> LINE通知を無効にして処理を続行します。")
+                log("-> LINE通知を無効にして処理を続行します。")
                 settings['notification_method'] = 'none'
 
         elif method == 'discord':
-            print("通知方法: Discord")
+            log("通知方法: Discord")
             webhook_url = config.get('DISCORD', 'WebhookURL', fallback='').strip()
 
             # バリデーションチェック
             if webhook_url and webhook_url.startswith('https://discord.com/api/webhooks/'):
                 settings['webhook_url'] = webhook_url
             else:
-                print("警告: config.ini の [DISCORD] WebhookURL が正しく設定されていません。")
-                print("-> Discord通知を無効にして処理を続行します。")
+                log("警告: config.ini の [DISCORD] WebhookURL が正しく設定されていません。")
+                log("-> Discord通知を無効にして処理を続行します。")
                 settings['notification_method'] = 'none'
 
         elif method == 'none':
             # 何もしない (通知無効が意図通り)
             pass
         else:
-            print(f"警告: config.ini で不明な通知方法 '{method}' が指定されています。通知は行われません。")
+            log(f"警告: config.ini で不明な通知方法 '{method}' が指定されています。通知は行われません。")
             settings['notification_method'] = 'none'
         
         # ★★★★★ 修正箇所ここまで ★★★★★
 
-        # --- アカウント情報のバリデーション (変更なし) ---
-        if settings['auto_purchase'] and (not settings['login_id'] or not settings['password']):
-            print("エラー: 自動購入が有効ですが、LoginID または Password が設定されていません。")
-            sys.exit(1)
-            
+        # --- ウォッチリスト ([WATCH:名前] セクション) の読み込み ---
+        settings['watchlist'] = _load_watchlist(config, settings['max_price'])
+
+        _validate(settings)
         return settings
+    except ConfigError:
+        raise
     except (configparser.NoSectionError, configparser.NoOptionError) as e:
-        print(f"エラー: 設定ファイル '{config_file}' の読み込みに失敗しました。項目が不足している可能性があります: {e}")
-        sys.exit(1)
+        raise ConfigError(f"設定ファイル '{config_file}' の読み込みに失敗しました。項目が不足している可能性があります: {e}") from e
     except Exception as e:
-        print(f"エラー: 設定ファイル '{config_file}' の読み込み中に予期せぬエラーが発生しました: {e}")
+        raise ConfigError(f"設定ファイル '{config_file}' の読み込み中に予期せぬエラーが発生しました: {e}") from e
+
+def _validate(settings):
+    """値の範囲・形式を検証する"""
+    # --- アカウント情報のバリデーション (変更なし) ---
+    if settings['auto_purchase'] and (not settings['login_id'] or not settings['password']):
+        raise ConfigError("自動購入が有効ですが、LoginID または Password が設定されていません。")
+
+    try:
+        datetime.strptime(settings['sale_start_time'].strip('"\''), "%H:%M:%S")
+    except ValueError:
+        raise ConfigError(f"SaleStartTime '{settings['sale_start_time']}' が 'HH:MM:SS' 形式ではありません。")
+    if settings['polling_interval_ms'] <= 0:
+        raise ConfigError("PollingIntervalMilliseconds は 1 以上を指定してください。")
+    if settings['interval'] <= 0:
+        raise ConfigError("CheckIntervalSeconds は 1 以上を指定してください。")
+    if settings['cart_add_mode'] not in ('api', 'ui', 'race'):
+        raise ConfigError(f"CartAddMode '{settings['cart_add_mode']}' は api / ui / race のいずれかを指定してください。")
+    if settings['cart_retry_budget_seconds'] <= 0:
+        raise ConfigError("CartRetryBudgetSeconds は 0 より大きい値を指定してください。")
+    if not 0 <= settings['cart_retry_jitter'] < 1:
+        raise ConfigError("CartRetryJitter は 0 以上 1 未満を指定してください。")
+    if settings['max_price'] < 0:
+        raise ConfigError("MaxPrice は 0 以上を指定してください。")
+
+def load_config(config_file='config.ini'):
+    """設定ファイル(config.ini)を読み込み、辞書として返す (内容が不正な場合はエラーを表示して終了する)"""
+    try:
+        return parse_config(config_file)
+    except ConfigError as e:
+        print(f"エラー: {e}")
         sys.exit(1)
\ No newline at end of file
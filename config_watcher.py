@@ -0,0 +1,62 @@
+# config_watcher.py
+import os
+from config_loader import parse_config, ConfigError
+
+# 実行中に変更を反映してよい項目 (config のキー)。
+# ブラウザ・ログイン・接続の作り直しが必要な項目は反映せず、再起動が必要である旨を表示する。
+SAFE_KEYS = (
+    'sale_start_time',
+    'polling_interval_ms',
+    'max_price',
+    'fire_lead_ms',
+)
+
+class ConfigWatcher:
+    """
+    config.ini の更新を監視し、検証を通った「安全な」変更だけを実行中の config に反映する。
+    check() を待機ループから定期的に呼び出して使う。
+
+    config は専用の型にせず、parse_config が返す辞書のまま扱う。各モジュールは同じ辞書を
+    config['キー'] / config.get('キー', 既定値) で参照しているため、その辞書をその場で更新すれば、
+    待機中の処理に新しいオブジェクトを渡し直さなくても変更が届く。
+    型と値の範囲は、ファイル全体を parse_config で読み直して検証した後にだけ反映する。
+    """
+
+    def __init__(self, config_file, config):
+        self.config_file = config_file
+        self.config = config
+        self._mtime = self._stat()
+
+    def _stat(self):
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def check(self):
+        """
+        ファイルが更新されていれば読み込み直す。
+        :return: 反映した項目の {キー: 新しい値} (変更がない・反映を拒否した場合は空の辞書)
+        """
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return {}
+        self._mtime = mtime
+
+        try:
+            latest = parse_config(self.config_file, verbose=False)
+        except ConfigError as e:
+            print(f"⚠️ 設定ファイルの変更を反映しませんでした (現在の設定で続行します): {e}")
+            return {}
+
+        changed = {key: value for key, value in latest.items() if self.config.get(key) != value}
+        rejected = sorted(key for key in changed if key not in SAFE_KEYS)
+        if rejected:
+            print(f"⚠️ 次の項目は実行中に変更できないため反映しませんでした (再起動後に有効): {', '.join(rejected)}")
+
+        applied = {key: value for key, value in changed.items() if key in SAFE_KEYS}
+        for key, value in applied.items():
+            print(f"🔄 設定を反映しました: {key} = {value} (変更前: {self.config.get(key)})")
+        # 待機中の別スレッドが、一部だけ反映された設定を読まないよう一度に更新する
+        self.config.update(applied)
+        return applied
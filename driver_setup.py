@@ -1,18 +1,86 @@
 # driver_setup.py
-import pickle
 import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
+from session_store import load_cookies
+from network_filter import apply_network_filter
 
-def setup_driver(headless=True, width=1920, height=1080, use_cookies=False):
+# 最後に正常に使えたchromedriverの場所を記録するファイル
+DRIVER_CACHE_FILE = 'driver_cache.json'
+# この時間(秒)以内に解決したchromedriverは、ネットワーク確認なしで再利用する
+DRIVER_CACHE_MAX_AGE = 24 * 60 * 60
+
+def _load_driver_cache():
+    try:
+        with open(DRIVER_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('path') and os.path.exists(cache['path']):
+            return cache
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _save_driver_cache(path):
+    try:
+        with open(DRIVER_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'path': path, 'resolved_at': time.time()}, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"⚠️ chromedriverのキャッシュを保存できませんでした: {e}")
+
+def resolve_chromedriver(driver_path=None, offline=False):
+    """
+    chromedriverのパスを決定する。
+    1. driver_path (固定指定) があればそれを使う
+    2. キャッシュが新しい、またはオフラインモードなら、最後に使えたchromedriverを使う
+    3. それ以外は webdriver_manager で解決し、失敗した場合はキャッシュにフォールバックする
+    """
+    if driver_path:
+        if os.path.exists(driver_path):
+            return driver_path
+        print(f"⚠️ 指定されたchromedriverが見つかりません: {driver_path}")
+
+    cache = _load_driver_cache()
+    if cache and (offline or time.time() - cache.get('resolved_at', 0) < DRIVER_CACHE_MAX_AGE):
+        return cache['path']
+    if offline:
+        raise RuntimeError("オフラインモードですが、使用できるchromedriverのキャッシュがありません。")
+
+    try:
+        # webdriver_manager は読み込みが重いため、固定指定・キャッシュで解決できなかった時だけ読み込む
+        from webdriver_manager.chrome import ChromeDriverManager
+        path = ChromeDriverManager().install()
+        _save_driver_cache(path)
+        return path
+    except Exception as e:
+        if cache:
+            print(f"⚠️ chromedriverの解決に失敗したため、前回のものを使います: {e}")
+            return cache['path']
+        raise
+
+def setup_driver(headless=True, width=1920, height=1080, use_cookies=False,
+                 driver_path=None, offline=False, profile_dir=None, cookie_file='cookies.pkl',
+                 fast_page_mode=False, blocked_url_patterns=(), page_load_strategy='normal'):
     """
     Selenium WebDriverをセットアップする共通関数
     :param headless: Trueならブラウザ非表示、Falseなら表示
     :param use_cookies: Trueなら保存されたクッキーを読み込む
+    :param driver_path: 使用するchromedriverのパス (固定する場合)
+    :param offline: Trueならネットワークを使わず、前回のchromedriverを再利用する
+    :param profile_dir: Chromeのプロファイルを保存するフォルダ (指定時は起動をまたいで再利用)
+    :param fast_page_mode: Trueなら画像・フォント・計測ビーコンなど不要なリソースを遮断する
+    :param blocked_url_patterns: 追加で遮断するURLパターン
+    :param page_load_strategy: 'normal' / 'eager' (DOM構築完了まで) / 'none' (待たない)
     """
+    start = time.perf_counter()
     options = Options()
+    if page_load_strategy not in ('normal', 'eager', 'none'):
+        print(f"⚠️ 不明な PageLoadStrategy '{page_load_strategy}' のため normal を使います。")
+        page_load_strategy = 'normal'
+    options.page_load_strategy = page_load_strategy
     if headless:
         options.add_argument('--headless')
     # ★★★ 変更点: 引数から受け取った値でウインドウサイズを設定します ★★★
@@ -24,37 +92,61 @@ def setup_driver(headless=True, width=1920, height=1080, use_cookies=False):
     options.add_argument('--no-sandbox') # セキュリティサンドボックスを無効化（ただしセキュリティリスクは上がる）
     options.add_argument('--disable-dev-shm-usage') # `/dev/shm` の使用を無効化
     options.add_argument('--disable-extensions') # ブラウザ拡張機能を無効化
-    options.add_argument('--dns-prefetch-disable') # DNSプリフェッチを無効化
     options.add_argument('--disable-infobars') # 「Chromeは自動テストソフトウェアによって制御されています」のメッセージ非表示
     options.add_experimental_option('excludeSwitches', ['enable-automation']) # Automationフラグを削除
     options.add_experimental_option('useAutomationExtension', False) # AutomationExtensionを無効化
+    if profile_dir:
+        options.add_argument(f'--user-data-dir={os.path.abspath(profile_dir)}') # プロファイルを永続化
     # -----------------------------
     
-    service = ChromeService(ChromeDriverManager().install())
+    service = ChromeService(resolve_chromedriver(driver_path, offline))
+    resolved = time.perf_counter()
     driver = webdriver.Chrome(service=service, options=options)
+    launched = time.perf_counter()
+    print(f"WebDriver起動完了: {(launched - start) * 1000:.0f} ms "
+          f"(ドライバー解決 {(resolved - start) * 1000:.0f} ms / Chrome起動 {(launched - resolved) * 1000:.0f} ms)")
     
-    # ★★★ use_cookies 引数によって処理を分岐 ★★★ 今後の強化のために実装
+    # ★★★ use_cookies 引数によって処理を分岐 ★★★
     if use_cookies:
-        cookie_file = "cookies.pkl"
-        if os.path.exists(cookie_file):
-            # クッキーを設定するために、先にドメインを開く
-            driver.get("https://players.pokemon-card.com/") # クッキーを適用したいドメインを事前に開く
-            
-            cookies = pickle.load(open(cookie_file, "rb"))
-            for cookie in cookies:
-                # 'expiry' キーがfloatでない場合があるため、チェックして変換または削除
-                if 'expiry' in cookie and (cookie['expiry'] is None or not isinstance(cookie['expiry'], (int, float))):
-                    del cookie['expiry'] # 無効なexpiryを削除
-                driver.add_cookie(cookie)
-            print("🍪 保存されたクッキーを読み込みました。")
-            driver.refresh() # クッキー適用後にページをリフレッシュして反映させる
-            print("🍪 ページをリフレッシュしました。")
-        else:
-            print("⚠️ クッキーファイル 'cookies.pkl' が見つかりませんでした。")
+        # 保存されたクッキーを、ドメイン・有効期限を保ったまま一括で読み込む
+        if not load_cookies(driver, cookie_file):
+            print(f"⚠️ クッキーファイル '{cookie_file}' が見つかりませんでした。")
+
+    # 後から開くタブ (page_readiness.prestage_page) にも同じ設定を行うため、設定を driver に残しておく
+    driver.target_settings = {'fast_page_mode': fast_page_mode, 'blocked_url_patterns': blocked_url_patterns}
+    configure_target(driver)
+    return driver
+
+def configure_target(driver):
+    """
+    表示中のタブに、bot検知対策スクリプトと (FastPageMode なら) 通信の遮断を設定する。
+    DevTools Protocol の設定はタブごとのため、新しいタブを開いたら最初のページを開く前に呼ぶ。
+    """
+    settings = getattr(driver, 'target_settings', {})
+    if settings.get('fast_page_mode'):
+        apply_network_filter(driver, extra_patterns=settings.get('blocked_url_patterns', ()))
 
     # bot検知対策スクリプト（共通）
     driver.execute_cdp_cmd(
         'Page.addScriptToEvaluateOnNewDocument',
         {'source': '''Object.defineProperty(navigator, 'webdriver', {get: () => undefined});'''}
     )
-    return driver
\ No newline at end of file
+
+def launch_driver_async(**kwargs):
+    """
+    setup_driver をバックグラウンドで開始し、Future を返す。
+    設定ファイルの読み込みなど、他の起動処理と並行してChromeを立ち上げるために使う。
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='driver-launch')
+    future = executor.submit(setup_driver, **kwargs)
+    executor.shutdown(wait=False)
+    return future
+
+def discard_driver_launch(future):
+    """起動途中で処理を中断する場合に、先行起動したChromeを確実に終了させる"""
+    if future is None:
+        return
+    try:
+        future.result().quit()
+    except Exception:
+        pass
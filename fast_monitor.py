@@ -1,197 +1,472 @@
 # fast_monitor.py (最終確定版・ポップアップセレクタ修正)
 import time
 import requests  # 追加
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+from urllib.parse import urlsplit
+from sale_scheduler import wait_for_sale_time, record_send
+from armed_request import ArmedRequest
+from cart_race import CartAddGate
+from cart_retry import classify_cart_response, RetrySchedule, SUCCESS, PERMANENT, TRANSPORT
+from stock_watcher import StockWatcher
+from rakuten_monitor import evaluate_product
+from tracer import tracer
+from page_readiness import open_page, prestage_page, reload_page
+from selector_registry import registry
+from screenshot_service import screenshots
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, WebDriverException
+from session_store import copy_cookies_to_session, copy_cookies_to_driver, diff_cookie_jars
 
-def click_add_to_cart_once(driver, selectors):
+def click_add_to_cart_once(driver):
     """
     「かごに追加」ボタンを一度だけクリック試行する。
+    候補のセレクタ (selector_registry の product.add_to_cart) は1回の検索でまとめて調べる。
     """
-    for by, selector in selectors:
-        try:
-            button = driver.find_element(by, selector)
-            driver.execute_script("arguments[0].click();", button)
-            print(f"-> 「かごに追加」ボタンのクリック命令を送信 ({selector})")
-            return True
-        except (NoSuchElementException, StaleElementReferenceException):
-            continue
-    return False
+    button = registry.find(driver, 'product', 'add_to_cart')
+    if button is None:
+        return False
+    try:
+        record_send('ui')
+        driver.execute_script("arguments[0].click();", button)
+        print("-> 「かごに追加」ボタンのクリック命令を送信")
+        return True
+    except (NoSuchElementException, StaleElementReferenceException):
+        return False
 
-def wait_for_sale_and_click_proceed_only(driver, config, sale_time):
+def click_and_confirm_add_to_cart(driver, config, timeout=30):
     """
-    (最終版) 販売時刻に「かごに追加」を1回クリックし、
-    ポップアップ表示を待ってから成功と判断する。
-    その後は後続の purchase_from_cart に任せるため、買い物かごURLへ遷移する。
+    「かごに追加」をクリックし、「商品をかごに追加しました」ポップアップの表示で成功を確認する。
+    クリックは一度だけ行い、最大 timeout 秒まで確認を続ける。
     """
-    # --- 設定値の読み込み ---
     polling_interval = config.get('polling_interval_ms', 50) / 1000.0
-    wait_timeout = config.get('wait_timeout', 10)
-
-    # --- 時刻設定 ---
-    if isinstance(sale_time, str):
-        sale_time = datetime.strptime(sale_time, "%H:%M:%S").time()
-    sale_datetime = datetime.combine(datetime.today(), sale_time)
-
-    # --- 販売開始時刻まで待機 ---
-    print(f"販売開始時刻: {sale_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
-    print("販売開始時刻まで待機します...")
-    while datetime.now() < sale_datetime:
-        time.sleep(0.01)
-
-    print(f"販売時刻 {datetime.now().strftime('%H:%M:%S.%f')} - 購入処理を開始！")
-
-    # STEP 1: 「かごに追加」ボタンのセレクタを定義
-    add_to_cart_selectors = [
-        (By.XPATH, "//span[contains(text(), 'かごに追加')]/ancestor::button"),
-        (By.XPATH, "//button[contains(., 'かごに追加')]"),
-    ]
-
-    # STEP 2: 改行コードに強いポップアップのセレクタに修正
-    success_popup_selector = (By.XPATH, "//*[contains(., '商品をかごに') and contains(., '追加しました')]")
-
-    # STEP 3: タイムアウトループ処理
-    timeout_limit = time.time() + 30
+    timeout_limit = time.time() + timeout
     clicked = False
 
+    # 「かごに追加」ボタンとポップアップのセレクタは selector_registry で管理
     while time.time() < timeout_limit:
         if not clicked:
-            if click_add_to_cart_once(driver, add_to_cart_selectors):
+            if click_add_to_cart_once(driver):
                 clicked = True
                 print("-> 「かごに追加」クリック成功。ポップアップの表示を待ちます...")
 
         if clicked:
-            try:
-                short_wait = WebDriverWait(driver, 0.5)
-                short_wait.until(EC.visibility_of_element_located(success_popup_selector))
-
+            if registry.find(driver, 'product', 'cart_added_popup', timeout=0.5) is not None:
                 print(f"\n成功！「商品をかごに追加しました」ポップアップを確認。時刻: {datetime.now().strftime('%H:%M:%S.%f')}")
-                print("-> 買い物かごページへ遷移します...")
-
-                driver.get(config['cart_url'])
                 return True
 
-            except TimeoutException:
-                time.sleep(polling_interval)
-                continue
+            time.sleep(polling_interval)
 
     print("\nタイムアウトしました。「かごに追加」の成功を確認できませんでした。")
     error_path = config.get('ss_error_path', 'error_capture.png')
-    driver.save_screenshot(error_path)
-    print(f"タイムアウト時のスクリーンショットを '{error_path}' として保存しました。")
+    screenshots.capture(driver, error_path)
+    print(f"タイムアウト時のスクリーンショットを '{error_path}' として保存します。")
     return False
 
-def wait_for_sale_and_api_add_to_cart(driver, config, sale_time, api_info):
+# クリック後 (performance.now() が arguments[0] 以降) に、URLのパスに arguments[1] を含む
+# リクエストの応答が返ったか。Resource Timing の項目は応答の受信完了時に追加される。
+_REQUEST_DONE_JS = """
+var since = arguments[0], path = arguments[1];
+return performance.getEntriesByType('resource').some(function (e) {
+    return e.startTime >= since && e.name.indexOf(path) !== -1;
+});
+"""
+
+def _confirm_ui_add(driver, since, cart_add_path, deadline):
     """
-    (API版・リトライ機能付き) 指定時刻まで待機し、APIリクエストでカートに追加する。
-    失敗時は指定回数リトライを行う。
+    UIクリックによるカート追加の結果を判定する。
+    応答が返ったのにポップアップが表示されない場合も、ポップアップのセレクタが実際のページに
+    合っていないだけで追加されている可能性があるため、「追加されなかった」とは判断しない。
+    :return: True (ポップアップ表示 = 追加された)
+             / None (応答後もポップアップなし、または deadline までに確認できない = 結果不明)
+    """
+    response_seen_at = None
+    while time.time() < deadline:
+        if registry.find(driver, 'product', 'cart_added_popup') is not None:
+            return True
+        if response_seen_at is None:
+            try:
+                if driver.execute_script(_REQUEST_DONE_JS, since, cart_add_path):
+                    response_seen_at = time.time()
+            except WebDriverException:
+                pass
+        elif time.time() - response_seen_at > 0.3:
+            # 応答の受信後、ポップアップを描画する猶予を過ぎても表示されない (deadline まで待たずに打ち切る)
+            return None
+        time.sleep(0.02)
+    return None
+
+def _race_ui_add(driver, config, gate, cart_add_url, timeout=30):
+    """
+    (race 用) 「かごに追加」のクリックから結果の確認までを gate.turn() の中で行う。
+    ボタンをクリックできなかった場合は gate を離して再度試み、クリック後に追加を確認できない場合
+    (応答後もポップアップなし、または RaceUiConfirmSeconds 秒以内に確認できない) は、gate.abort() で
+    API 側の送信も止める (成否は呼び出し元が買い物かごの中身で判断する)。
     """
-    # --- 設定 ---
-    MAX_RETRIES = 10       # 最大リトライ回数
-    RETRY_INTERVAL = 0.1   # リトライ間隔(秒)
+    polling_interval = config.get('polling_interval_ms', 50) / 1000.0
+    confirm_seconds = config.get('race_ui_confirm_seconds', 3.0)
+    cart_add_path = urlsplit(cart_add_url).path
+    timeout_limit = time.time() + timeout
 
-    # --- 時刻設定 ---
-    if isinstance(sale_time, str):
-        sale_time = datetime.strptime(sale_time, "%H:%M:%S").time()
-    sale_datetime = datetime.combine(datetime.today(), sale_time)
+    while time.time() < timeout_limit:
+        with gate.turn() as allowed:
+            if not allowed:
+                return False
+            try:
+                since = driver.execute_script("return performance.now();")
+            except WebDriverException:
+                since = None
+            if since is not None and click_add_to_cart_once(driver):
+                result = _confirm_ui_add(driver, since, cart_add_path, time.time() + confirm_seconds)
+                if result:
+                    print(f"\n成功！「商品をかごに追加しました」ポップアップを確認。時刻: {datetime.now().strftime('%H:%M:%S.%f')}")
+                    gate.win('ui')
+                    return True
+                print("⚠️ UIクリックでのカート追加の結果を確認できないため、API送信も止めます。")
+                gate.abort()
+                return False
+        # もう一方の経路が送信できるよう、gate を離している間に待つ
+        time.sleep(polling_interval)
+    return False
 
-    # --- Session構築 ---
-    selenium_cookies = driver.get_cookies()
+def wait_for_sale_and_click_proceed_only(driver, config, sale_time, clock_offset=0.0, watcher=None):
+    """
+    (最終版) 販売時刻に「かごに追加」を1回クリックし、
+    ポップアップ表示を待ってから成功と判断する。
+    その後は後続の purchase_from_cart に任せるため、買い物かごURLへ遷移する。
+    watcher (ConfigWatcher) を渡すと、待機中の設定ファイルの変更を反映する。
+    """
+    wait_timeout = config.get('wait_timeout', 10)
+
+    # --- 販売開始時刻まで待機 (モノトニッククロック) ---
+    print("販売開始時刻まで待機します...")
+    with tracer.span('t0_wait', path='ui'):
+        wait_for_sale_time(config, sale_time, label="UIクリック", clock_offset=clock_offset, watcher=watcher)
+
+    print(f"販売時刻 {datetime.now().strftime('%H:%M:%S.%f')} - 購入処理を開始！")
+    if not click_and_confirm_add_to_cart(driver, config):
+        return False
+
+    print("-> 買い物かごページへ遷移します...")
+    open_page(driver, config['cart_url'], 'cart', wait_timeout)
+    return True
+
+def build_api_session(driver, config):
+    """
+    Seleniumのログイン状態(Cookie・User-Agent)を引き継いだ requests.Session と、
+    カート追加APIに送るヘッダーを作成する。
+    Cookieは全ドメイン分を、パス・secure・有効期限などの属性ごと引き継ぐ。
+    """
     session = requests.Session()
-    for cookie in selenium_cookies:
-        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'))
-    
+    copy_cookies_to_session(driver, session, config)
+
     user_agent = driver.execute_script("return navigator.userAgent;")
+    product_url = urlsplit(config['target_product_url'])
     headers = {
         "User-Agent": user_agent,
         "Referer": config['target_product_url'],
-        "Origin": "https://item.rakuten.co.jp",
+        "Origin": f"{product_url.scheme}://{product_url.netloc}",
         "Content-Type": "application/x-www-form-urlencoded"
     }
+    return session, headers
 
-    # --- 待機ループ ---
-    print(f"販売開始時刻: {sale_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+def sync_session_cookies_to_driver(driver, session, verify=False):
+    """
+    requests.Session 側で更新されたCookieを、1回のCDP呼び出しで属性ごとSeleniumに書き戻す。
+    verify (CookieSyncVerify) が有効な場合だけ、書き戻した後にブラウザ側のCookieと突き合わせ、
+    反映されなかったものがあれば表示する (CDP呼び出しが1回増えるため、通常は行わない)。
+    """
+    if copy_cookies_to_driver(driver, session) is None:
+        return False
+    if not verify:
+        return True
+    missing = diff_cookie_jars(driver, session)
+    if missing:
+        names = ', '.join(f"{name}@{domain}{path}" for name, domain, path in missing)
+        print(f"⚠️ ブラウザに反映されなかったCookieがあります ({len(missing)}件): {names}")
+        return False
+    return True
+
+def _prepare_api_add(driver, config, api_info, session, headers, open_cart):
+    """販売開始前の準備 (カート追加APIの接続・リクエストの事前構築と、買い物かごタブの事前表示)"""
+    # --- 事前準備 (DNS解決・接続確立・リクエスト構築) ---
+    armed = None
+    if config.get('armed_request_enabled', True):
+        armed = ArmedRequest(
+            session, api_info['url'], api_info['data'], headers,
+            keepalive_interval=config.get('armed_keepalive_seconds', 10),
+        )
+        with tracer.span('arm_request'):
+            armed.arm()
+
+    # --- 買い物かごを別タブで事前に開いておく (成功後は再読み込みだけで済ませる) ---
+    cart_tab = None
+    if open_cart and config.get('cart_prestage_enabled', True):
+        with tracer.span('prestage_cart'):
+            cart_tab = prestage_page(driver, config['cart_url'], 'cart_staged', config.get('wait_timeout', 10))
+        if cart_tab:
+            print("-> 買い物かごを別タブで開いておきました。")
+    return armed, cart_tab
+
+def wait_for_sale_and_api_add_to_cart(driver, config, sale_time, api_info, clock_offset=0.0,
+                                      session=None, headers=None, open_cart=True, watcher=None):
+    """
+    (API版・リトライ機能付き) 指定時刻まで待機し、APIリクエストでカートに追加する。
+    失敗時は応答の種類に応じて再送する (api_add_to_cart を参照)。
+    clock_offset には clock_sync で推定したサーバー時計のずれ(秒)を渡す。
+    session/headers を渡した場合はそれを使う (HTTPでの購入手続きに同じSessionを引き継ぐため)。
+    open_cart が False の場合、成功後にブラウザで買い物かごを開かない。
+    watcher (ConfigWatcher) を渡すと、待機中の設定ファイルの変更 (販売開始時刻・上限価格など) を反映する。
+    """
+    # --- Session構築 ---
+    if session is None:
+        session, headers = build_api_session(driver, config)
+
+    armed, cart_tab = _prepare_api_add(driver, config, api_info, session, headers, open_cart)
+
+    # --- 待機 (モノトニッククロック) ---
     print("販売開始時刻までAPI待機モードに入ります (Request準備完了)...")
-    
-    while datetime.now() < sale_datetime:
-        time.sleep(0.01)
+    with tracer.span('t0_wait', path='api'):
+        wait_for_sale_time(
+            config, sale_time, label="APIカート追加", clock_offset=clock_offset,
+            on_approach=armed.finalize if armed else None, watcher=watcher,
+        )
+
+    # 待機中に上限価格が変更された場合に備え、送信直前にもう一度確認する
+    if api_info.get('price') is not None and api_info['price'] > config['max_price']:
+        print(f"❌ 価格 {api_info['price']}円 が上限 {config['max_price']}円 を超えたため、カート追加を中止します。")
+        return False
 
     print(f"販売時刻 {datetime.now().strftime('%H:%M:%S.%f')} - APIリクエスト送信開始！")
+    return api_add_to_cart(driver, config, api_info, session, headers, armed, open_cart, cart_tab) == SUCCESS
+
+def wait_for_sale_and_race_add_to_cart(driver, config, sale_time, api_info, clock_offset=0.0,
+                                       session=None, headers=None, open_cart=True, watcher=None):
+    """
+    (CartAddMode = race) APIとUIクリックの両方を同じ販売開始時刻に向けて準備し、同時に実行する。
+    先に成功を確認した経路を採用し、もう一方はその時点で打ち切る。
+    CartAddGate により送信中のカート追加は常に1つだけになる。UIクリックの結果を確認できない場合は
+    APIの送信を止め、買い物かごの中身で成否を判断するため、二重にかごへ追加されることはない。
+    UIクリック用に、ブラウザには商品ページを表示しておくこと。
+    """
+    if session is None:
+        session, headers = build_api_session(driver, config)
+
+    armed, cart_tab = _prepare_api_add(driver, config, api_info, session, headers, open_cart)
+
+    print("販売開始時刻まで待機します (API・UIクリックの同時実行)...")
+    with tracer.span('t0_wait', path='race'):
+        wait_for_sale_time(
+            config, sale_time, label="カート追加 (API/UI)", clock_offset=clock_offset,
+            on_approach=armed.finalize if armed else None, watcher=watcher,
+        )
+
+    if api_info.get('price') is not None and api_info['price'] > config['max_price']:
+        print(f"❌ 価格 {api_info['price']}円 が上限 {config['max_price']}円 を超えたため、カート追加を中止します。")
+        return False
+
+    print(f"販売時刻 {datetime.now().strftime('%H:%M:%S.%f')} - API・UIクリックを同時に開始！")
+    gate = CartAddGate()
+    timings = {}
+
+    def run(path, attempt):
+        started = time.perf_counter()
+        with tracer.span(f'race_{path}') as span_args:
+            try:
+                success = attempt()
+            except Exception as e:
+                print(f"  ⚠️ [{path}] カート追加中にエラーが発生しました: {e}")
+                success = False
+            span_args['success'] = success
+        timings[path] = (time.perf_counter() - started) * 1000
+
+    # ブラウザを操作するのはUIクリック側だけ (API側は requests のみ) なので、同じ driver を共有できる
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='race') as executor:
+        executor.submit(run, 'api',
+                        lambda: post_cart_add(config, api_info, session, headers, armed, gate) == SUCCESS)
+        executor.submit(run, 'ui', lambda: _race_ui_add(driver, config, gate, api_info['url']))
+
+    results = ' / '.join(
+        f"{path}: {'成功' if path == gate.winner else '失敗・打ち切り'} {timings.get(path, 0):.0f} ms"
+        for path in ('api', 'ui')
+    )
+    print(f"🏁 カート追加の結果 (勝者: {gate.winner or ('不明' if gate.aborted else 'なし')}) {results}")
+    tracer.instant('race_result', winner=gate.winner, aborted=gate.aborted,
+                   **{f'{path}_ms': ms for path, ms in timings.items()})
+
+    if gate.aborted:
+        # UIクリックの結果が不明なまま。再送はせず、買い物かごに商品が入っているかで判断する
+        open_cart_page(driver, config, cart_tab)
+        if registry.find(driver, 'cart', 'purchase_button', timeout=config.get('wait_timeout', 10)) is None:
+            print("-> 買い物かごに商品がないため、カート追加は失敗と判断します。")
+            return False
+        print("-> 買い物かごに商品があるため、UIクリックでの追加に成功したと判断します。")
+        copy_cookies_to_session(driver, session, config)
+        return True
+    if gate.winner is None:
+        return False
 
-    # --- API実行 (リトライループ) ---
-    for attempt in range(1, MAX_RETRIES + 1):
+    if gate.winner == 'api':
+        if open_cart:
+            sync_session_cookies_to_driver(driver, session, config.get('cookie_sync_verify', False))
+    else:
+        # ブラウザでかごに追加した状態を、HTTPでの購入手続き用の Session にも反映する
+        copy_cookies_to_session(driver, session, config)
+    if open_cart:
+        open_cart_page(driver, config, cart_tab)
+    return True
+
+def api_add_to_cart(driver, config, api_info, session, headers, armed=None, open_cart=True, cart_tab=None):
+    """
+    待機せずに、ただちにカート追加APIを送信する。
+    応答を「成功 / 再送可能 / 再送不可 / 通信エラー」に分類し、再送可能・通信エラーの場合は
+    CartRetry* の設定に従って間隔を延ばしながら、時間の上限 (CartRetryBudgetSeconds) まで再送する。
+    販売開始時刻の待機後や、在庫監視で再入荷を検知した直後に呼び出す。
+    cart_tab (事前に買い物かごを開いておいたタブ) を渡すと、成功後はそのタブを再読み込みする。
+    :return: 最後の応答の分類 (成功は cart_retry.SUCCESS。再送しても無駄な PERMANENT と区別するため)
+    """
+    kind = post_cart_add(config, api_info, session, headers, armed)
+    if kind != SUCCESS:
+        return kind
+    if open_cart:
+        # Cookie同期
+        sync_session_cookies_to_driver(driver, session, config.get('cookie_sync_verify', False))
+        open_cart_page(driver, config, cart_tab)
+    return kind
+
+def open_cart_page(driver, config, cart_tab=None):
+    """カート追加の成功後に買い物かごを開く (事前に開いておいたタブがあれば、それを再読み込みする)"""
+    with tracer.span('open_cart', prestaged=bool(cart_tab)):
+        if cart_tab:
+            print("-> 事前に開いておいた買い物かごを再読み込みします...")
+            reload_page(driver, cart_tab, 'cart', config.get('wait_timeout', 10))
+        else:
+            print("-> 買い物かごページへ遷移します...")
+            open_page(driver, config['cart_url'], 'cart', config.get('wait_timeout', 10))
+
+def post_cart_add(config, api_info, session, headers, armed=None, gate=None):
+    """
+    カート追加APIを送信し、応答の種類に応じて再送する (ブラウザは操作しない)。
+    gate (CartAddGate) を渡すと、1回ごとの送信を gate.turn() の中で行い、
+    もう一方の経路が先に成功した時点で送信をやめる。
+    :return: 最後の応答の分類 (cart_retry の SUCCESS / RETRYABLE / PERMANENT / TRANSPORT)。
+             もう一方の経路が先に決着して送信をやめた場合は None
+    """
+    schedule = RetrySchedule(
+        budget_seconds=config.get('cart_retry_budget_seconds', 5.0),
+        initial_ms=config.get('cart_retry_initial_ms', 50),
+        max_ms=config.get('cart_retry_max_ms', 500),
+        jitter=config.get('cart_retry_jitter', 0.2),
+    )
+    codes = (config.get('cart_success_codes', ('0',)),
+             config.get('cart_retryable_codes', ()),
+             config.get('cart_permanent_codes', ()))
+
+    # --- API実行 (応答の種類に応じて再送する) ---
+    attempt = 0
+    while True:
+        attempt += 1
+        with gate.turn() if gate else nullcontext(True) as allowed:
+            if not allowed:
+                print("-> もう一方の経路でカート追加が成功した (または結果が不明な) ため、API送信をやめます。")
+                return None
+            kind, detail, latency_ms = _send_cart_add_once(config, api_info, session, headers, armed, attempt, codes)
+            if kind == SUCCESS and gate:
+                gate.win('api')
+
+        delay = None if kind in (SUCCESS, PERMANENT) else schedule.next_delay()
+        next_step = f" → {delay * 1000:.0f} ms 後に再送" if delay is not None else ""
+        print(f"  [{attempt}] {kind} {latency_ms:6.1f} ms ({schedule.elapsed():.2f} 秒経過) {detail}{next_step}")
+
+        if kind == SUCCESS:
+            print(f"-> [成功] APIリクエスト成功！(試行回数: {attempt})")
+            return kind
+        if kind == PERMANENT:
+            print(f"-> 再送しても成功しない応答のため、カート追加を終了します ({detail})")
+            return kind
+        if delay is None:
+            print(f"-> 諦めます。{schedule.budget_seconds:.1f} 秒以内 ({attempt} 回) の送信すべてに失敗しました。")
+            return kind
+
+        if armed:
+            armed.prepare()  # レスポンスで更新されたCookieを反映
+        if gate:
+            if gate.decided.wait(delay):
+                print("-> もう一方の経路でカート追加が成功した (または結果が不明な) ため、API送信をやめます。")
+                return None
+        else:
+            time.sleep(delay)
+
+def _send_cart_add_once(config, api_info, session, headers, armed, attempt, codes):
+    """
+    カート追加APIを1回送信する。
+    :param codes: (成功, 再送, 諦める) の resultCode の組
+    :return: (応答の分類, 詳細, 所要ミリ秒)
+    """
+    sent = time.perf_counter()
+    with tracer.span('cartAdd', attempt=attempt) as span_args:
         try:
-            print(f"[{attempt}/{MAX_RETRIES}] API送信試行中...")
-            
-            response = session.post(
-                api_info['url'],
-                data=api_info['data'],
-                headers=headers,
-                timeout=5  # タイムアウトは短めに設定して次へ行く
-            )
-            
-            # --- レスポンス解析 ---
-            is_success = False
-            
-            if response.status_code == 200:
-                try:
-                    res_json = response.json()
-                    result_code = res_json.get("resultCode", "")
-                    
-                    # 楽天APIのエラー判定
-                    if result_code and result_code.startswith("R"):
-                        err_msg = res_json.get("resultMessage", "").replace("<br>", " ")
-                        print(f"  ❌ APIエラー: {err_msg} (Code: {result_code})")
-                        
-                        # 「売り切れ」の場合はリトライしても無駄なことが多いが、
-                        # 復活を期待してリトライするか、ここで終了するかは戦略次第。
-                        # 今回は「失敗したら再実行」の要望通りリトライを継続します。
-                        is_success = False
-                    else:
-                        is_success = True
-                except:
-                    # JSONパース失敗時はHTMLが返っている可能性がある
-                    if "error" not in response.url:
-                        is_success = True
+            record_send('api')
+            if armed:
+                response = armed.fire()
             else:
-                print(f"  ❌ HTTPエラー: ステータス {response.status_code}")
-                is_success = False
-
-            # --- 成功時の処理 ---
-            if is_success:
-                print(f"-> [成功] APIリクエスト成功！(試行回数: {attempt})")
-                
-                # Cookie同期
-                try:
-                    for cookie in session.cookies:
-                        try:
-                            driver.add_cookie({
-                                'name': cookie.name,
-                                'value': cookie.value,
-                                'path': '/',
-                            })
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
-
-                print("-> 買い物かごページへ遷移します...")
-                driver.get(config['cart_url'])
-                return True
-            
-            # --- 失敗時 (ループ継続) ---
-            # 最後の試行でなければ待機して次へ
-            if attempt < MAX_RETRIES:
-                time.sleep(RETRY_INTERVAL)
-
-        except Exception as e:
-            print(f"  ❌ 通信エラー発生: {e}")
-            if attempt < MAX_RETRIES:
-                time.sleep(RETRY_INTERVAL)
-
-    # 全リトライ失敗
-    print(f"-> 諦めます。{MAX_RETRIES}回のリトライすべてに失敗しました。")
-    return False
\ No newline at end of file
+                response = session.post(
+                    api_info['url'],
+                    data=api_info['data'],
+                    headers=headers,
+                    timeout=5  # タイムアウトは短めに設定して次へ行く
+                )
+            kind, detail = classify_cart_response(response, *codes)
+            span_args['status'] = response.status_code
+        except requests.exceptions.RequestException as e:
+            kind, detail = TRANSPORT, f"通信エラー: {e.__class__.__name__}"
+        span_args['result'] = kind
+    return kind, detail, (time.perf_counter() - sent) * 1000
+
+def watch_restock_and_api_add_to_cart(driver, config, api_info, session, headers, open_cart=True):
+    """
+    (PersistentMode) 商品ページの在庫をHTTPで監視し、再入荷を検知したらただちにAPIでカートに追加する。
+    選択中のSKUが売り切れのまま別のSKUが再入荷した場合は、再入荷したSKUでカート追加する。
+    再入荷したSKUの価格が上限 (MaxPrice) を超えている場合は見送り、監視を続ける。
+    再送しても成功しない応答 (購入数の上限・売り切れなど) の場合は、そのSKUを売り切れのまま扱い、
+    監視の間隔を空けて、ページの内容が次に変わるまで再送しない。
+    """
+    watcher = StockWatcher(
+        session, config['target_product_url'], {'User-Agent': headers.get('User-Agent', '')},
+        base_interval=config['interval'], max_interval=config.get('restock_max_interval_seconds', 10),
+    )
+    target_variant_id = api_info['data'].get('variant_id')
+
+    def on_restock(variant_ids):
+        # 再入荷した時点の価格で判定する (監視中に値上げされていることがある)
+        product = evaluate_product(watcher.data, config['max_price']) or {'skus': []}
+        skus = {sku['variant_id']: sku for sku in product['skus']}
+        affordable = [
+            variant_id for variant_id in variant_ids
+            if variant_id not in skus or skus[variant_id]['price'] is None
+            or skus[variant_id]['price'] <= config['max_price']
+        ]
+        over_price = [variant_id for variant_id in variant_ids if variant_id not in affordable]
+        for variant_id in over_price:
+            print(f"-> 再入荷したSKU({variant_id})は価格 {skus[variant_id]['price']}円 が"
+                  f"上限 {config['max_price']}円 を超えているため見送ります。")
+        # 見送ったSKUは売り切れのまま扱い、値下げなどで内容が変わった時に改めて判定する
+        watcher.forget(over_price)
+        if not affordable:
+            return None
+
+        data = dict(api_info['data'])
+        if target_variant_id and target_variant_id not in affordable:
+            print(f"-> 選択中のSKU({target_variant_id})ではなく、再入荷したSKU({affordable[0]})でカート追加します。")
+            data['variant_id'] = affordable[0]
+        with tracer.span('restock_cartAdd'):
+            kind = api_add_to_cart(driver, config, dict(api_info, data=data), session, headers, open_cart=open_cart)
+        if kind == SUCCESS:
+            return True
+        if kind == PERMANENT:
+            watcher.forget(variant_ids)
+            watcher.backoff()
+            return None
+        return False
+
+    return watcher.watch(on_restock)
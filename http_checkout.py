@@ -0,0 +1,171 @@
+# http_checkout.py
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from tracer import tracer
+from sudo_session import sudo_session
+
+# 各画面で押すボタンの文言 (aria-label / テキスト / value のいずれかに含まれるもの)
+CART_BUTTON_KEYWORDS = ['購入手続き']
+NEXT_BUTTON_KEYWORDS = ['次へ']
+COMMIT_BUTTON_KEYWORDS = ['注文を確定する']
+# 注文完了画面に表示される文言 (いずれかが含まれていれば注文が確定したとみなす)
+COMPLETE_PAGE_KEYWORDS = ['ご注文ありがとうございました', '注文番号']
+
+# 買い物かご → 届け先 → 最終確認 → 確定 の間に許容する画面数
+MAX_STEPS = 6
+
+class CheckoutFallback(Exception):
+    """想定外の画面に到達したため、Selenium での購入処理に引き継ぐことを示す"""
+
+class CommitOutcomeUnknown(Exception):
+    """
+    「注文を確定する」を送信した後に、注文が確定したかを判断できなかったことを示す。
+    注文が確定している可能性があるため、購入手続きをやり直してはいけない (二重注文になる)。
+    """
+
+class _FormParser(HTMLParser):
+    """
+    HTMLからフォームだけを抜き出す最小限のパーサー。
+    DOMは構築せず、action・hidden値・送信ボタンのみを集める。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.has_password = False
+        self._form = None
+        self._button = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form':
+            self._form = {
+                'action': attrs.get('action', ''),
+                'method': (attrs.get('method') or 'get').lower(),
+                'fields': {},
+                'buttons': [],
+            }
+            self.forms.append(self._form)
+        elif tag == 'input':
+            input_type = (attrs.get('type') or 'text').lower()
+            if input_type == 'password':
+                self.has_password = True
+            if self._form is None:
+                return
+            if input_type in ('submit', 'image'):
+                self._form['buttons'].append({
+                    'label': ' '.join(filter(None, [attrs.get('aria-label'), attrs.get('value')])),
+                    'name': attrs.get('name'), 'value': attrs.get('value', ''),
+                })
+            elif input_type in ('checkbox', 'radio'):
+                if attrs.get('name') and 'checked' in attrs:
+                    self._form['fields'][attrs['name']] = attrs.get('value', 'on')
+            elif attrs.get('name'):
+                self._form['fields'][attrs['name']] = attrs.get('value', '')
+        elif tag == 'button' and self._form is not None:
+            if (attrs.get('type') or 'submit').lower() == 'submit':
+                self._button = {
+                    'label': attrs.get('aria-label') or '',
+                    'name': attrs.get('name'), 'value': attrs.get('value', ''),
+                }
+                self._form['buttons'].append(self._button)
+
+    def handle_data(self, data):
+        if self._button is not None:
+            self._button['label'] += data.strip()
+
+    def handle_endtag(self, tag):
+        if tag == 'button':
+            self._button = None
+        elif tag == 'form':
+            self._form = None
+
+def _parse_page(html):
+    parser = _FormParser()
+    parser.feed(html)
+    return parser
+
+def _find_form(forms, keywords):
+    """指定の文言を含む送信ボタンを持つフォームと、そのボタンを返す"""
+    for form in forms:
+        for button in form['buttons']:
+            if any(k in button['label'] for k in keywords):
+                return form, button
+    return None, None
+
+def _submit(session, response, form, button, headers):
+    """フォームを送信する。押したボタンの name/value も送信内容に含める"""
+    url = urljoin(response.url, form['action'] or response.url)
+    data = dict(form['fields'])
+    if button.get('name'):
+        data[button['name']] = button.get('value', '')
+    request_headers = dict(headers, Referer=response.url)
+    request_headers.pop('Content-Type', None)  # requests にエンコードさせる
+    if form['method'] == 'post':
+        return session.post(url, data=data, headers=request_headers, timeout=10)
+    return session.get(url, params=data, headers=request_headers, timeout=10)
+
+def http_checkout(session, config, headers):
+    """
+    cartAdd に成功した requests.Session のまま、ブラウザを使わずに
+    買い物かご → 購入手続き → (届け先) → 最終確認 → 注文確定 を進める。
+    必要なフォームの値だけを各応答から抜き出して送信する。
+
+    想定外の画面 (ログイン要求・エラーなど) に到達した場合は CheckoutFallback を送出する。
+    ただし「注文を確定する」の送信後は、想定外の応答・通信エラーでも CommitOutcomeUnknown を送出する。
+    :return: (成功したか, メッセージ)
+    """
+    print("\n[HTTP-CHECKOUT] ブラウザを使わずに購入手続きを進めます...")
+    try:
+        with tracer.span('http_cart'):
+            response = session.get(config['cart_url'], headers={'User-Agent': headers.get('User-Agent', '')}, timeout=10)
+            page = _parse_page(response.text)
+            form, button = _find_form(page.forms, CART_BUTTON_KEYWORDS)
+            if not form:
+                raise CheckoutFallback("買い物かごに「購入手続き」フォームがありません。")
+            print("-> 「購入手続き」を送信します。")
+            response = _submit(session, response, form, button, headers)
+
+        for step in range(1, MAX_STEPS + 1):
+            if response.status_code >= 400 or 'error' in response.url:
+                raise CheckoutFallback(f"エラー画面に到達しました (HTTP {response.status_code}, {response.url})")
+
+            page = _parse_page(response.text)
+            form, button = _find_form(page.forms, COMMIT_BUTTON_KEYWORDS)
+            if form:
+                tracer.instant('http_confirm_page', url=response.url)
+                # ダミーモードでは注文確定を送信しない
+                if not config.get('auto_purchase', False):
+                    print("【ダミーモード】最終確認画面に到達しました。注文は確定しません。")
+                    return True, "【ダミーモード】最終確認ページ到達成功 (HTTP)"
+
+                print("-> 「注文を確定する」を送信します。")
+                # ここから先は注文が確定している可能性があるため、ブラウザでのやり直しには引き継がない
+                with tracer.span('http_commit'):
+                    try:
+                        response = _submit(session, response, form, button, headers)
+                    except requests.exceptions.RequestException as e:
+                        raise CommitOutcomeUnknown(f"注文確定の送信後に通信エラーが発生しました: {e}") from e
+                # HTTP 200 のエラー画面・売り切れ画面もあるため、注文完了画面の文言を確認できた場合だけ成功とする
+                if (response.status_code >= 400 or 'error' in response.url
+                        or not any(k in response.text for k in COMPLETE_PAGE_KEYWORDS)):
+                    raise CommitOutcomeUnknown(f"注文完了画面を確認できません (HTTP {response.status_code}, {response.url})")
+                tracer.instant('http_complete_page', url=response.url)
+                return True, "自動購入処理が完了しました！ (HTTP)"
+
+            if page.has_password:
+                sudo_session.record_login_prompt('http', response.url)
+                raise CheckoutFallback("ログイン画面が表示されました。")
+
+            form, button = _find_form(page.forms, NEXT_BUTTON_KEYWORDS)
+            if not form:
+                raise CheckoutFallback(f"次の操作が見つかりません ({response.url})")
+            print(f"-> 「次へ」を送信します。(画面 {step})")
+            with tracer.span('http_next', step=step):
+                response = _submit(session, response, form, button, headers)
+
+        raise CheckoutFallback("最終確認画面に到達できませんでした。")
+
+    except requests.exceptions.RequestException as e:
+        raise CheckoutFallback(f"通信エラー: {e}")
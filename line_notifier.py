@@ -1,18 +1,19 @@
 # line_notifier.py
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    TextMessage,
-    PushMessageRequest
-)
-
 def send_line_message(token, group_id, message):
     """指定された単一のグループIDにプッシュメッセージを送信する"""
     if not token or not group_id:
         print("LINE通知スキップ: トークンまたはグループIDがありません。")
         return
 
+    # LINE の SDK は読み込みが重いため、実際に送信する時に読み込む
+    from linebot.v3.messaging import (
+        Configuration,
+        ApiClient,
+        MessagingApi,
+        TextMessage,
+        PushMessageRequest
+    )
+
     configuration = Configuration(access_token=token)
     with ApiClient(configuration) as api_client:
         messaging_api = MessagingApi(api_client)
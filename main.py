@@ -1,53 +1,214 @@
 # main.py (購入手続きボタン専用・最終版)
 import sys
 import time
+import argparse
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
+from startup_profile import profiler
+
+# --profile-startup 指定時は、以降のモジュール読み込み時間を計測する
+if '--profile-startup' in sys.argv:
+    profiler.install()
 
 # --- モジュールインポート ---
-from config_loader import load_config
-from driver_setup import setup_driver
-from notifier import send_notification
+from config_loader import load_config, load_browser_settings
+from config_watcher import ConfigWatcher
+from driver_setup import setup_driver, launch_driver_async, discard_driver_launch
+from notifier import send_notification, flush_notifications
 from rakuten_login import user_login, ensure_sudo_mode
-from fast_monitor import wait_for_sale_and_api_add_to_cart 
-from rakuten_purchase import purchase_from_cart
-from rakuten_monitor import extract_cart_form_data
+from fast_monitor import (wait_for_sale_and_api_add_to_cart, wait_for_sale_and_click_proceed_only,
+                          wait_for_sale_and_race_add_to_cart, watch_restock_and_api_add_to_cart,
+                          api_add_to_cart, build_api_session, sync_session_cookies_to_driver)
+from watchlist import monitor_watchlist
+from http_checkout import http_checkout, CheckoutFallback, CommitOutcomeUnknown
+from cart_retry import SUCCESS
+from sale_scheduler import resolve_sale_datetime, wait_until, report_firing_records
+from clock_sync import sync_server_clock
+from tracer import tracer
+from selector_registry import registry
+from screenshot_service import screenshots
+from sudo_session import sudo_session
+from page_readiness import open_page
+from session_store import restore_session, save_session, copy_cookies_to_session
 from rakuten_purchase import purchase_from_cart
+from rakuten_monitor import extract_cart_form_data, fetch_cart_form_data
+
+def checkout_and_notify(driver, config, session, headers, product_url):
+    """
+    カート追加後の購入手続き (HTTP → 失敗時はブラウザ) を行い、結果を通知する。
+    :return: 成功なら True、失敗なら False、注文確定の送信後に結果が分からない場合は None
+    """
+    success = False
+    message = ""
+    screenshot_path = config['ss_success_path']
+    if config['http_checkout_enabled']:
+        try:
+            with tracer.span('http_checkout'):
+                success, message = http_checkout(session, config, headers)
+            screenshot_path = None  # ブラウザを使っていないためスクリーンショットはなし
+        except CommitOutcomeUnknown as e:
+            # 注文が確定している可能性があるため、ブラウザでの購入手続きはやり直さない
+            print(f"⚠️ 注文確定の結果を確認できませんでした。二重注文を避けるため、購入手続きはやり直しません: {e}")
+            sudo_session.report()
+            send_notification(config, f"【⚠️注文結果不明】\n■ URL: {product_url}\n■ 理由: {e}\n"
+                                      "注文が確定している可能性があります。購入履歴を確認してください。")
+            return None
+        except CheckoutFallback as e:
+            print(f"⚠️ HTTPでの購入手続きを中断し、ブラウザに切り替えます: {e}")
+            sync_session_cookies_to_driver(driver, session, config.get('cookie_sync_verify', False))
+            with tracer.span('open_cart'):
+                open_page(driver, config['cart_url'], 'cart', config['wait_timeout'])
+
+    if not success:
+        # ★ api_add_to_cart 内、またはフォールバック時にカートURLへ遷移済み
+        with tracer.span('purchase_from_cart'):
+            success, message = purchase_from_cart(driver, config)
+
+    sudo_session.report()
+    if success:
+        result_message = f"【✅購入成功報告✅】\n■ URL: {product_url}\n■ 結果: {message}"
+        send_notification(config, result_message, screenshot_path)
+    else:
+        error_message = f"【❌購入失敗】\n■ URL: {product_url}\n■ 理由: {message}"
+        send_notification(config, error_message, config['ss_error_path'])
+    return success
+
+def refresh_sudo_before_sale(driver, config, session, sale_time):
+    """
+    販売開始の SudoRefreshSecondsBeforeSale 秒前に高セキュリティ認証(Sudoモード)を取り直し、
+    購入手続きでパスワード画面が表示されないようにする。
+    その時点より後に認証済みであれば何もしない。
+    """
+    lead = config['sudo_refresh_seconds']
+    if lead <= 0:
+        return
+    sale_datetime = resolve_sale_datetime(sale_time, allow_rollover=config['sale_day_rollover'])
+    refresh_at = sale_datetime - timedelta(seconds=lead)
+    if datetime.now() < refresh_at:
+        print(f"\n高セキュリティ認証の再取得 ({refresh_at.strftime('%H:%M:%S')}) まで待機します...")
+        wait_until(refresh_at, label="高セキュリティ認証の再取得")
+    elif sudo_session.authenticated_at and sudo_session.authenticated_at >= refresh_at:
+        return
+
+    age = sudo_session.age_seconds()
+    print(f"-> 前回の認証から {age / 60:.1f} 分経過しています。" if age is not None else "-> 認証の記録がありません。")
+    with tracer.span('refresh_sudo_mode'):
+        ensure_sudo_mode(driver, config)
+        # 再認証で更新されたCookieを、カート追加・購入手続き用の Session にも反映する
+        copy_cookies_to_session(driver, session, config)
+
+def run_watchlist(driver, config, session, headers):
+    """ウォッチリストの全商品を監視し、条件を満たした商品から順にカート追加・購入する"""
+    open_cart = not config['http_checkout_enabled']
+
+    def on_hit(item, api_info):
+        # Referer を監視中の商品ページに合わせる
+        item_headers = dict(headers, Referer=item['url'])
+        with tracer.span('watchlist_hit', item=item['name']):
+            if api_add_to_cart(driver, config, api_info, session, item_headers, open_cart=open_cart) != SUCCESS:
+                return False
+            # 購入に失敗した・結果不明の場合も、かごには追加済みなので再追加しない (None でこの商品の監視を終える)
+            return checkout_and_notify(driver, config, session, item_headers, item['url']) or None
+
+    purchased = monitor_watchlist(config, session, headers, on_hit)
+    print(f"-> ウォッチリストの監視を終了しました (購入: {len(purchased)}/{len(config['watchlist'])} 商品)")
 
 def main():
     """(API高速化版) 指定時刻に商品を監視し、APIでカート追加して最速で購入する"""
+    parser = argparse.ArgumentParser(description='楽天 自動購入プログラム')
+    parser.add_argument('--config', default='config.ini', help='設定ファイルのパス (既定: config.ini)')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='モジュールの読み込み・初期化の所要時間を、ログイン開始時に表示する')
+    args = parser.parse_args()
+
     print(f"--- 楽天 自動購入プログラム (API高速待機版) ---")
-    
-    config = load_config()
+    startup_begin = time.perf_counter()
+
+    # ★★★ 設定の読み込みと並行してChromeを起動する ★★★
+    with profiler.phase('load_browser_settings'):
+        browser_settings = load_browser_settings(args.config)
+    driver_future = None
+    if browser_settings.pop('prelaunch'):
+        driver_future = launch_driver_async(**browser_settings)
 
     try:
-        sale_time_str = config['sale_start_time'].strip('"\'')
-        sale_time = datetime.strptime(sale_time_str, "%H:%M:%S").time()
-        print(f"目標時刻: {sale_time_str}")
-    except (ValueError, KeyError):
-        print("エラー: config.iniのSaleStartTimeが 'HH:MM:SS' 形式で正しく設定されていません。")
-        sys.exit(1)
+        with profiler.phase('load_config'):
+            config = load_config(args.config)
+        tracer.enabled = config['trace_enabled']
+        registry.stats_file = config['selector_stats_file']
+        screenshots.scale = config['screenshot_scale']
+        screenshots.quality = config['screenshot_quality']
+
+        try:
+            sale_time_str = config['sale_start_time'].strip('"\'')
+            sale_time = datetime.strptime(sale_time_str, "%H:%M:%S").time()
+            print(f"目標時刻: {sale_time_str}")
+        except (ValueError, KeyError):
+            print("エラー: config.iniのSaleStartTimeが 'HH:MM:SS' 形式で正しく設定されていません。")
+            sys.exit(1)
+    except SystemExit:
+        discard_driver_launch(driver_future)
+        raise
 
     driver = None
     try:
-        driver = setup_driver(headless=config['headless'])
+        with tracer.span('setup_driver'), profiler.phase('setup_driver (待ち時間)'):
+            if driver_future:
+                driver = driver_future.result()
+            else:
+                driver = setup_driver(**browser_settings)
+        print(f"-> 起動からWebDriver利用可能まで: {(time.perf_counter() - startup_begin) * 1000:.0f} ms")
+        profiler.report("ログイン開始")
         print("\nSTEP 1: ログイン処理を開始します...")
-        if not user_login(driver, config):
-            message = "ログインに失敗しました。処理を中断します。"
-            send_notification(config, f"【❌ログイン失敗】\n{message}")
-            sys.exit(1)
+        # ★★★ 保存されたログイン状態が有効なら、ログイン処理を省略する ★★★
+        restored = False
+        if config['session_reuse_enabled']:
+            with tracer.span('restore_session'):
+                restored = restore_session(driver, config)
+
+        if not restored:
+            with tracer.span('login'):
+                logged_in = user_login(driver, config)
+            if not logged_in:
+                message = "ログインに失敗しました。処理を中断します。"
+                send_notification(config, f"【❌ログイン失敗】\n{message}")
+                sys.exit(1)
         print("-> ログイン成功！")
 
         # ★★★ 追加点: 事前認証で「購入時の再ログイン」を回避する ★★★
-        ensure_sudo_mode(driver, config)
+        with tracer.span('ensure_sudo_mode'):
+            ensure_sudo_mode(driver, config)
         # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+        if config['session_reuse_enabled']:
+            save_session(driver, config)
         
+        session, headers = build_api_session(driver, config)
+        # 販売開始までの長い待機の間、軽いリクエストでログイン状態を確認し続ける
+        sudo_session.start_keepalive(session, config)
+
+        # ★★★ ウォッチリストがある場合は、1つのログイン・ブラウザで全商品を同時に監視する ★★★
+        if config['watchlist']:
+            print("\nSTEP 2: ウォッチリストの商品の監視を開始します...")
+            run_watchlist(driver, config, session, headers)
+            return
+
         print(f"\nSTEP 2: 販売ページに事前にアクセスし、API情報を取得します...")
-        driver.get(config['target_product_url'])
-        
-        # ★★★ APIデータの自動抽出 ★★★
-        # ここで商品ページからフォーム情報をスクレイピングする
-        api_info = extract_cart_form_data(driver)
+        api_info = None
+        # ★★★ ブラウザで描画せず、HTTPで商品ページのAPIデータだけを取得する ★★★
+        if config['http_product_fetch']:
+            with tracer.span('fetch_cart_form_data'):
+                api_info = fetch_cart_form_data(session, config['target_product_url'], {'User-Agent': headers['User-Agent']})
+            if not api_info:
+                print("-> HTTPでの取得に失敗したため、ブラウザで商品ページを開きます。")
+
+        if not api_info:
+            with tracer.span('load_product_page'):
+                open_page(driver, config['target_product_url'], 'product', config['wait_timeout'])
+
+            # ★★★ APIデータの自動抽出 ★★★
+            # ここで商品ページからフォーム情報をスクレイピングする
+            with tracer.span('extract_cart_form_data'):
+                api_info = extract_cart_form_data(driver)
         
         if not api_info:
             print("❌ エラー: カートAPI情報の取得に失敗しました。")
@@ -55,12 +216,68 @@ def main():
             send_notification(config, "【⚠️準備エラー】\nカートAPI情報の取得に失敗したため、処理を終了します。")
             return
         
+        # ★★★ 価格上限のチェック (JSONの価格で判定し、上限を超える場合はカート追加しない) ★★★
+        product = api_info['product']
+        print(f"-> 商品: {product['name']} / 価格: {api_info['price']}円 (上限: {config['max_price']}円)")
+        if api_info['price'] is not None and api_info['price'] > config['max_price']:
+            message = f"価格 {api_info['price']}円 が上限 {config['max_price']}円 を超えているため、処理を終了します。"
+            print(f"❌ {message}")
+            send_notification(config, f"【⚠️価格上限超過】\n■ URL: {config['target_product_url']}\n{message}")
+            return
+
         print(f"-> API情報取得成功。待機モードへ移行します。")
 
+        # ★★★ 販売直前の待機ウィンドウで、サーバー時計とのずれを計測する ★★★
+        clock_offset = 0.0
+        if config['clock_sync_enabled']:
+            sale_datetime = resolve_sale_datetime(sale_time, allow_rollover=config['sale_day_rollover'])
+            window_start = sale_datetime - timedelta(seconds=config['pre_sale_wait_seconds'])
+            if datetime.now() < window_start:
+                print(f"\n待機ウィンドウ開始 ({window_start.strftime('%H:%M:%S')}) まで待機します...")
+                wait_until(window_start, label="待機ウィンドウ開始")
+            with tracer.span('clock_sync'):
+                clock_offset = sync_server_clock(config, [api_info['url'], config['target_product_url']])
+
+        # ★★★ 販売直前に高セキュリティ認証を取り直す (待機中に期限が切れないように) ★★★
+        refresh_sudo_before_sale(driver, config, session, sale_time)
+        # ここから先の待機は ArmedRequest が接続を維持する
+        sudo_session.stop_keepalive()
+
         print("\nSTEP 3: 販売開始時刻まで高速API待機ループに入ります...")
         
         # ★★★ API版の待機関数を実行 ★★★
-        success = wait_for_sale_and_api_add_to_cart(driver, config, sale_time, api_info)
+        # HTTP購入手続きを使う場合は、同じSessionのまま購入手続きに進むためブラウザでかごを開かない
+        use_http_checkout = config['http_checkout_enabled']
+        # 待機中に config.ini が更新された場合、販売開始時刻・上限価格などの安全な項目だけを反映する
+        watcher = ConfigWatcher(args.config, config) if config['config_hot_reload'] else None
+        cart_add_mode = config['cart_add_mode']
+        if cart_add_mode != 'api' and not driver.current_url.startswith(config['target_product_url']):
+            # UIクリックを使う場合は、待機前に商品ページを開いておく
+            with tracer.span('load_product_page'):
+                open_page(driver, config['target_product_url'], 'product', config['wait_timeout'])
+
+        if cart_add_mode == 'race':
+            success = wait_for_sale_and_race_add_to_cart(
+                driver, config, sale_time, api_info, clock_offset,
+                session=session, headers=headers, open_cart=not use_http_checkout, watcher=watcher,
+            )
+        elif cart_add_mode == 'ui':
+            success = wait_for_sale_and_click_proceed_only(driver, config, sale_time, clock_offset, watcher=watcher)
+            if success:
+                # ブラウザでかごに追加した状態を、HTTPでの購入手続き用の Session にも反映する
+                copy_cookies_to_session(driver, session, config)
+        else:
+            success = wait_for_sale_and_api_add_to_cart(
+                driver, config, sale_time, api_info, clock_offset,
+                session=session, headers=headers, open_cart=not use_http_checkout, watcher=watcher,
+            )
+
+        # ★★★ 常駐モード: 売り切れていた場合は、再入荷を監視して即座にカート追加する ★★★
+        if not success and config['persistent_mode']:
+            print("\nSTEP 3b: 在庫監視モードに移行し、再入荷を待ちます...")
+            success = watch_restock_and_api_add_to_cart(
+                driver, config, api_info, session, headers, open_cart=not use_http_checkout,
+            )
 
         if not success:
             print("-> カート追加に失敗したか、エラーが発生しました。処理を終了します。")
@@ -68,15 +285,7 @@ def main():
             return
 
         print("\nSTEP 4: 最速購入フローを開始します！")
-        # ★ 変更なし：wait_for_sale_and_api_add_to_cart 内でカートURLへ遷移済み
-        success, message = purchase_from_cart(driver, config)
-
-        if success:
-            result_message = f"【✅購入成功報告✅】\n■ URL: {config['target_product_url']}\n■ 結果: {message}"
-            send_notification(config, result_message, config['ss_success_path'])
-        else:
-            error_message = f"【❌購入失敗】\n■ URL: {config['target_product_url']}\n■ 理由: {message}"
-            send_notification(config, error_message, config['ss_error_path'])
+        checkout_and_notify(driver, config, session, headers, config['target_product_url'])
 
     except KeyboardInterrupt:
         print("\nユーザーによって処理が中断されました。")
@@ -88,6 +297,13 @@ def main():
         if driver:
             print("\nWebDriverを終了します。")
             driver.quit()
+        sudo_session.stop_keepalive()
+        report_firing_records()
+        tracer.export(config['trace_dir'])
+        registry.save()
+        # バックグラウンドで保存中のスクリーンショットと送信中の通知を、上限時間まで待ってから終了する
+        screenshots.flush()
+        flush_notifications(config['notification_flush_seconds'])
         print("プログラムを終了します。")
 
 if __name__ == '__main__':
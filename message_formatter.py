@@ -1,15 +1,19 @@
 # message_formatter.py
 import json
 import os
-import sys
 
-# --- モジュールレベルでのテンプレート読み込み ---
+# --- テンプレートは最初にメッセージを作成する時に読み込む (import 時には読み込まない) ---
+_templates = None
+
 def _load_templates():
-    """メッセージテンプレートをJSONファイルから読み込む"""
+    """
+    メッセージテンプレートをJSONファイルから読み込む。
+    読み込めない場合はエラーを表示して空の辞書を返す (メッセージは既定の文言になる)。
+    """
     template_file = 'message_templates.json'
     if not os.path.exists(template_file):
         print(f"エラー: メッセージテンプレートファイル '{template_file}' が見つかりません。")
-        sys.exit(1)
+        return {}
     
     try:
         with open(template_file, 'r', encoding='utf-8') as f:
@@ -18,12 +22,17 @@ def _load_templates():
         return templates
     except json.JSONDecodeError:
         print(f"エラー: '{template_file}' のJSON形式が正しくありません。")
-        sys.exit(1)
+        return {}
     except Exception as e:
         print(f"エラー: テンプレートファイル '{template_file}' の読み込みに失敗しました: {e}")
-        sys.exit(1)
+        return {}
 
-MESSAGE_TEMPLATES = _load_templates()
+def get_templates():
+    """メッセージテンプレートを返す (初回のみファイルから読み込む)"""
+    global _templates
+    if _templates is None:
+        _templates = _load_templates()
+    return _templates
 
 def _format_message(template_lines, params):
     """テンプレートとパラメータから最終的なメッセージ文字列を生成する内部関数"""
@@ -36,7 +45,7 @@ def _format_message(template_lines, params):
 
 def create_discovery_message(notification_method, event):
     """イベント発見通知メッセージを作成する"""
-    template_lines = MESSAGE_TEMPLATES.get('discovery', {}).get(notification_method, [])
+    template_lines = get_templates().get('discovery', {}).get(notification_method, [])
     
     params = {
         'title': event['title'],
@@ -48,7 +57,7 @@ def create_discovery_message(notification_method, event):
 
 def create_result_message(notification_method, event, player_id, success, apply_message):
     """自動応募結果の通知メッセージを作成する"""
-    template_lines = MESSAGE_TEMPLATES.get('result', {}).get(notification_method, [])
+    template_lines = get_templates().get('result', {}).get(notification_method, [])
 
     # ★★★ LINE通知かつ応募成功の場合、メッセージに注釈を追加 ★★★
     if success and notification_method == 'line':
@@ -0,0 +1,359 @@
+# mock_server.py
+"""
+ローカル検証用の楽天スタンドインサーバー。
+ログイン → 購入履歴(Sudo認証) → 商品ページ → cartAdd → 買い物かご → 届け先 → 最終確認 までを
+localhost 上で再現し、main.py をライブ販売なしで最後まで動かせるようにする。
+時計を意図的にずらした Date ヘッダーも返せるので、clock_sync の検証にも使える。
+
+使い方: python mock_server.py --port 8080 --skew 0.3 --sale-in 60
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# cartAdd が返す resultCode とメッセージ (このサーバー内での取り決め)
+RESULT_MESSAGES = {
+    '0': '商品をかごに追加しました',
+    'R00100': 'この商品は販売開始前です',
+    'R00200': '申し訳ございません。この商品は売り切れました',
+    'R00300': 'ご購入可能な数量の上限を超えています',
+    'R00900': 'ログインしてください',
+}
+
+LOGIN_PAGE = """<html><body>
+<h1>楽天会員ログイン</h1>
+<form method="post" action="/login">
+  <div id="step1"><input id="user_id" name="user_id"><button type="button" id="cta001">次へ</button></div>
+  <div id="step2" style="display:none">
+    <input id="password_current" name="password" type="password"><button type="submit" id="cta011">ログイン</button>
+  </div>
+</form>
+<script>
+document.getElementById('cta001').onclick = function () {
+  document.getElementById('step1').style.display = 'none';
+  document.getElementById('step2').style.display = 'block';
+};
+</script>
+</body></html>"""
+
+TOP_PAGE = """<html><body><h1>楽天市場 (mock)</h1>
+<a href="https://my.rakuten.co.jp/">会員情報</a></body></html>"""
+
+SUDO_PAGE = """<html><body><h1>パスワードを再入力してください</h1>
+<form method="post" action="/order-history">
+  <input type="password" name="password"><button type="submit" id="cta011">ログイン</button>
+</form></body></html>"""
+
+ORDER_HISTORY_PAGE = """<html><body><h1>購入履歴</h1><span id="ratAccountId">mock-account</span></body></html>"""
+
+# 実際の楽天のページと同様に、購入処理には不要な画像・フォント・計測ビーコンを読み込ませる
+HEAVY_ASSETS = """<link rel="preload" href="/assets/font.woff2" as="font" crossorigin>
+<img src="/assets/item-main.jpg"><img src="/assets/item-sub1.jpg"><img src="/assets/banner.png">
+<script src="/analytics/beacon.js"></script>
+<iframe src="/recommend/widget" style="width:1px;height:1px"></iframe>"""
+
+PRODUCT_PAGE = """<html><head><title>{name}</title></head><body>
+{assets}
+<div id="item-name-area"><span class="normal_reserve_item_name">{name}</span></div>
+<div id="itemPrice"><div class="number--50WuC">{price:,}円</div></div>
+<div id="AddToCartPurchaseButtonFixed">
+  <button aria-label="かごに追加" onclick="addToCart()"><span>かごに追加</span></button>
+</div>
+<div id="popup" style="display:none">商品をかごに<br>追加しました</div>
+<script id="item-page-app-data" type="application/json">{app_data}</script>
+<script>
+function addToCart() {{
+  var body = new URLSearchParams({{shopid: '{shop_id}', itemid: '{item_id}', units: '1'}});
+  fetch('/cartAdd/', {{method: 'POST', body: body, credentials: 'include'}})
+    .then(function (r) {{ return r.json(); }})
+    .then(function (j) {{ if (j.resultCode === '0') document.getElementById('popup').style.display = 'block'; }});
+}}
+</script>
+</body></html>"""
+
+CART_PAGE = """<html><body><h1>買い物かご</h1>
+{assets}
+<div class="cart-item">{name} x {units}</div>
+<form method="post" action="/purchase/shipping">
+  <input type="hidden" name="cart_token" value="{token}">
+  <button type="submit" aria-label="購入手続き">購入手続き</button>
+</form></body></html>"""
+
+EMPTY_CART_PAGE = """<html><body><h1>買い物かご</h1>{assets}<p>買い物かごに商品がありません</p></body></html>"""
+
+SHIPPING_PAGE = """<html><body><h1>お届け先の指定</h1>
+<form method="post" action="/purchase/confirm">
+  <input type="hidden" name="shipping_token" value="{token}">
+  <button type="submit" aria-label="次へ">次へ</button>
+</form></body></html>"""
+
+CONFIRM_PAGE = """<html><body><h1>ご注文内容の確認</h1>
+<form method="post" action="/purchase/commit">
+  <input type="hidden" name="confirm_token" value="{token}">
+  <button type="submit" aria-label="注文を確定する">注文を確定する</button>
+</form></body></html>"""
+
+COMPLETE_PAGE = """<html><body><h1>ご注文ありがとうございました</h1><p>注文番号: {order_id}</p></body></html>"""
+
+class MockRakutenHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def date_time_string(self, timestamp=None):
+        """Date ヘッダーをサーバーの時計のずれ(skew)込みで返す"""
+        if timestamp is None:
+            timestamp = time.time()
+        return formatdate(timestamp + self.server.clock_skew, usegmt=True)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # --- 共通ヘルパー ---
+    def _cookies(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        return {key: morsel.value for key, morsel in cookie.items()}
+
+    def _form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        return {k: v[0] for k, v in parse_qs(body).items()}
+
+    def _send_body(self, status, body=b'', content_type='text/html; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or []):
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _redirect(self, location, headers=None):
+        self._send_body(302, headers=[('Location', location)] + (headers or []))
+
+    def _user(self):
+        return self._cookies().get('Rz')
+
+    def _page(self, body, headers=None):
+        if self.server.page_latency_ms:
+            time.sleep(self.server.page_latency_ms / 1000.0)
+        self._send_body(200, body, headers=headers)
+
+    # --- ルーティング ---
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        server = self.server
+        if path in ('/', '/top'):
+            self._page(TOP_PAGE)
+        elif path == '/login':
+            self._page(LOGIN_PAGE)
+        elif path == '/order-history':
+            if not self._user():
+                self._redirect('/login')
+            elif self._cookies().get('sudo') == '1':
+                self._page(ORDER_HISTORY_PAGE)
+            else:
+                self._page(SUDO_PAGE)
+        elif path == '/item/':
+            # 在庫監視の条件付きリクエスト用に、内容から ETag を付ける
+            page = server.product_page()
+            etag = '"%s"' % hashlib.sha1(page.encode('utf-8')).hexdigest()[:16]
+            if self.headers.get('If-None-Match') == etag:
+                self._send_body(304, headers=[('ETag', etag)])
+            else:
+                self._page(page, headers=[('ETag', etag)])
+        elif path == '/cart/':
+            cart = server.carts.get(self._user())
+            if cart:
+                self._page(CART_PAGE.format(name=server.product['name'], units=cart['units'],
+                                            token=uuid.uuid4().hex, assets=HEAVY_ASSETS))
+            else:
+                self._page(EMPTY_CART_PAGE.format(assets=HEAVY_ASSETS))
+        elif path.startswith('/assets/'):
+            # 画像・フォントの代わりに、それらしいサイズのダミーデータを返す
+            if server.asset_latency_ms:
+                time.sleep(server.asset_latency_ms / 1000.0)
+            self._send_body(200, b'\0' * server.asset_bytes, 'application/octet-stream',
+                            headers=[('Cache-Control', 'max-age=3600')])
+        elif path.startswith('/analytics/'):
+            if server.asset_latency_ms:
+                time.sleep(server.asset_latency_ms / 1000.0)
+            self._send_body(200, '/* beacon */', 'application/javascript')
+        elif path.startswith('/recommend/'):
+            self._page('<html><body>おすすめ商品<img src="/assets/rec1.jpg"><img src="/assets/rec2.jpg"></body></html>')
+        else:
+            self._send_body(404, 'not found')
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        server = self.server
+        form = self._form()
+        if path == '/login':
+            user = uuid.uuid4().hex
+            self._redirect('/top', headers=[('Set-Cookie', f'Rz={user}; Path=/')])
+        elif path == '/order-history':
+            self._send_body(200, ORDER_HISTORY_PAGE, headers=[('Set-Cookie', 'sudo=1; Path=/')])
+        elif path == '/cartAdd/':
+            code = server.next_cart_result(self._user())
+            if code == '0':
+                cart = server.carts.setdefault(self._user(), {'units': 0})
+                cart['units'] += int(form.get('units', 1))
+            payload = {'resultCode': code, 'resultMessage': RESULT_MESSAGES.get(code, '')}
+            self._send_body(200, json.dumps(payload, ensure_ascii=False), 'application/json; charset=utf-8')
+        elif path == '/purchase/shipping':
+            server.record('shipping')
+            self._page(SHIPPING_PAGE.format(token=uuid.uuid4().hex))
+        elif path == '/purchase/confirm':
+            server.record('confirm')
+            self._page(CONFIRM_PAGE.format(token=uuid.uuid4().hex))
+        elif path == '/purchase/commit':
+            server.record('commit')
+            server.carts.pop(self._user(), None)
+            self._page(COMPLETE_PAGE.format(order_id=uuid.uuid4().hex[:12]))
+        else:
+            self._send_body(404, 'not found')
+
+class MockRakutenServer(ThreadingHTTPServer):
+    """
+    楽天の各ページを再現するサーバー。
+    cartAdd の応答は sale_at (販売開始の epoch 秒) より前は pre_sale_result、
+    以降は cart_results を先頭から順に返す (最後の値は繰り返し使う)。
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, clock_skew=0.0, verbose=False, sale_at=None,
+                 cart_results=('0',), pre_sale_result='R00100', cart_latency_ms=0, page_latency_ms=0,
+                 asset_latency_ms=50, asset_bytes=200 * 1024):
+        super().__init__(('127.0.0.1', port), MockRakutenHandler)
+        self.clock_skew = clock_skew
+        self.verbose = verbose
+        self.sale_at = sale_at
+        self.cart_results = list(cart_results)
+        self.pre_sale_result = pre_sale_result
+        self.cart_latency_ms = cart_latency_ms
+        self.page_latency_ms = page_latency_ms
+        self.asset_latency_ms = asset_latency_ms
+        self.asset_bytes = asset_bytes
+        self.product = {'name': 'モック商品 (テスト用)', 'price': 5000, 'shop_id': '999999', 'item_id': '10000001',
+                        'stock': 'in-stock'}
+        self.carts = {}
+        self.events = []
+        self._cart_index = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """バックグラウンドスレッドでサーバーを起動する"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def reset(self, sale_at=None):
+        """ベンチマークの各回の前に、カートと記録を初期化する"""
+        with self._lock:
+            self.sale_at = sale_at
+            self.carts.clear()
+            self.events.clear()
+            self._cart_index = 0
+
+    def record(self, name):
+        with self._lock:
+            self.events.append((name, time.time()))
+
+    def first_event(self, name):
+        return next((t for n, t in self.events if n == name), None)
+
+    def next_cart_result(self, user):
+        """cartAdd の応答コードを決め、到着時刻を記録する"""
+        self.record('cartAdd')
+        if self.cart_latency_ms:
+            time.sleep(self.cart_latency_ms / 1000.0)
+        if not user:
+            return 'R00900'
+        if self.sale_at and time.time() + self.clock_skew < self.sale_at:
+            return self.pre_sale_result
+        if self.product['stock'] == 'sold-out':
+            return 'R00200'
+        with self._lock:
+            index = self._cart_index
+            self._cart_index += 1
+        return self.cart_results[min(index, len(self.cart_results) - 1)]
+
+    def product_page(self):
+        p = self.product
+        sku_info = {
+            'shopId': p['shop_id'],
+            'itemId': p['item_id'],
+            'title': p['name'],
+            'inventoryType': 'normal',
+            'purchaseInfo': {'purchaseBySellType': {'basketSettings': {'directDomain': f"{self.base_url}/cartAdd/"}}},
+            'sku': [{
+                'variantId': 'normal-inventory',
+                'selectorValues': [],
+                'taxIncludedPrice': p['price'],
+                'newPurchaseSku': {'stockCondition': p['stock'], 'quantity': 1 if p['stock'] != 'sold-out' else 0,
+                                   'price': p['price']},
+            }],
+        }
+        app_data = json.dumps({'api': {'data': {'itemInfoSku': sku_info}}}, ensure_ascii=False)
+        return PRODUCT_PAGE.format(name=p['name'], price=p['price'], app_data=app_data,
+                                   shop_id=p['shop_id'], item_id=p['item_id'], assets=HEAVY_ASSETS)
+
+    def config_overrides(self):
+        """このサーバーに向けて main.py を動かすための config.ini 上書き値"""
+        return {
+            'URLS': {
+                'TargetProductURL': f"{self.base_url}/item/",
+                'BaseURL': f"{self.base_url}/",
+                'LoginPageURL': f"{self.base_url}/login",
+                'CartURL': f"{self.base_url}/cart/",
+                'OrderHistoryURL': f"{self.base_url}/order-history",
+            },
+            # 本番用のログイン状態・セレクタの実績・トレースを上書きしないよう、別のファイルに保存する
+            'SETTINGS': {
+                'SessionFile': 'mock_cookies.pkl',
+                'SelectorStatsFile': 'mock_selector_stats.json',
+                'TraceDirectory': 'mock_traces',
+            },
+        }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='楽天スタンドインサーバー')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--skew', type=float, default=0.0, help='サーバー時計のずれ(秒)')
+    parser.add_argument('--sale-in', type=float, default=None, help='何秒後に販売開始とするか')
+    parser.add_argument('--cart-results', default='0', help='cartAdd が順に返す resultCode (カンマ区切り)')
+    parser.add_argument('--cart-latency-ms', type=int, default=0)
+    parser.add_argument('--page-latency-ms', type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockRakutenServer(
+        args.port, clock_skew=args.skew, verbose=True,
+        sale_at=time.time() + args.sale_in if args.sale_in is not None else None,
+        cart_results=args.cart_results.split(','),
+        cart_latency_ms=args.cart_latency_ms, page_latency_ms=args.page_latency_ms,
+    )
+    print(f"スタンドインサーバーを起動しました: {server.base_url} (時計のずれ {args.skew:+.3f} 秒)")
+    for section, values in server.config_overrides().items():
+        print(f"[{section}]")
+        for key, value in values.items():
+            print(f"{key} = {value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
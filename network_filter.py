@@ -0,0 +1,69 @@
+# network_filter.py
+from fnmatch import fnmatch
+
+# --- 通信の遮断プロファイル ---
+# block_patterns: 遮断するURLパターン (* のみワイルドカード、URL全体に一致させる)
+#   - 画像・フォント・動画などは、パスの末尾の拡張子だけで判定する (クエリ文字列付きも含む)
+#   - 計測・広告・レコメンドは、既知の外部ホスト (と楽天の計測用ホスト) を名指しで遮断する
+#   パス中の単語 (analytics など) で判定すると、購入に必要なスクリプトまで遮断しかねないため使わない
+# allow_hosts: 購入処理に必須のドメイン。ドメインごと遮断してしまうパターンはここに当たると無効化される
+_BLOCKED_EXTENSIONS = (
+    # 画像
+    'png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico',
+    # フォント
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    # 動画・音声
+    'mp4', 'webm', 'm3u8', 'mp3',
+)
+_BLOCKED_HOSTS = (
+    # 計測・広告ビーコン
+    '*.google-analytics.com', '*.googletagmanager.com', '*.doubleclick.net',
+    '*.googlesyndication.com', 'connect.facebook.net', '*.criteo.com', '*.criteo.net',
+    'rat.rakuten.co.jp', 'grp*.ias.rakuten.co.jp', 'ad.rakuten.co.jp',
+    # レコメンド・ウィジェット
+    'ranking.rakuten.co.jp',
+)
+
+BLOCK_PROFILES = {
+    'default': {
+        'block_patterns': (
+            [f"*.{ext}" for ext in _BLOCKED_EXTENSIONS]
+            + [f"*.{ext}?*" for ext in _BLOCKED_EXTENSIONS]
+            + [f"*://{host}/*" for host in _BLOCKED_HOSTS]
+        ),
+        'allow_hosts': [
+            'item.rakuten.co.jp',
+            'basket.step.rakuten.co.jp',
+            't.direct.step.rakuten.co.jp',
+            'login.account.rakuten.com',
+            'grp01.id.rakuten.co.jp',
+            'order.my.rakuten.co.jp',
+            'www.rakuten.co.jp',
+        ],
+    },
+}
+
+def build_block_list(profile='default', extra_patterns=()):
+    """
+    プロファイルと追加パターンから、実際に遮断するURLパターンの一覧を作る。
+    必須ドメインのトップページに一致してしまうパターン (ドメインごと遮断するもの) は除外する。
+    """
+    settings = BLOCK_PROFILES.get(profile, BLOCK_PROFILES['default'])
+    allow_urls = [f"https://{host}/" for host in settings['allow_hosts']]
+
+    patterns = []
+    for pattern in list(settings['block_patterns']) + [p.strip() for p in extra_patterns if p.strip()]:
+        blocked = [url for url in allow_urls if fnmatch(url, pattern)]
+        if blocked:
+            print(f"⚠️ 遮断パターン '{pattern}' は必須ドメインを遮断するため無視します: {blocked[0]}")
+            continue
+        patterns.append(pattern)
+    return patterns
+
+def apply_network_filter(driver, profile='default', extra_patterns=()):
+    """DevTools Protocol で、ページが読み込む不要なリソースを遮断する"""
+    patterns = build_block_list(profile, extra_patterns)
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+    print(f"高速ページモード: {len(patterns)}件のURLパターンを遮断します。")
+    return patterns
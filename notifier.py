@@ -1,39 +1,56 @@
 # notifier.py
-import requests
 import json
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    TextMessage,
-    PushMessageRequest
-)
-
-def _send_discord_message(webhook_url, message, image_path=None):
-    """(内部用) Discordにメッセージと画像(オプション)を送信する"""
+import mimetypes
+import os
+import queue
+import threading
+import time
+import requests
+from screenshot_service import screenshots
+
+# LINE の SDK (linebot) は読み込みが重いため、LINE通知を実際に送る時に初めて読み込む
+
+# Discord の 429 (レート制限) を受けた場合に再送する最大回数
+DISCORD_MAX_RETRIES = 3
+
+def _send_discord_message(session, webhook_url, message, image_path=None):
+    """(内部用) Discordにメッセージと画像(オプション)を送信する。429 の場合は retry_after 秒待って再送する"""
     if not webhook_url or not webhook_url.startswith('https://discord.com/api/webhooks/'):
         print("Discord通知スキップ: Webhook URLが正しく設定されていません。")
         return
 
     try:
-        if image_path:
-            # 画像付きで送信 (multipart/form-data)
-            with open(image_path, 'rb') as f:
-                payload_json = {'content': message.strip()}
-                files = {
-                    'file': (image_path, f, 'image/png'),
-                    'payload_json': (None, json.dumps(payload_json), 'application/json')
-                }
-                response = requests.post(webhook_url, files=files)
-        else:
-            # テキストのみで送信 (application/json)
-            main_content = {"content": message.strip()}
-            response = requests.post(
-                webhook_url,
-                data=json.dumps(main_content),
-                headers={'Content-Type': 'application/json'}
-            )
-        
+        for attempt in range(DISCORD_MAX_RETRIES + 1):
+            if image_path:
+                # 画像付きで送信 (multipart/form-data)
+                with open(image_path, 'rb') as f:
+                    payload_json = {'content': message.strip()}
+                    content_type = mimetypes.guess_type(image_path)[0] or 'application/octet-stream'
+                    files = {
+                        'file': (os.path.basename(image_path), f, content_type),
+                        'payload_json': (None, json.dumps(payload_json), 'application/json')
+                    }
+                    response = session.post(webhook_url, files=files, timeout=30)
+            else:
+                # テキストのみで送信 (application/json)
+                main_content = {"content": message.strip()}
+                response = session.post(
+                    webhook_url,
+                    data=json.dumps(main_content),
+                    headers={'Content-Type': 'application/json'},
+                    timeout=10
+                )
+
+            if response.status_code != 429 or attempt == DISCORD_MAX_RETRIES:
+                break
+            # レート制限: 応答の retry_after (秒) だけ待ってから再送する
+            try:
+                retry_after = float(response.json().get('retry_after', 1))
+            except ValueError:
+                retry_after = float(response.headers.get('Retry-After', 1))
+            print(f"Discordのレート制限により {retry_after:.1f} 秒後に再送します。")
+            time.sleep(retry_after)
+
         if 200 <= response.status_code < 300:
             print("Discordにメッセージを送信しました。")
         else:
@@ -45,46 +62,110 @@ def _send_discord_message(webhook_url, message, image_path=None):
         print(f"Discord通知エラー: 画像ファイルが見つかりません ({image_path})")
 
 
-def _send_line_message(token, group_id, message):
+def _send_line_message(messaging_api, group_id, message):
     """(内部用) 指定された単一のグループIDにプッシュメッセージを送信する"""
-    if not token or not group_id:
-        print("LINE通知スキップ: トークンまたはグループIDがありません。")
-        return
+    from linebot.v3.messaging import TextMessage, PushMessageRequest
+    push_message_request = PushMessageRequest(
+        to=group_id,
+        messages=[TextMessage(text=message.strip())]
+    )
+    try:
+        messaging_api.push_message(push_message_request)
+        print(f"LINEグループ (ID: {group_id[:10]}...) にメッセージを送信しました。")
+    except Exception as e:
+        error_body = getattr(e, 'body', 'N/A')
+        error_status = getattr(e, 'status', 'N/A')
+        print(f"LINEへのメッセージ送信に失敗しました。")
+        print(f"  ステータス: {error_status}")
+        print(f"  詳細: {error_body}")
+
+class NotificationDispatcher:
+    """
+    通知をキューに積み、バックグラウンドのスレッドで順に送信する。
+    購入処理のスレッドは送信の完了を待たない。HTTPクライアントは通知先ごとに1つを使い回す。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._discord_session = None
+        self._line_apis = {}  # アクセストークン -> MessagingApi
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+                self._thread.start()
+
+    def submit(self, config, message, image_path=None):
+        """通知をキューに積んで、すぐに戻る"""
+        self._queue.put((config, message, image_path))
+        self._ensure_worker()
+
+    def _run(self):
+        while True:
+            config, message, image_path = self._queue.get()
+            try:
+                self._deliver(config, message, image_path)
+            except Exception as e:
+                print(f"通知の送信中に予期せぬエラーが発生しました: {e}")
+            finally:
+                self._queue.task_done()
 
-    configuration = Configuration(access_token=token)
-    with ApiClient(configuration) as api_client:
-        messaging_api = MessagingApi(api_client)
-        push_message_request = PushMessageRequest(
-            to=group_id,
-            messages=[TextMessage(text=message.strip())]
-        )
-        try:
-            messaging_api.push_message(push_message_request)
-            print(f"LINEグループ (ID: {group_id[:10]}...) にメッセージを送信しました。")
-        except Exception as e:
-            error_body = getattr(e, 'body', 'N/A')
-            error_status = getattr(e, 'status', 'N/A')
-            print(f"LINEへのメッセージ送信に失敗しました。")
-            print(f"  ステータス: {error_status}")
-            print(f"  詳細: {error_body}")
+    def _line_api(self, token):
+        if token not in self._line_apis:
+            from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
+            self._line_apis[token] = MessagingApi(ApiClient(Configuration(access_token=token)))
+        return self._line_apis[token]
+
+    def _deliver(self, config, message, image_path):
+        method = config.get('notification_method', 'none').lower()
+        if method == 'discord':
+            if image_path:
+                # スクリーンショットはバックグラウンドで保存されるため、書き込み完了を待ってから送る
+                screenshots.wait(image_path)
+            if self._discord_session is None:
+                self._discord_session = requests.Session()
+            _send_discord_message(self._discord_session, config.get('webhook_url'), message, image_path)
+        elif method == 'line':
+            # LINEは画像送信に非対応なため、メッセージのみ送信
+            token, group_id = config.get('token'), config.get('group_id')
+            if not token or not group_id:
+                print("LINE通知スキップ: トークンまたはグループIDがありません。")
+                return
+            _send_line_message(self._line_api(token), group_id, message)
+        elif method != 'none':
+            print(f"警告: 不明な通知方法 '{method}' が指定されています。通知をスキップします。")
+
+    def flush(self, timeout=10):
+        """キューに残っている通知の送信完了を、最大 timeout 秒まで待つ"""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"⚠️ 未送信の通知が {self._queue.unfinished_tasks} 件残っていますが、終了します。")
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+dispatcher = NotificationDispatcher()
 
 def send_notification(config, message, image_path=None):
     """
-    設定に基づいて適切な通知先にメッセージを送信する
+    設定に基づいて適切な通知先にメッセージを送信する (送信はバックグラウンドで行い、すぐに戻る)
     :param config: config_loader.pyで読み込まれた設定辞書
     :param message: 送信するメッセージ文字列
     :param image_path: (オプション) Discord用。送信する画像のファイルパス
     """
-    method = config.get('notification_method', 'none').lower()
-
     if not message:
         print("通知スキップ: メッセージが空です。")
         return
+    if config.get('notification_method', 'none').lower() == 'none':
+        return
+    dispatcher.submit(config, message, image_path)
 
-    if method == 'discord':
-        _send_discord_message(config.get('webhook_url'), message, image_path)
-    elif method == 'line':
-        # LINEは画像送信に非対応なため、メッセージのみ送信
-        _send_line_message(config.get('token'), config.get('group_id'), message)
-    elif method != 'none':
-        print(f"警告: 不明な通知方法 '{method}' が指定されています。通知をスキップします。")
\ No newline at end of file
+def flush_notifications(timeout=10):
+    """プログラム終了前に、未送信の通知を最大 timeout 秒まで送り切る"""
+    return dispatcher.flush(timeout)
@@ -0,0 +1,98 @@
+# page_readiness.py
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+from driver_setup import configure_target
+
+# --- ページごとの「操作を始めてよい」条件 (CSSセレクタ) ---
+# ページ全体の読み込み完了を待たず、ここに挙げた要素が現れた時点で次の処理に進む。
+READY_SELECTORS = {
+    # 商品ページ: APIデータのJSONが埋め込まれていれば十分
+    'product': "#item-page-app-data",
+    # 買い物かご: 「購入手続き」ボタン
+    'cart': "button[aria-label='購入手続き'], button[aria-label='ご購入手続き'], input.purchaseButton",
+    # 購入履歴: 再認証のパスワード欄、または認証済みの画面
+    'order_history': "input[type='password'], #ratAccountId",
+    # ログイン: ユーザID入力欄
+    'login': "#user_id",
+    # 注文完了: 特定の要素は決めず、新しいページのDOM構築完了で十分
+    'order_complete': None,
+    # 事前に開いておく買い物かご: 商品を追加する前は「購入手続き」ボタンがないため、DOM構築完了で十分
+    'cart_staged': None,
+}
+
+# 遷移前のページに目印を付け、目印のない(=新しい)ページで条件の要素が現れたかを判定する
+_MARK_JS = "window.__pageReadyMarker = true;"
+_READY_JS = """
+if (window.__pageReadyMarker) return false;
+var selector = arguments[0];
+if (!selector) return document.readyState !== 'loading';
+return document.querySelector(selector) !== null;
+"""
+
+def mark_current_page(driver):
+    """
+    表示中のページに目印を付ける。ボタンのクリックなどで遷移する前に呼ぶと、
+    wait_until_ready が遷移後の新しいページだけを「準備完了」と判定する。
+    """
+    try:
+        driver.execute_script(_MARK_JS)
+    except WebDriverException:
+        pass
+
+def wait_until_ready(driver, page, timeout=10):
+    """登録された条件の要素が現れるまで待つ。タイムアウトしても例外にはせず False を返す"""
+    selector = READY_SELECTORS.get(page)
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.05, ignored_exceptions=(WebDriverException,)).until(
+            lambda d: d.execute_script(_READY_JS, selector)
+        )
+        return True
+    except TimeoutException:
+        print(f"⚠️ ページ({page})の準備完了を確認できませんでしたが、処理を続行します。")
+        return False
+
+def open_page(driver, url, page, timeout=10):
+    """
+    URLを開き、そのページの準備完了条件を満たすまで待つ。
+    PageLoadStrategy が eager / none の場合、driver.get はページ全体の読み込みを待たずに戻るため、
+    ここで必要な要素だけを待つことで、各ステップをできるだけ早く開始できる。
+    """
+    mark_current_page(driver)
+    driver.get(url)
+    return wait_until_ready(driver, page, timeout)
+
+
+def prestage_page(driver, url, page, timeout=10):
+    """
+    新しいタブで URL を開いて準備完了まで待ち、元のタブに戻る。
+    新しいタブにも、最初のタブと同じ bot検知対策スクリプトと通信の遮断を設定してから開く。
+    販売開始前に開いておくことで、本番では reload_page の軽い再読み込みだけで済む
+    (画像・スクリプトはキャッシュ済み、接続も確立済みになる)。
+    :return: 開いたタブのウィンドウハンドル (失敗した場合は None)
+    """
+    original = driver.current_window_handle
+    handle = None
+    try:
+        driver.switch_to.new_window('tab')
+        handle = driver.current_window_handle
+        configure_target(driver)
+        driver.get(url)
+        wait_until_ready(driver, page, timeout)
+    except WebDriverException as e:
+        print(f"⚠️ ページの事前準備に失敗しました: {e.__class__.__name__}")
+        if handle is not None:
+            # 開いたタブを残さない (ハンドルを返さないため、後から閉じられなくなる)
+            try:
+                driver.close()
+            except WebDriverException:
+                pass
+        handle = None
+    driver.switch_to.window(original)
+    return handle
+
+def reload_page(driver, handle, page, timeout=10):
+    """prestage_page で開いておいたタブに切り替えて再読み込みし、準備完了まで待つ"""
+    driver.switch_to.window(handle)
+    mark_current_page(driver)
+    driver.refresh()
+    return wait_until_ready(driver, page, timeout)
@@ -1,14 +1,22 @@
 # rakuten_login.py
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
+from page_readiness import open_page
+from selector_registry import registry
+from screenshot_service import screenshots
+from sudo_session import sudo_session
+
+def _require(driver, page, element, timeout):
+    """登録されたセレクタ候補で要素を待ち、見つからなければ TimeoutException を送出する"""
+    found = registry.find(driver, page, element, timeout)
+    if found is None:
+        raise TimeoutException(f"要素が見つかりませんでした: {page}.{element}")
+    return found
 
 def user_login(driver, config):
     """
     楽天のログイン処理（2段階フロー・ログアウト確認対応版）
     """
-    wait = WebDriverWait(driver, config['wait_timeout'])
+    timeout = config['wait_timeout']
     login_id = config['login_id']
     password = config['password']
     
@@ -17,34 +25,33 @@ def user_login(driver, config):
     try:
         # STEP 1: ログインページにアクセス
         print(f"[STEP 1] ログインページにアクセスします: {config['login_url']}")
-        driver.get(config['login_url'])
+        open_page(driver, config['login_url'], 'login', config['wait_timeout'])
 
         # STEP 2: ユーザIDを入力
         print("[STEP 2] ユーザID入力フィールドの表示を待ちます。")
-        id_field = wait.until(EC.presence_of_element_located((By.ID, "user_id")))
+        id_field = _require(driver, 'login', 'user_id', timeout)
         print("[STEP 3] ユーザIDを入力します。")
         id_field.send_keys(login_id)
         
         # STEP 4: 「次へ」ボタンをクリック
         print("[STEP 4] 「次へ」ボタンをクリックします。")
-        wait.until(EC.element_to_be_clickable((By.ID, "cta001"))).click()
+        _require(driver, 'login', 'id_next', timeout).click()
 
         # STEP 5: パスワードを入力
         print("[STEP 5] パスワード入力フィールドの表示を待ちます。")
-        password_field = wait.until(EC.presence_of_element_located((By.ID, "password_current")))
+        password_field = _require(driver, 'login', 'password', timeout)
         print("[STEP 6] パスワードを入力します。")
         password_field.send_keys(password)
 
         # STEP 7: ログインボタンをクリック
         print("[STEP 7] ログインボタンをクリックします。")
-        wait.until(EC.element_to_be_clickable((By.ID, "cta011"))).click()
+        _require(driver, 'login', 'submit', timeout).click()
 
         # ★★★★★★★★★★★★★★★★★★★ ここが修正点 ★★★★★★★★★★★★★★★★★★★
         # STEP 8: ログイン成功の確認
         # ログイン成功の証として「ログアウト」リンクが表示されるのを待つ
-        member_page_link_selector = "a[href*='my.rakuten.co.jp']"
         print(f"[STEP 8] ログイン成功の証として「会員情報」リンクが表示されるのを待ちます...")
-        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, member_page_link_selector)))
+        _require(driver, 'login', 'member_link', timeout)
         # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
 
         print("-> 「会員情報」リンクの表示を確認。ログインに成功しました！")
@@ -53,12 +60,12 @@ def user_login(driver, config):
     except TimeoutException:
         print("-> ログイン処理中にタイムアウトが発生しました。")
         print("   ID、パスワード、またはページ要素のセレクタが間違っている可能性があります。")
-        driver.save_screenshot(config['ss_error_path'])
-        print(f"  エラー時のスクリーンショットを '{config['ss_error_path']}' として保存しました。")
+        screenshots.capture(driver, config['ss_error_path'])
+        print(f"  エラー時のスクリーンショットを '{config['ss_error_path']}' として保存します。")
         return False
     except Exception as e:
         print(f"ログイン処理中に予期せぬエラーが発生しました: {e.__class__.__name__}")
-        driver.save_screenshot(config['ss_error_path'])
+        screenshots.capture(driver, config['ss_error_path'])
         return False
     
 def ensure_sudo_mode(driver, config):
@@ -67,55 +74,46 @@ def ensure_sudo_mode(driver, config):
     事前に「購入履歴」ページへアクセスし、高セキュリティ認証(Sudoモード)を済ませておく。
     """
     print("\n--- 高セキュリティ認証(Sudoモード)の事前取得を開始します ---")
-    wait = WebDriverWait(driver, 5) # 短めのタイムアウト
+    timeout = 5 # 短めのタイムアウト
     
     try:
         # 購入履歴ページへアクセス（ここは必ず認証を求められるエリア）
-        driver.get("https://order.my.rakuten.co.jp/")
+        ready = open_page(driver, config.get('order_history_url', "https://order.my.rakuten.co.jp/"), 'order_history', 5)
+        if ready and registry.find(driver, 'order_history', 'password') is None:
+            print("-> パスワード入力欄が出現しませんでした（既に認証済みと判断）。")
+            sudo_session.mark_authenticated()
+            return True
         
         # パスワード入力欄があるか確認
         try:
             # 汎用的にパスワード欄を探す
-            password_field = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='password']")))
+            password_field = _require(driver, 'order_history', 'password', timeout)
             print("-> 再認証画面を検知しました。パスワードを入力して認証を更新します。")
             
             password_field.clear()
             password_field.send_keys(config['password'])
             
             # ログインボタンを探してクリック
-            # rakuten_purchase.py と同様のロジックでボタンを探す
-            login_selectors = [
-                (By.ID, "cta011"), # 新仕様
-                (By.ID, "login_submit"), # 旧仕様
-                (By.CSS_SELECTOR, "input[type='submit']"),
-                (By.XPATH, "//button[contains(., 'ログイン')]")
-            ]
-            
-            clicked = False
-            for by, selector in login_selectors:
-                try:
-                    btn = driver.find_element(by, selector)
-                    if btn.is_displayed():
-                        driver.execute_script("arguments[0].click();", btn)
-                        clicked = True
-                        print(f"-> 認証ボタンをクリックしました ({selector})")
-                        break
-                except NoSuchElementException:
-                    continue
-            
-            if not clicked:
+            # rakuten_purchase.py と同じ候補 (selector_registry の login.submit) から探す
+            btn = registry.find(driver, 'login', 'submit')
+            if btn is not None:
+                driver.execute_script("arguments[0].click();", btn)
+                print("-> 認証ボタンをクリックしました")
+            else:
                 print("⚠️ 認証ボタンが見つかりませんでした。スキップします。")
                 return True # エラーにはせず進む
 
             # 遷移待ち（購入履歴一覧などの要素が出るまで）
             try:
-                wait.until(EC.presence_of_element_located((By.ID, "ratAccountId"))) # ページ固有のIDなどを待つ
+                _require(driver, 'order_history', 'authenticated', timeout) # ページ固有のIDなどを待つ
                 print("-> 認証を通過しました。")
+                sudo_session.mark_authenticated()
             except TimeoutException:
                 print("-> 遷移を確認できませんでしたが、処理を続行します。")
 
         except TimeoutException:
             print("-> パスワード入力欄が出現しませんでした（既に認証済みと判断）。")
+            sudo_session.mark_authenticated()
         
         return True
 
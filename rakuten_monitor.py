@@ -1,41 +1,72 @@
 # rakuten_monitor.py (最終修正版)
 import re
-import time
 import json # 追加
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException
+from selector_registry import registry
+from screenshot_service import screenshots
 
-def _find_element_with_multiple_selectors(driver, selectors):
-    """
-    (修正) driverオブジェクトを直接受け取るように変更。
-    複数のCSSセレクタをリストで受け取り、最初に見つかった要素を返す。
-    """
-    for selector in selectors:
-        try:
-            # 要素が見つかるまで最大2秒待つ
-            short_wait = WebDriverWait(driver, timeout=2) # 正しくdriverを使用
-            return short_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-        except TimeoutException:
-            continue
-    return None
+def _judge_product(product, product_url, config):
+    """evaluate_product の結果を、find_target_product の戻り値に変換する"""
+    if product['in_stock'] is False:
+        print("-> 在庫がありません。（全SKUが売り切れ）")
+        return None
+    if not product['cart_addable']:
+        print("-> 商品データにカート追加に必要な情報がありません。")
+        return None
+    if not product['purchasable']:
+        print(f"-> 価格が上限を超えています。(現在価格: {product['price']}円, 上限: {config['max_price']}円)")
+        return None
+
+    product_info = {
+        'name': product['name'],
+        'url': product_url,
+        'price': product['price'],
+    }
+    print(f"\n🎉 条件に一致する商品を発見しました！")
+    print(f"  商品名: {product_info['name']}")
+    print(f"  価格: {product_info['price']}円 (上限: {config['max_price']}円)")
+    return product_info
 
 def find_target_product(driver, config):
     """
     (高精度・複数ページ対応版)
-    人間の操作に近い手順で在庫を判定する。
+    商品ページに埋め込まれたJSON (item-page-app-data) から、商品名・価格・在庫を一度に判定する。
+    JSONが見つからない場合のみ、人間の操作に近い手順 (画面表示・ボタン) で判定する。
     """
-    wait = WebDriverWait(driver, config['wait_timeout'])
     product_url = config['target_product_url']
-    
+
     try:
         # --- STEP 1: 商品ページにアクセス ---
         print(f"指定された商品URLにアクセスします...")
         print(f"  URL: {product_url}")
         driver.get(product_url)
 
-        # --- STEP 2: 在庫状況を確認 ---
+        # --- STEP 2: 埋め込みJSONで判定 ---
+        try:
+            json_text = driver.find_element(By.ID, "item-page-app-data").get_attribute("innerHTML")
+            product = evaluate_product(json.loads(json_text), config['max_price'])
+        except (NoSuchElementException, ValueError):
+            product = None
+        if product:
+            return _judge_product(product, product_url, config)
+
+        print("-> 商品データ(JSON)が見つからないため、画面表示から判定します。")
+        return _find_target_product_by_dom(driver, config)
+
+    except Exception as e:
+        print(f"商品チェック中に予期せぬエラーが発生しました: {e}")
+        screenshots.capture(driver, config['ss_error_path'])
+        return None
+
+def _find_target_product_by_dom(driver, config):
+    """
+    (フォールバック) 人間の操作に近い手順で在庫を判定する。
+    """
+    product_url = config['target_product_url']
+    
+    try:
+        # --- 在庫状況を確認 ---
         try:
             body_text = driver.find_element(By.TAG_NAME, "body").text
             sold_out_keywords = ["売り切れ", "販売期間外", "販売期間が終了しました", "在庫切れ", "再入荷お知らせ"]
@@ -46,48 +77,25 @@ def find_target_product(driver, config):
         except Exception:
             pass
 
-        buy_button = None
-        buy_button_selectors = [
-            "#AddToCartPurchaseButtonFixed button[aria-label='かごに追加']",
-            "button[aria-label='かごに追加']",
-            "button.b-cart-btn",
-            "button[aria-label='購入手続きへ']"
-        ]
-
-        for selector in buy_button_selectors:
-            try:
-                temp_button = WebDriverWait(driver, 3).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                )
-                driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", temp_button)
-                time.sleep(0.5)
-                buy_button = wait.until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                )
-                if buy_button:
-                    print(f"-> 在庫を確認しました。（購入可能ボタンを発見: {selector}）")
-                    break
-            except TimeoutException:
-                continue
+        # 購入ボタンの候補 (selector_registry の product.buy_button) を1回の検索でまとめて調べる
+        buy_button = registry.find(driver, 'product', 'buy_button', timeout=config['wait_timeout'])
+        if buy_button:
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", buy_button)
+            print("-> 在庫を確認しました。（購入可能ボタンを発見）")
 
         if not buy_button:
             print("-> 在庫がありません。（購入ボタンがクリック不可能な状態です）")
-            driver.save_screenshot(config['ss_error_path'])
-            print(f"  デバッグ用のスクリーンショットを '{config['ss_error_path']}' として保存しました。")
+            screenshots.capture(driver, config['ss_error_path'])
+            print(f"  デバッグ用のスクリーンショットを '{config['ss_error_path']}' として保存します。")
             return None
 
         # --- STEP 3: 価格と商品名を取得 (複数セレクタ対応) ---
-        name_selectors = ["#item-name-area span.normal_reserve_item_name", "h1.item_name"]
-        price_selectors = ["#itemPrice div.number--50WuC", "span.price2", "span.sale_price"]
-
-        # (修正) ヘルパー関数に wait オブジェクトではなく driver オブジェクトを渡す
-        name_element = _find_element_with_multiple_selectors(driver, name_selectors)
+        name_element = registry.find(driver, 'product', 'name', timeout=2)
         if not name_element:
             raise Exception("商品名が見つかりませんでした。")
         product_name = name_element.text.strip()
 
-        # (修正) ヘルパー関数に wait オブジェクトではなく driver オブジェクトを渡す
-        price_element = _find_element_with_multiple_selectors(driver, price_selectors)
+        price_element = registry.find(driver, 'product', 'price', timeout=2)
         if not price_element:
             raise Exception("価格が見つかりませんでした。")
         price_text = price_element.text
@@ -110,9 +118,22 @@ def find_target_product(driver, config):
 
     except Exception as e:
         print(f"商品チェック中に予期せぬエラーが発生しました: {e}")
-        driver.save_screenshot(config['ss_error_path'])
+        screenshots.capture(driver, config['ss_error_path'])
         return None
     
+# 商品ページのHTMLから、APIデータのscriptタグの開始部分を探す (DOMは構築しない)
+_APP_DATA_TAG = re.compile(r'<script[^>]*\bid=["\']item-page-app-data["\'][^>]*>', re.IGNORECASE)
+
+def slice_app_data(html):
+    """HTML文字列から <script id="item-page-app-data"> の中身だけを切り出す"""
+    match = _APP_DATA_TAG.search(html)
+    if not match:
+        return None
+    end = html.find('</script>', match.end())
+    if end == -1:
+        return None
+    return html[match.end():end]
+
 def extract_cart_form_data(driver):
     """
     (最終強化版) 商品ページのJSONデータを解析し、APIリクエストデータを生成する。
@@ -127,16 +148,106 @@ def extract_cart_form_data(driver):
             return None
 
         json_text = script_elem.get_attribute("innerHTML")
-        data = json.loads(json_text)
-        
+        return build_cart_form_data(json.loads(json_text))
+
+    except Exception as e:
+        print(f"データ抽出中に予期せぬエラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc() # 詳細エラーを出力
+        return None
+
+def fetch_cart_form_data(session, product_url, headers=None):
+    """
+    (HTTP版) ログイン済みの requests.Session で商品ページのHTMLを取得し、
+    APIデータのscriptタグだけを切り出して extract_cart_form_data と同じ形式で返す。
+    ブラウザでページを描画しないため、数十ミリ秒で取得・再取得できる。
+    """
+    try:
+        response = session.get(product_url, headers=headers, timeout=10)
+        if response.status_code != 200:
+            print(f"エラー: 商品ページの取得に失敗しました (HTTP {response.status_code})。")
+            return None
+
+        json_text = slice_app_data(response.text)
+        if json_text is None:
+            print("エラー: 商品データ(item-page-app-data)が見つかりません。")
+            return None
+        return build_cart_form_data(json.loads(json_text))
+
+    except Exception as e:
+        print(f"商品ページ(HTTP)の解析中にエラーが発生しました: {e}")
+        return None
+
+def get_sku_info(data):
+    """item-page-app-data のJSONから itemInfoSku を探して返す (見つからなければ空の辞書)"""
+    sku_info = data.get("newApi", {}).get("itemInfoSku", {})
+    if not sku_info:
+        sku_info = data.get("api", {}).get("data", {}).get("itemInfoSku", {})
+    return sku_info or {}
+
+def evaluate_product(data, max_price=None):
+    """
+    item-page-app-data のJSONを1回走査し、商品名・価格・SKUごとの在庫と購入可否をまとめて返す。
+    max_price を渡すと、在庫ありかつ上限価格以下のSKUがあるかを 'purchasable' に反映する。
+    JSONに商品情報がない場合は None を返す。
+    """
+    sku_info = get_sku_info(data)
+    if not sku_info:
+        return None
+
+    skus = []
+    for s in sku_info.get("sku", []) or []:
+        purchase_sku = s.get("newPurchaseSku", {}) or {}
+        quantity = purchase_sku.get("quantity")
+        price = s.get("taxIncludedPrice", purchase_sku.get("price"))
+        stock_condition = purchase_sku.get("stockCondition", "")
+        skus.append({
+            'variant_id': s.get("variantId"),
+            'label': " ".join(s.get("selectorValues", [])),
+            'price': int(price) if price is not None else None,
+            'stock_condition': stock_condition,
+            'quantity': quantity,
+            # 在庫あり条件 (売り切れでなく、かつ 数量がNoneまたは1以上)
+            'in_stock': stock_condition != "sold-out" and (quantity is None or quantity > 0),
+        })
+
+    in_stock_skus = [s for s in skus if s['in_stock']]
+    prices = [s['price'] for s in (in_stock_skus or skus) if s['price'] is not None]
+    price = min(prices) if prices else None
+    affordable = [s for s in in_stock_skus if max_price is None or s['price'] is None or s['price'] <= max_price]
+    # カート追加APIに必要なIDがそろっているか
+    cart_addable = bool(sku_info.get("shopId") and sku_info.get("itemId"))
+
+    return {
+        'name': sku_info.get("title") or sku_info.get("itemName", ""),
+        'price': price,
+        'skus': skus,
+        # SKU情報のない商品は在庫不明 (None) とし、判定はカート追加APIに任せる
+        'in_stock': bool(in_stock_skus) if skus else None,
+        'cart_addable': cart_addable,
+        'purchasable': cart_addable and (bool(affordable) if skus else
+                                         (max_price is None or price is None or price <= max_price)),
+    }
+
+def _matches_preference(sku, keyword):
+    """SKUが希望の文言 (バリエーション名の一部、または variantId) に一致するか"""
+    return keyword == sku.get("variantId") or keyword in " ".join(sku.get("selectorValues", []))
+
+def build_cart_form_data(data, sku_preference=None, units=1, interactive=True):
+    """
+    item-page-app-data のJSONから、カート追加APIのURLと送信データを組み立てる。
+    sku_preference (希望するバリエーション名/variantId のリスト、先頭ほど優先) を渡すと、
+    一致する在庫ありのSKUを選ぶ。interactive が False の場合は入力を求めず、先頭の候補を選ぶ。
+    戻り値の "product" には evaluate_product の結果、"sku" には選んだSKUの評価結果 (SKUがない商品は None)、
+    "price" には選んだSKUの価格が入る。
+    """
+    try:
         # データの位置を探索
-        sku_info = data.get("newApi", {}).get("itemInfoSku", {})
-        if not sku_info:
-            sku_info = data.get("api", {}).get("data", {}).get("itemInfoSku", {})
-            
+        sku_info = get_sku_info(data)
         if not sku_info:
             print("エラー: JSONデータから商品情報(itemInfoSku)が見つかりませんでした。")
             return None
+        product = evaluate_product(data)
 
         # 1. 基本ID
         shop_id = sku_info.get("shopId")
@@ -156,7 +267,7 @@ def extract_cart_form_data(driver):
         form_data = {
             "shopid": shop_id,
             "itemid": item_id,
-            "units": "1", 
+            "units": str(units),
             "device": "pc",
             "userid": "itempage",
             "response_encode": "utf8"
@@ -165,6 +276,7 @@ def extract_cart_form_data(driver):
         # --- 3. SKU (バリエーション) の収集と選択 ---
         sku_list = sku_info.get("sku", [])
         target_variant_id = None
+        target_sku = None
         
         # 単一商品かバリエーション商品かを判断
         inventory_type = sku_info.get("inventoryType", "normal") # "normal" or "multiple"
@@ -177,15 +289,7 @@ def extract_cart_form_data(driver):
         
         else:
             # SKUリストがある場合の処理
-            candidate_skus = []
-            for s in sku_list:
-                purchase_sku = s.get("newPurchaseSku", {})
-                stock_cond = purchase_sku.get("stockCondition", "")
-                qty = purchase_sku.get("quantity")
-                
-                # 在庫あり条件 (売り切れでなく、かつ 数量がNoneまたは1以上)
-                if stock_cond != "sold-out" and (qty is None or qty > 0):
-                    candidate_skus.append(s)
+            candidate_skus = [s for s, entry in zip(sku_list, product['skus']) if entry['in_stock']]
             
             # 在庫ありが見つからない場合は全商品を候補にする（販売前対策）
             if not candidate_skus:
@@ -193,7 +297,16 @@ def extract_cart_form_data(driver):
                 candidate_skus = sku_list
 
             # 候補からの選択処理
-            if len(candidate_skus) == 1:
+            if sku_preference:
+                # 希望の順に、一致する候補を探す
+                target_sku = next((s for keyword in sku_preference for s in candidate_skus
+                                   if _matches_preference(s, keyword)), None)
+                if not target_sku:
+                    print(f"⚠️ 希望のSKU ({', '.join(sku_preference)}) が候補にありません。")
+                    return None
+                print(f"ℹ️ 希望のSKUを選択しました: {' '.join(target_sku.get('selectorValues', [])) or target_sku.get('variantId')}")
+                target_variant_id = target_sku.get("variantId")
+            elif len(candidate_skus) == 1 or not interactive:
                 s = candidate_skus[0]
                 # selectorValuesが空の場合は説明なしになる
                 desc = " ".join(s.get("selectorValues", []))
@@ -201,6 +314,7 @@ def extract_cart_form_data(driver):
                 
                 print(f"ℹ️ 対象SKUを自動選択しました: {desc}")
                 target_variant_id = s.get("variantId")
+                target_sku = s
             else:
                 # 複数ある場合はユーザー選択
                 print("\n" + "="*60)
@@ -224,7 +338,8 @@ def extract_cart_form_data(driver):
                     try:
                         idx = int(user_input)
                         if 0 <= idx < len(candidate_skus):
-                            target_variant_id = candidate_skus[idx].get("variantId")
+                            target_sku = candidate_skus[idx]
+                            target_variant_id = target_sku.get("variantId")
                             print(f"\n✅ 選択しました: ID {target_variant_id}")
                             break
                         else:
@@ -254,9 +369,13 @@ def extract_cart_form_data(driver):
 
         # 結果確認ログ
         print(f"APIデータ構築完了: {action_url}")
+        sku_entry = next((entry for s, entry in zip(sku_list or [], product['skus']) if s is target_sku), None)
         return {
             "url": action_url,
-            "data": form_data
+            "data": form_data,
+            "sku": sku_entry,
+            "product": product,
+            "price": sku_entry['price'] if sku_entry else product['price'],
         }
 
     except Exception as e:
@@ -1,170 +1,151 @@
 import time
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from tracer import tracer
+from selector_registry import registry
+from screenshot_service import screenshots
+from page_readiness import mark_current_page, wait_until_ready
+from sudo_session import sudo_session
 
-def _click_if_exists(driver, by, selector, description):
+# 画面状態の判定に使う要素 (先にあるものほど優先。セレクタは selector_registry で管理)
+CHECKOUT_STATES = ['commit', 'next', 'login_id', 'login_password']
+
+# DOMの変化またはページ遷移が起きるまで (最大 arguments[0] ミリ秒) 待つ。
+# arguments[1] に要素を渡した場合は、その要素がDOMから外れるか非表示になるまで待つ (二重クリック防止)。
+_WAIT_FOR_CHANGE_JS = """
+var timeout = arguments[0], target = arguments[1], done = arguments[arguments.length - 1];
+var observer = new MutationObserver(function () {
+    if (target && document.contains(target) && target.getClientRects().length > 0) return;
+    observer.disconnect(); done(true);
+});
+observer.observe(document, {childList: true, subtree: true, attributes: true});
+setTimeout(function () { observer.disconnect(); done(false); }, timeout);
+"""
+
+def _wait_for_page_change(driver, timeout_ms, clicked_element=None):
     """
-    要素が存在し、表示されていればクリックするヘルパー関数
+    固定の sleep の代わりに、DOMの変化・ページ遷移をイベントで待つ。
+    遷移によってスクリプトが中断された場合も「変化あり」とみなす。
     """
     try:
-        elements = driver.find_elements(by, selector)
-        for element in elements:
-            if element.is_displayed() and element.is_enabled():
-                # 重なり防止のためJavaScriptでクリック
-                driver.execute_script("arguments[0].click();", element)
-                print(f"-> 「{description}」をクリックしました。")
-                return True
-    except Exception:
-        pass
-    return False
+        return driver.execute_async_script(_WAIT_FOR_CHANGE_JS, timeout_ms, clicked_element)
+    except WebDriverException:
+        return True
+
+def _click_element(driver, element, description):
+    """プローブが返した要素をJavaScriptでクリックする"""
+    try:
+        driver.execute_script("arguments[0].click();", element)
+        print(f"-> 「{description}」をクリックしました。")
+        return True
+    except WebDriverException:
+        return False
 
 def purchase_from_cart(driver, config):
     """
-    (高速版専用) 買い物かご以降のフローを動的に判定して実行する。
-    URLと画面要素の両方を見て、最適なアクションを行う。
+    (高速版専用) 買い物かご以降のフローを画面状態の遷移として実行する。
+    1回のプローブで「今どの画面か」と操作対象の要素を取得し、
+    操作後はDOMの変化・ページ遷移のイベントを待ってから次の状態を判定する。
     """
     wait_timeout = config.get('wait_timeout', 20)
-    wait = WebDriverWait(driver, wait_timeout)
-    
+
     try:
         # --- STEP 1: 買い物かごページで「購入手続き」ボタンをクリック ---
         print("[PURCHASE-STEP 1] 買い物かごページで「購入手続き」ボタンを探します...")
-        
-        cart_btn_selectors = [
-            (By.CSS_SELECTOR, "button[aria-label='購入手続き']"),
-            (By.CSS_SELECTOR, "button[aria-label='ご購入手続き']"),
-            (By.XPATH, "//button[contains(., '購入手続き')]"), # テキスト検索追加
-            (By.CSS_SELECTOR, "input.purchaseButton")
-        ]
-        
-        clicked_cart = False
-        for by, selector in cart_btn_selectors:
-            if _click_if_exists(driver, by, selector, "購入手続き"):
-                clicked_cart = True
-                break
-        
-        if not clicked_cart:
-            try:
-                # 少し待ってから再試行
-                btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[aria-label='購入手続き'], input.purchaseButton")))
-                driver.execute_script("arguments[0].click();", btn)
-                print("-> 「購入手続き」ボタンをクリックしました (Wait後)。")
-            except TimeoutException:
-                raise Exception("買い物かごの「購入手続き」ボタンが見つかりませんでした。")
-
-        # --- STEP 2 ～ 3: 遷移先に応じた動的対応 (ループ処理) ---
+
+        with tracer.span('cart_page'):
+            cart_end_time = time.time() + wait_timeout
+            while True:
+                probe = registry.probe(driver, 'cart', ['purchase_button'])
+                if probe['state'] == 'purchase_button' and _click_element(driver, probe['element'], "購入手続き"):
+                    _wait_for_page_change(driver, 2000, probe['element'])
+                    break
+                if time.time() >= cart_end_time:
+                    raise Exception("買い物かごの「購入手続き」ボタンが見つかりませんでした。")
+                _wait_for_page_change(driver, 500)
+        tracer.instant('cart_to_next', url=probe['url'])
+
+        # --- STEP 2 ～ 3: 遷移先に応じた動的対応 (状態遷移) ---
         print("\n[PURCHASE-STEP 2-3] ページ遷移を監視し、適切なアクションを実行します...")
-        
+
         # 最大試行時間
-        end_time = time.time() + 60 
-        
+        end_time = time.time() + 60
+
         while time.time() < end_time:
-            # 現在のURLを取得して、ある程度の位置を推測する
-            current_url = driver.current_url
-            
+            probe = registry.probe(driver, 'checkout', CHECKOUT_STATES)
+            state, element, current_url = probe['state'], probe['element'], probe['url']
+            clicked = None
+
             # エラー画面に到達していないかチェック
             if "error" in current_url:
                 print("⚠️ エラー画面を検出しました。処理を中断する可能性があります。")
-            
-            # ---------------------------------------------------
-            # 1. 最終確認画面 (注文確定) の判定
-            # ---------------------------------------------------
-            # URLに 'confirm' が含まれるか、確定ボタンがあるか
-            commit_selectors = [
-                (By.CSS_SELECTOR, "button[aria-label='注文を確定する']"),
-                (By.XPATH, "//button[contains(., '注文を確定する')]"), # テキスト検索追加
-                (By.CSS_SELECTOR, "input[name='commit']"),
-                (By.ID, "commit")
-            ]
-            
-            for by, sel in commit_selectors:
-                if _click_if_exists(driver, by, sel, "注文を確定する"):
+
+            if state == 'commit':
+                # 最終確認画面 (注文確定)
+                # クリック前のページに目印を付け、完了ページへの遷移をイベントで判定できるようにする
+                mark_current_page(driver)
+                if _click_element(driver, element, "注文を確定する"):
                     print("-> 最終確認画面でボタンを押下しました。完了を待ちます。")
-                    
+                    tracer.instant('confirm_commit_clicked', url=current_url)
+
                     # ダミーモード確認
                     if not config.get('auto_purchase', False):
                         print("【ダミーモード】実際には注文しませんでした。")
                         return True, "【ダミーモード】最終確認ページ到達成功"
 
-                    time.sleep(3)
-                    driver.save_screenshot(config['ss_success_path'])
-                    print(f"-> 完了時のスクリーンショットを保存しました: {config['ss_success_path']}")
+                    with tracer.span('commit'):
+                        # 固定の sleep ではなく、完了ページ (新しいページ) の表示を待ってから撮影する
+                        if not wait_until_ready(driver, 'order_complete', 10):
+                            print("⚠️ 完了ページへの遷移を確認できないまま撮影します。")
+                        screenshots.capture(driver, config['ss_success_path'])
+                    print(f"-> 完了時のスクリーンショットを保存します: {config['ss_success_path']}")
                     return True, "自動購入処理が完了しました！"
 
-            # ---------------------------------------------------
-            # 2. 届け先指定画面 (スキップ) の判定
-            # ---------------------------------------------------
-            # URLに 'shipping' が含まれるか、次へボタンがあるか
-            next_selectors = [
-                (By.CSS_SELECTOR, "button[aria-label='次へ']"),
-                (By.XPATH, "//button[contains(., '次へ')]"), # テキスト検索追加
-                (By.CSS_SELECTOR, "input[value='次へ']")
-            ]
-            
-            for by, sel in next_selectors:
-                if _click_if_exists(driver, by, sel, "次へ（届け先指定）"):
-                    time.sleep(0.2) # 遷移待ち
-                    continue # ループ先頭へ戻る
-
-            # ---------------------------------------------------
-            # 3. ログイン画面 (ID/パスワード入力) の判定
-            # ---------------------------------------------------
-            # パスワード入力欄が見えているか確認
-            try:
-                # ID入力欄がある場合 (IDから求められるパターン)
-                user_ids = driver.find_elements(By.ID, "user_id")
-                if user_ids and user_ids[0].is_displayed():
-                    print("-> ログイン画面(ID入力)を検出。")
-                    user_ids[0].clear()
-                    user_ids[0].send_keys(config['login_id'])
-                    _click_if_exists(driver, By.ID, "cta001", "次へ(ログインID)")
-                    time.sleep(0.2)
-                    continue
+            elif state == 'next':
+                # 届け先指定画面 (スキップ)
+                if _click_element(driver, element, "次へ（届け先指定）"):
+                    tracer.instant('shipping_next_clicked', url=current_url)
+                    clicked = element
 
-                # パスワード入力欄がある場合
-                pws = driver.find_elements(By.CSS_SELECTOR, "input[type='password']")
-                target_pw = None
-                for pw in pws:
-                    if pw.is_displayed():
-                        target_pw = pw
-                        break
-                
-                if target_pw:
-                    print("-> ログイン画面(パスワード入力)を検出。")
-                    target_pw.clear()
-                    target_pw.send_keys(config['password'])
-                    
-                    # ログインボタン候補 (新旧網羅)
-                    login_btn_selectors = [
-                        (By.ID, "cta011"),
-                        (By.ID, "login_submit"),
-                        (By.XPATH, "//button[contains(., 'ログイン')]"),
-                        (By.CSS_SELECTOR, "input[type='submit']")
-                    ]
-                    
-                    for by, sel in login_btn_selectors:
-                        if _click_if_exists(driver, by, sel, "ログイン実行"):
-                            break
-                    time.sleep(0.2)
+            elif state == 'login_id':
+                # ログイン画面 (IDから求められるパターン)
+                print("-> ログイン画面(ID入力)を検出。")
+                sudo_session.record_login_prompt('id', current_url)
+                try:
+                    element.clear()
+                    element.send_keys(config['login_id'])
+                except WebDriverException:
                     continue
+                button = registry.find(driver, 'login', 'id_next')
+                if button is not None:
+                    _click_element(driver, button, "次へ(ログインID)")
+                clicked = element
 
-            except Exception:
-                pass
+            elif state == 'login_password':
+                # ログイン画面 (パスワード入力)
+                print("-> ログイン画面(パスワード入力)を検出。")
+                sudo_session.record_login_prompt('password', current_url)
+                try:
+                    element.clear()
+                    element.send_keys(config['password'])
+                except WebDriverException:
+                    continue
+                clicked = element
+                button = registry.find(driver, 'login', 'submit')
+                if button is not None:
+                    _click_element(driver, button, "ログイン実行")
 
-            # 少し待機して再監視 (高速化のため0.1秒)
-            time.sleep(0.1)
+            # 次の画面への変化をイベントで待ってから再判定 (クリック後は遷移完了まで)
+            _wait_for_page_change(driver, 2000 if clicked else 500, clicked)
 
         raise TimeoutException("最終確認画面または次のアクションが見つからないままタイムアウトしました。")
 
     except Exception as e:
         error_msg = f"購入処理中にエラーが発生しました: {e}"
         print(error_msg)
-        driver.save_screenshot(config['ss_error_path'])
+        screenshots.capture(driver, config['ss_error_path'])
         return False, error_msg
     finally:
         try:
             driver.switch_to.default_content()
         except Exception:
-            pass
\ No newline at end of file
+            pass
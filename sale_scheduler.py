@@ -0,0 +1,163 @@
+# sale_scheduler.py
+import threading
+import time
+from datetime import datetime, timedelta
+from tracer import tracer
+
+# 指定時刻を過ぎてからこの秒数以内であれば「今日の販売」とみなし、即座に発火する
+ROLLOVER_GRACE_SECONDS = 60
+
+# 発火ごとの記録 (目標時刻からの遅延を後から確認するため)。report_firing_records() で表示する
+firing_records = []
+_send_lock = threading.Lock()
+
+def resolve_sale_datetime(sale_time, now=None, allow_rollover=True):
+    """
+    販売開始時刻(time または 'HH:MM:SS')から、実際に発火する日時を決定する。
+    日付を跨ぐ場合 (例: 23:59 に起動して 00:00:00 販売) は翌日の日時を返す。
+    """
+    if isinstance(sale_time, str):
+        sale_time = datetime.strptime(sale_time.strip('"\''), "%H:%M:%S").time()
+    now = now or datetime.now()
+    sale_datetime = datetime.combine(now.date(), sale_time)
+
+    if allow_rollover and (now - sale_datetime).total_seconds() > ROLLOVER_GRACE_SECONDS:
+        sale_datetime += timedelta(days=1)
+    return sale_datetime
+
+def wait_until(target_datetime, lead_ms=0, spin_ms=20, label="販売開始", clock_offset=0.0,
+               on_approach=None, approach_seconds=2.0, reschedule=None, reschedule_interval=1.0):
+    """
+    モノトニッククロックで目標時刻まで待機する。
+    残り時間が spin_ms を切るまでは粗い sleep を行い、最後の数ミリ秒だけビジーループで待つ。
+    壁時計の変更 (NTP補正など) の影響を受けない。
+
+    :param target_datetime: 目標の日時 (ローカル時計基準)
+    :param lead_ms: 目標時刻より何ミリ秒早く発火するか (送信遅延の補正用)
+    :param spin_ms: 最後にビジーループで待つ時間(ミリ秒)
+    :param clock_offset: サーバー時計 - ローカル時計 (秒)。正ならローカルが遅れている。
+    :param on_approach: 残り approach_seconds 秒を切った時点で一度だけ呼ぶ関数 (発火直前の最終準備用)。
+                        スピン開始までの残り秒数を引数に渡すので、その時間内に終えること。
+                        スピン開始に間に合わなかった場合は、超過分を記録の approach_overrun_ms に残す
+    :param reschedule: 残り approach_seconds 秒を切るまで reschedule_interval 秒ごとに呼ぶ関数。
+                       (新しい目標日時, lead_ms) を返した場合は、その時刻に向けて待機し直す (変更なしは None)
+    :return: 発火記録の辞書 (late_ms は目標からの遅延ミリ秒、approach_overrun_ms は最終準備の超過ミリ秒)
+    """
+    def to_deadline(target, lead):
+        # 壁時計との対応付けは目標が決まった時だけ行い、以降はモノトニッククロックのみを使う
+        return time.monotonic() + (target - datetime.now()).total_seconds() - clock_offset - lead / 1000.0
+
+    deadline = to_deadline(target_datetime, lead_ms)
+    spin_window = spin_ms / 1000.0
+    next_reschedule = time.monotonic() + reschedule_interval
+    approach_overrun_ms = 0.0
+
+    while True:
+        left = deadline - time.monotonic()
+        if reschedule and left > approach_seconds and time.monotonic() >= next_reschedule:
+            next_reschedule = time.monotonic() + reschedule_interval
+            updated = reschedule()
+            if updated:
+                target_datetime, lead_ms = updated
+                deadline = to_deadline(target_datetime, lead_ms)
+                continue
+        if on_approach and left <= approach_seconds:
+            on_approach(max(0.0, left - spin_window))
+            on_approach = None
+            approach_overrun_ms = max(0.0, (time.monotonic() - (deadline - spin_window)) * 1000.0)
+            if approach_overrun_ms > 0:
+                print(f"⚠️ [{label}] 発火直前の準備がスピン開始を {approach_overrun_ms:.1f} ms 超過しました。")
+            continue
+        if left <= spin_window:
+            break
+        # 次に起きるべき残り時間 (最終準備のタイミング、またはスピン開始)
+        wake_at = approach_seconds if on_approach else spin_window
+        # 残り時間の半分ずつ眠ることで、sleep の寝過ごしをスピン区間内に収める
+        nap = min(left - wake_at, max(left / 2, 0.001))
+        if reschedule and left > approach_seconds:
+            nap = min(nap, reschedule_interval)  # 設定の変更を定期的に確認する
+        time.sleep(nap)
+
+    while time.monotonic() < deadline:
+        pass
+
+    fired = time.monotonic()
+    record = {
+        'label': label,
+        'target': target_datetime,
+        'lead_ms': lead_ms,
+        'clock_offset_ms': clock_offset * 1000.0,
+        'late_ms': (fired - deadline) * 1000.0,
+        'approach_overrun_ms': approach_overrun_ms,
+        'fired_at': datetime.now(),
+        # 販売開始の瞬間 (前倒し分を戻した、サーバー時計基準の T0) のモノトニック時刻
+        't0_monotonic': deadline + lead_ms / 1000.0,
+    }
+    firing_records.append(record)
+    tracer.instant('t0_fire', label=label, late_ms=record['late_ms'], lead_ms=lead_ms,
+                   clock_offset_ms=record['clock_offset_ms'], approach_overrun_ms=approach_overrun_ms)
+    print(f"[{label}] 発火 {record['fired_at'].strftime('%H:%M:%S.%f')} (目標からの遅延: {record['late_ms']:.3f} ms)")
+    return record
+
+def record_send(path):
+    """
+    販売開始の待機後、最初のリクエスト (cartAdd の送信・「かごに追加」のクリック) を実際に送る直前に呼ぶ。
+    直近の wait_for_sale_time の記録に、T0 からの送信時刻 (send_ms。負なら T0 より前) を残す。
+    2回目以降の送信 (再送・もう一方の経路) や、販売開始の待機をしていない送信では何もしない。
+    """
+    now = time.monotonic()
+    with _send_lock:
+        if not firing_records or 'send_ms' not in firing_records[-1] or firing_records[-1]['send_ms'] is not None:
+            return
+        record = firing_records[-1]
+        record['send_ms'] = (now - record['t0_monotonic']) * 1000.0
+        record['send_path'] = path
+    tracer.instant('t0_send', label=record['label'], path=path, send_ms=record['send_ms'])
+    print(f"[{record['label']}] 送信 ({path}): T0 {record['send_ms']:+.3f} ms")
+
+def report_firing_records():
+    """発火ごとの、目標時刻からの遅延と実際の送信時刻を表示する (終了時の確認用)"""
+    if not firing_records:
+        return
+    print("\n--- 発火の記録 (T0 = 販売開始時刻) ---")
+    for record in firing_records:
+        send = record.get('send_ms')
+        send_text = f" / 送信 T0 {send:+.3f} ms ({record['send_path']})" if send is not None else ""
+        print(f"  [{record['label']}] {record['target'].strftime('%H:%M:%S')} 発火の遅延 {record['late_ms']:.3f} ms"
+              f" (前倒し {record['lead_ms']} ms, 時計補正 {record['clock_offset_ms']:+.1f} ms,"
+              f" 準備の超過 {record['approach_overrun_ms']:.1f} ms){send_text}")
+
+def wait_for_sale_time(config, sale_time, label="販売開始", clock_offset=0.0, on_approach=None, watcher=None):
+    """
+    config の設定 (FireLeadMilliseconds, SpinWindowMilliseconds, SaleDayRollover) に従い、
+    販売開始時刻まで待機する。fast_monitor の各待機処理から共通で使う。
+    watcher (ConfigWatcher) を渡すと、待機中に変更された SaleStartTime / FireLeadMilliseconds を反映する。
+    """
+    allow_rollover = config.get('sale_day_rollover', True)
+    sale_datetime = resolve_sale_datetime(sale_time, allow_rollover=allow_rollover)
+    print(f"販売開始時刻: {sale_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    reschedule = None
+    if watcher:
+        def reschedule():
+            changes = watcher.check()
+            if 'sale_start_time' not in changes and 'fire_lead_ms' not in changes:
+                return None
+            target = resolve_sale_datetime(config['sale_start_time'], allow_rollover=allow_rollover)
+            print(f"-> 販売開始時刻を再設定しました: {target.strftime('%Y-%m-%d %H:%M:%S')} "
+                  f"(前倒し {config.get('fire_lead_ms', 0)} ms)")
+            return target, config.get('fire_lead_ms', 0)
+
+    record = wait_until(
+        sale_datetime,
+        lead_ms=config.get('fire_lead_ms', 0),
+        spin_ms=config.get('spin_window_ms', 20),
+        label=label,
+        clock_offset=clock_offset,
+        on_approach=on_approach,
+        approach_seconds=config.get('armed_finalize_seconds', 2.0),
+        reschedule=reschedule,
+    )
+    # 販売開始の待機の後は、最初の送信時刻を record_send() で記録する
+    record['send_ms'] = None
+    return record
@@ -0,0 +1,92 @@
+# screenshot_service.py
+import base64
+import os
+import queue
+import threading
+from selenium.common.exceptions import WebDriverException
+
+# 保存先の拡張子 -> DevTools の画像形式
+_FORMATS = {'.png': 'png', '.jpg': 'jpeg', '.jpeg': 'jpeg', '.webp': 'webp'}
+
+class ScreenshotService:
+    """
+    スクリーンショットを DevTools (Page.captureScreenshot) で取得する。
+    表示中の範囲だけを縮小・JPEG等の軽い形式で取り出し、デコードと書き込みはワーカースレッドで行う。
+    driver.save_screenshot のように、PNGの生成と書き込みの完了を待たずに次の処理へ進める。
+    """
+
+    def __init__(self, scale=0.5, quality=70):
+        self.scale = scale
+        self.quality = quality
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = {}  # 保存先 -> 書き込み完了の Event
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='screenshot', daemon=True)
+                self._thread.start()
+
+    def capture(self, driver, path):
+        """
+        現在の画面を取得して保存を予約し、すぐに戻る。
+        形式は保存先の拡張子で決まる (.jpg/.jpeg/.webp は品質 quality で圧縮)。
+        :return: 保存先のパス (取得に失敗した場合は None)
+        """
+        image_format = _FORMATS.get(os.path.splitext(path)[1].lower(), 'png')
+        params = {'format': image_format}
+        if image_format != 'png':
+            params['quality'] = self.quality
+        try:
+            metrics = driver.execute_cdp_cmd('Page.getLayoutMetrics', {})
+            viewport = metrics.get('cssLayoutViewport') or metrics['layoutViewport']
+            params['clip'] = {
+                'x': viewport['pageX'], 'y': viewport['pageY'],
+                'width': viewport['clientWidth'], 'height': viewport['clientHeight'],
+                'scale': self.scale,
+            }
+            data = driver.execute_cdp_cmd('Page.captureScreenshot', params)['data']
+        except (WebDriverException, KeyError) as e:
+            print(f"⚠️ スクリーンショットの取得に失敗しました: {e.__class__.__name__}")
+            return None
+
+        done = threading.Event()
+        with self._lock:
+            self._pending[path] = done
+        self._queue.put((path, data, done))
+        self._ensure_worker()
+        return path
+
+    def _run(self):
+        while True:
+            path, data, done = self._queue.get()
+            try:
+                # 書きかけのファイルを通知で送らないよう、一時ファイルに書いてから置き換える
+                temp_path = f"{path}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(base64.b64decode(data))
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"⚠️ スクリーンショットの保存に失敗しました ({path}): {e}")
+            finally:
+                done.set()
+                with self._lock:
+                    if self._pending.get(path) is done:
+                        del self._pending[path]
+                self._queue.task_done()
+
+    def wait(self, path, timeout=5):
+        """指定のファイルの書き込みが予約されていれば、完了まで最大 timeout 秒待つ"""
+        with self._lock:
+            done = self._pending.get(path)
+        return done.wait(timeout) if done else True
+
+    def flush(self, timeout=5):
+        """予約済みの書き込みがすべて終わるまで、最大 timeout 秒待つ"""
+        with self._lock:
+            pending = list(self._pending.values())
+        return all(done.wait(timeout) for done in pending)
+
+screenshots = ScreenshotService()
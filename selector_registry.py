@@ -0,0 +1,235 @@
+# selector_registry.py
+import json
+import sys
+import threading
+import time
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
+
+# --- ページ・要素ごとのセレクタ候補 (上にあるものほど既定の優先度が高い) ---
+# 実行時は、過去にヒットした回数の多い順に並べ替えてから試す。
+SELECTORS = {
+    'product': {
+        # 「かごに追加」ボタン (販売時刻のUIクリック用)
+        'add_to_cart': [
+            (By.XPATH, "//span[contains(text(), 'かごに追加')]/ancestor::button"),
+            (By.XPATH, "//button[contains(., 'かごに追加')]"),
+        ],
+        # 改行コードに強い「商品をかごに追加しました」ポップアップ。
+        # 文言を含む最も内側の要素 (= ポップアップ本体) だけを対象にし、表示されているかはプローブで判定する
+        # (祖先の <html> や <body> も非表示の文言を含むため、そのままでは常に一致してしまう)
+        'cart_added_popup': [
+            (By.XPATH, "//*[contains(., '商品をかごに') and contains(., '追加しました')"
+                       " and not(*[contains(., '商品をかごに') and contains(., '追加しました')])]"),
+        ],
+        # 在庫判定用の購入ボタン
+        'buy_button': [
+            (By.CSS_SELECTOR, "#AddToCartPurchaseButtonFixed button[aria-label='かごに追加']"),
+            (By.CSS_SELECTOR, "button[aria-label='かごに追加']"),
+            (By.CSS_SELECTOR, "button.b-cart-btn"),
+            (By.CSS_SELECTOR, "button[aria-label='購入手続きへ']"),
+        ],
+        'name': [
+            (By.CSS_SELECTOR, "#item-name-area span.normal_reserve_item_name"),
+            (By.CSS_SELECTOR, "h1.item_name"),
+        ],
+        'price': [
+            (By.CSS_SELECTOR, "#itemPrice div.number--50WuC"),
+            (By.CSS_SELECTOR, "span.price2"),
+            (By.CSS_SELECTOR, "span.sale_price"),
+        ],
+    },
+    'cart': {
+        # 買い物かご画面の「購入手続き」ボタン
+        'purchase_button': [
+            (By.CSS_SELECTOR, "button[aria-label='購入手続き']"),
+            (By.CSS_SELECTOR, "button[aria-label='ご購入手続き']"),
+            (By.XPATH, "//button[contains(., '購入手続き')]"), # テキスト検索追加
+            (By.CSS_SELECTOR, "input.purchaseButton"),
+        ],
+    },
+    'checkout': {
+        # 1. 最終確認画面 (注文確定)
+        'commit': [
+            (By.CSS_SELECTOR, "button[aria-label='注文を確定する']"),
+            (By.XPATH, "//button[contains(., '注文を確定する')]"), # テキスト検索追加
+            (By.CSS_SELECTOR, "input[name='commit']"),
+            (By.ID, "commit"),
+        ],
+        # 2. 届け先指定画面 (スキップ)
+        'next': [
+            (By.CSS_SELECTOR, "button[aria-label='次へ']"),
+            (By.XPATH, "//button[contains(., '次へ')]"), # テキスト検索追加
+            (By.CSS_SELECTOR, "input[value='次へ']"),
+        ],
+        # 3. ログイン画面 (ID入力 → パスワード入力)
+        'login_id': [(By.ID, "user_id")],
+        'login_password': [(By.CSS_SELECTOR, "input[type='password']")],
+    },
+    'login': {
+        'user_id': [(By.ID, "user_id")],
+        'id_next': [(By.ID, "cta001")],
+        'password': [
+            (By.ID, "password_current"),
+            (By.CSS_SELECTOR, "input[type='password']"),
+        ],
+        # ログインボタン候補 (新旧網羅)
+        'submit': [
+            (By.ID, "cta011"), # 新仕様
+            (By.ID, "login_submit"), # 旧仕様
+            (By.XPATH, "//button[contains(., 'ログイン')]"),
+            (By.CSS_SELECTOR, "input[type='submit']"),
+        ],
+        # ログイン成功の証となる「会員情報」リンク
+        'member_link': [(By.CSS_SELECTOR, "a[href*='my.rakuten.co.jp']")],
+    },
+    'order_history': {
+        'password': [(By.CSS_SELECTOR, "input[type='password']")],
+        # 認証済みの購入履歴ページ固有の要素
+        'authenticated': [(By.ID, "ratAccountId")],
+    },
+}
+
+# 候補全体を1回の execute_script で調べ、最初に見つかった「表示中かつ有効」な要素を返す。
+# 候補ごとの検索時間(ミリ秒)も timings として返す。
+_PROBE_JS = """
+var candidates = arguments[0], timings = [];
+function usable(el) {
+    if (el.disabled) return false;
+    var style = window.getComputedStyle(el);
+    return style.visibility !== 'hidden' && style.display !== 'none' && el.getClientRects().length > 0;
+}
+for (var i = 0; i < candidates.length; i++) {
+    var c = candidates[i], started = performance.now(), elements = [];
+    try {
+        if (c[1] === 'xpath') {
+            var snapshot = document.evaluate(c[2], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (var j = 0; j < snapshot.snapshotLength; j++) elements.push(snapshot.snapshotItem(j));
+        } else {
+            elements = document.querySelectorAll(c[2]);
+        }
+    } catch (e) { timings.push(performance.now() - started); continue; }
+    for (var k = 0; k < elements.length; k++) {
+        if (usable(elements[k])) {
+            timings.push(performance.now() - started);
+            return {state: c[0], index: i, element: elements[k], url: location.href, timings: timings};
+        }
+    }
+    timings.push(performance.now() - started);
+}
+return {state: null, index: -1, element: null, url: location.href, timings: timings};
+"""
+
+def _key(by, selector):
+    """統計ファイルでのセレクタの表記"""
+    return f"{by}={selector}"
+
+def _to_js(by, selector):
+    """(By, セレクタ) を、プローブに渡す ['css'|'xpath', セレクタ] に変換する"""
+    if by == By.XPATH:
+        return ['xpath', selector]
+    if by == By.ID:
+        return ['css', f'[id="{selector}"]']
+    return ['css', selector]
+
+class SelectorRegistry:
+    """
+    セレクタ候補を一元管理し、候補全体を1往復で検索する。
+    セレクタごとのヒット数と検索時間を記録してファイルに保存し、次回の実行ではヒット実績の多いものから試す。
+    """
+
+    def __init__(self, stats_file='selector_stats.json'):
+        self.stats_file = stats_file
+        self._stats = None  # 初回の利用時に読み込む
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._stats is None:
+            try:
+                with open(self.stats_file, encoding='utf-8') as f:
+                    self._stats = json.load(f)
+            except (OSError, ValueError):
+                self._stats = {}
+        return self._stats
+
+    def candidates(self, page, element):
+        """セレクタ候補を、過去のヒット数が多い順 (同数なら既定の順) に並べて返す"""
+        selectors = SELECTORS[page][element]
+        with self._lock:
+            stats = self._load().get(f"{page}.{element}", {})
+            hits = [stats.get(_key(by, selector), {}).get('hits', 0) for by, selector in selectors]
+        order = sorted(range(len(selectors)), key=lambda i: -hits[i])
+        return [selectors[i] for i in order]
+
+    def _record(self, page, plan, result):
+        with self._lock:
+            stats = self._load()
+            for i, elapsed_ms in enumerate(result.get('timings') or []):
+                name, by, selector = plan[i]
+                entry = stats.setdefault(f"{page}.{name}", {}).setdefault(
+                    _key(by, selector), {'hits': 0, 'lookups': 0, 'total_ms': 0.0})
+                entry['lookups'] += 1
+                entry['total_ms'] += elapsed_ms
+                if i == result.get('index'):
+                    entry['hits'] += 1
+
+    def _run(self, driver, page, elements):
+        plan = [(name, by, selector) for name in elements for by, selector in self.candidates(page, name)]
+        try:
+            result = driver.execute_script(_PROBE_JS, [[name] + _to_js(by, selector) for name, by, selector in plan])
+        except WebDriverException:
+            # 遷移中などで取得できない場合は状態なしとする
+            result = {'state': None, 'index': -1, 'element': None, 'url': '', 'timings': []}
+        return plan, result
+
+    def probe(self, driver, page, elements):
+        """
+        elements に挙げた要素 (先にあるものほど優先) の候補全体を1回の execute_script で調べる。
+        :return: {'state': 見つかった要素名 (なければ None), 'element': WebElement, 'url': 現在のURL}
+        """
+        plan, result = self._run(driver, page, elements)
+        self._record(page, plan, result)
+        return {'state': result['state'], 'element': result['element'], 'url': result['url']}
+
+    def find(self, driver, page, element, timeout=0, poll=0.05):
+        """要素を探し、timeout 秒以内に見つからなければ None を返す"""
+        end_time = time.monotonic() + timeout
+        while True:
+            last_try = time.monotonic() >= end_time
+            plan, result = self._run(driver, page, [element])
+            # 待っている間の「見つからない」は記録せず、結果が確定した1回だけを記録する
+            if result['element'] is not None or last_try:
+                self._record(page, plan, result)
+                return result['element']
+            time.sleep(poll)
+
+    def save(self):
+        """統計をファイルに保存する"""
+        with self._lock:
+            if self._stats is None:
+                return
+            try:
+                with open(self.stats_file, 'w', encoding='utf-8') as f:
+                    json.dump(self._stats, f, ensure_ascii=False, indent=2)
+            except OSError as e:
+                print(f"⚠️ セレクタ統計の保存に失敗しました: {e}")
+
+    def report(self):
+        """ページ・要素ごとに、どのセレクタが使われているかを表示する"""
+        with self._lock:
+            stats = self._load()
+        for target in sorted(stats):
+            print(f"[{target}]")
+            entries = sorted(stats[target].items(), key=lambda kv: -kv[1]['hits'])
+            for selector, entry in entries:
+                lookups = entry['lookups'] or 1
+                print(f"  {entry['hits']:>6} ヒット / {entry['lookups']:>6} 回 ({entry['hits'] / lookups:>6.1%})"
+                      f"  平均 {entry['total_ms'] / lookups:6.2f} ms  {selector}")
+
+registry = SelectorRegistry()
+
+if __name__ == '__main__':
+    # 使い方: python selector_registry.py [selector_stats.json]
+    if len(sys.argv) > 1:
+        registry.stats_file = sys.argv[1]
+    registry.report()
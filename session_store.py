@@ -0,0 +1,185 @@
+# session_store.py
+import os
+import pickle
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.cookies import create_cookie
+
+# 保存対象とする楽天関連のドメイン
+RAKUTEN_DOMAINS = ('rakuten.co.jp', 'rakuten.com')
+
+# Network.setCookies に渡せる項目
+_COOKIE_PARAM_KEYS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires', 'priority')
+
+def _is_target_cookie(cookie, extra_hosts=()):
+    domain = cookie.get('domain', '').lstrip('.')
+    return any(domain == d or domain.endswith('.' + d) for d in RAKUTEN_DOMAINS + tuple(extra_hosts))
+
+def _is_expired(cookie, now):
+    # expires が -1 (または無し) のものはセッションCookie
+    expires = cookie.get('expires', -1)
+    return expires not in (-1, None) and expires < now
+
+def _extra_hosts(config):
+    """設定されたURLのホスト (ローカル検証用のスタンドインサーバーなど) も保存対象に含める"""
+    hosts = {urlsplit(config[key]).hostname for key in ('login_url', 'cart_url', 'order_history_url') if config.get(key)}
+    return tuple(h for h in hosts if h)
+
+def save_session(driver, config):
+    """
+    ログイン・Sudo認証後のCookieを、有効期限などの属性ごと保存する。
+    driver.get_cookies() は表示中のドメインの分しか返さないため、CDPで全ドメイン分を取得する。
+    """
+    path = config.get('session_file', 'cookies.pkl')
+    try:
+        cookies = driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']
+        cookies = [c for c in cookies if _is_target_cookie(c, _extra_hosts(config))]
+        with open(path, 'wb') as f:
+            pickle.dump({'saved_at': time.time(), 'cookies': cookies}, f)
+        print(f"🍪 ログイン状態を保存しました ({len(cookies)}件): {path}")
+    except Exception as e:
+        print(f"⚠️ ログイン状態の保存に失敗しました: {e}")
+
+def _load(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"⚠️ 保存されたログイン状態を読み込めませんでした: {e}")
+        return None
+
+def load_cookies(driver, path='cookies.pkl'):
+    """保存されたCookieを、期限切れのものを除いて1回のCDP呼び出しでブラウザに設定する"""
+    stored = _load(path)
+    if not stored:
+        return 0
+    now = time.time()
+    params = []
+    for cookie in stored['cookies']:
+        if _is_expired(cookie, now):
+            continue
+        param = {k: cookie[k] for k in _COOKIE_PARAM_KEYS if k in cookie}
+        if cookie.get('session') or param.get('expires', -1) == -1:
+            param.pop('expires', None)
+        params.append(param)
+    driver.execute_cdp_cmd('Network.setCookies', {'cookies': params})
+    print(f"🍪 保存されたクッキーを読み込みました ({len(params)}件)。")
+    return len(params)
+
+def _to_jar_cookie(cookie):
+    """CDP形式のCookieを、属性 (ドメイン・パス・secure・HttpOnly・有効期限) を保ったまま requests のCookieに変換する"""
+    domain = cookie.get('domain', '')
+    jar_cookie = create_cookie(
+        cookie['name'], cookie['value'],
+        domain=domain, path=cookie.get('path', '/'),
+        secure=cookie.get('secure', False),
+        expires=None if cookie.get('session') or cookie.get('expires', -1) in (-1, None) else int(cookie['expires']),
+        rest={'HttpOnly': None} if cookie.get('httpOnly') else {},
+    )
+    # 先頭が "." でなければホスト限定のCookie
+    jar_cookie.domain_specified = domain.startswith('.')
+    return jar_cookie
+
+def _to_cdp_cookie(cookie):
+    """requests のCookieを、Network.setCookies に渡す形式に変換する"""
+    param = {
+        'name': cookie.name, 'value': cookie.value,
+        'path': cookie.path or '/', 'secure': bool(cookie.secure),
+        'httpOnly': cookie.has_nonstandard_attr('HttpOnly'),
+    }
+    if cookie.domain_specified or cookie.domain.startswith('.'):
+        param['domain'] = cookie.domain
+    else:
+        # ホスト限定のCookieは domain ではなく url で指定する (domain 指定だとサブドメインにも送られてしまう)
+        scheme = 'https' if cookie.secure else 'http'
+        param['url'] = f"{scheme}://{cookie.domain}{param['path']}"
+    if cookie.expires:
+        param['expires'] = cookie.expires
+    return param
+
+def _jar_key(name, domain, path):
+    return (name, domain.lstrip('.'), path or '/')
+
+def copy_cookies_to_session(driver, session, config):
+    """
+    ブラウザの全ドメインのCookie (楽天関連のみ) を、属性ごと requests.Session に設定する。
+    driver.get_cookies() と異なり、表示中以外のドメイン (basket.step.rakuten.co.jp など) も含める。
+    :return: 設定した件数
+    """
+    cookies = driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']
+    cookies = [c for c in cookies if _is_target_cookie(c, _extra_hosts(config))]
+    for cookie in cookies:
+        session.cookies.set_cookie(_to_jar_cookie(cookie))
+    return len(cookies)
+
+def copy_cookies_to_driver(driver, session):
+    """
+    requests.Session のCookie (cartAdd などで更新されたもの) を、1回のCDP呼び出しでブラウザに書き戻す。
+    :return: 書き戻した件数 (失敗した場合は None)
+    """
+    params = [_to_cdp_cookie(cookie) for cookie in session.cookies]
+    try:
+        driver.execute_cdp_cmd('Network.setCookies', {'cookies': params})
+    except Exception as e:
+        print(f"⚠️ Cookieをブラウザに書き戻せませんでした ({len(params)}件): {e}")
+        return None
+    return len(params)
+
+def diff_cookie_jars(driver, session):
+    """
+    requests.Session のCookieのうち、ブラウザに無い・値が異なるものを返す (書き戻しの確認用)。
+    :return: [(name, domain, path), ...] (一致していれば空)
+    """
+    browser = {
+        _jar_key(c['name'], c.get('domain', ''), c.get('path')): c['value']
+        for c in driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']
+    }
+    return [
+        key for key, value in (
+            (_jar_key(c.name, c.domain, c.path), c.value) for c in session.cookies
+        )
+        if browser.get(key) != value
+    ]
+
+def _is_session_valid(cookies, config):
+    """
+    保存されたCookieでログイン状態が有効かを、1回の軽いリクエストで確認する。
+    購入履歴ページがログイン画面へリダイレクトされなければ有効とみなす。
+    """
+    session = requests.Session()
+    for cookie in cookies:
+        session.cookies.set_cookie(_to_jar_cookie(cookie))
+    response = session.get(config['order_history_url'], allow_redirects=False, timeout=5)
+    location = response.headers.get('Location', '')
+    return response.status_code == 200 or (300 <= response.status_code < 400 and 'login' not in location)
+
+def restore_session(driver, config):
+    """
+    保存されたログイン状態を復元する。
+    Cookieが有効であることを確認できた場合のみブラウザに設定して True を返す。
+    False の場合は通常のログイン処理を行う。
+    """
+    path = config.get('session_file', 'cookies.pkl')
+    stored = _load(path)
+    if not stored:
+        print("ℹ️ 保存されたログイン状態がありません。通常のログインを行います。")
+        return False
+
+    now = time.time()
+    cookies = [c for c in stored['cookies'] if not _is_expired(c, now)]
+    age_min = (now - stored.get('saved_at', now)) / 60
+    print(f"🍪 保存されたログイン状態を確認します ({len(cookies)}件, {age_min:.0f}分前に保存)...")
+    try:
+        if not cookies or not _is_session_valid(cookies, config):
+            print("-> ログイン状態の有効期限が切れています。通常のログインを行います。")
+            return False
+    except requests.exceptions.RequestException as e:
+        print(f"-> ログイン状態を確認できませんでした ({e})。通常のログインを行います。")
+        return False
+
+    load_cookies(driver, path)
+    print("-> 保存されたログイン状態でログインを省略します。")
+    return True
@@ -0,0 +1,82 @@
+# startup_profile.py
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+class StartupProfiler:
+    """
+    起動時の「モジュールの読み込み」と「初期化処理」の所要時間を計測する (--profile-startup 用)。
+    install() 以降に初めて読み込まれたモジュールの時間を、読み込みの入れ子構造ごと記録する。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.imports = []  # (深さ, モジュール名, 読み込み時間ミリ秒)
+        self.phases = []   # (名前, 所要時間ミリ秒)
+        self._origin = time.perf_counter()
+        self._depth = 0
+        self._original_import = None
+        self._thread = None
+
+    def install(self):
+        """import 文を計測するフックを差し込む (最初のモジュール読み込みより前に呼ぶ)"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._origin = time.perf_counter()
+        self._thread = threading.get_ident()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original_import:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # 読み込み済みのモジュールや、別スレッドからの import は計測しない
+        if level or name in sys.modules or threading.get_ident() != self._thread:
+            return self._original_import(name, globals, locals, fromlist, level)
+        entry = [self._depth, name, 0.0]
+        self.imports.append(entry)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            entry[2] = (time.perf_counter() - start) * 1000
+            self._depth -= 1
+
+    @contextmanager
+    def phase(self, name):
+        """with profiler.phase('load_config'): ... のように使い、初期化処理の所要時間を記録する"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - start) * 1000))
+
+    def report(self, label, min_ms=1.0):
+        """計測結果を表示する。min_ms 未満のモジュールは省略する"""
+        if not self.enabled:
+            return
+        self.uninstall()
+        elapsed = (time.perf_counter() - self._origin) * 1000
+        print(f"\n--- 起動プロファイル (計測開始から「{label}」まで: {elapsed:.0f} ms) ---")
+        print("[モジュールの読み込み] (字下げは読み込みの入れ子、時間は配下を含む)")
+        for depth, name, ms in self.imports:
+            if ms >= min_ms:
+                print(f"  {ms:8.1f} ms  {'  ' * depth}{name}")
+        total_imports = sum(ms for depth, name, ms in self.imports if depth == 0)
+        print(f"  {total_imports:8.1f} ms  (合計)")
+        print("[初期化処理]")
+        for name, ms in self.phases:
+            print(f"  {ms:8.1f} ms  {name}")
+        print("-" * 40)
+
+profiler = StartupProfiler()
@@ -0,0 +1,163 @@
+# stock_watcher.py
+import hashlib
+import json
+import random
+import time
+from datetime import datetime
+import requests
+from rakuten_monitor import slice_app_data, evaluate_product
+from tracer import tracer
+
+# 混雑・制限を示すステータス。これらを受けたら間隔を大きく空ける
+BACKOFF_STATUSES = (429, 500, 502, 503, 504)
+
+def _stock_fragment(data):
+    """item-page-app-data のJSONから、在庫判定と価格に関係する項目だけを取り出す"""
+    product = evaluate_product(data) or {'skus': []}
+    keys = ('variant_id', 'stock_condition', 'quantity', 'price', 'in_stock')
+    return [{k: sku[k] for k in keys} for sku in product['skus']]
+
+class StockWatcher:
+    """
+    商品ページをHTTPで軽量に監視し、SKUが「売り切れ → 在庫あり」に変わった瞬間を検知する。
+
+    - ETag / Last-Modified がある場合は条件付きリクエストで、変更がなければ本文を受け取らない
+    - 本文を受け取った場合も、在庫・価格に関係する部分のハッシュだけを比較する
+    - 変化がない間は間隔を少しずつ延ばし、429/5xx を受けたら大きく空ける (再入荷を検知したら初期値に戻す)
+    """
+
+    def __init__(self, session, product_url, headers=None, base_interval=1.0, max_interval=10.0, timeout=5):
+        self.session = session
+        self.product_url = product_url
+        self.headers = dict(headers or {})
+        self.base_interval = base_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.timeout = timeout
+        self.interval = base_interval
+        self._etag = None
+        self._last_modified = None
+        self._digest = None
+        self._in_stock = {}  # variant_id -> 在庫ありか
+        self.data = None      # 直近に取得した item-page-app-data のJSON
+        self.changed = False  # 直近の確認で在庫・価格に変化があったか (初回を含む)
+
+    def _request_headers(self):
+        headers = dict(self.headers)
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        return headers
+
+    def backoff(self, retry_after=None):
+        """混雑時は間隔を倍にする。Retry-After が指定されていればそれに従う"""
+        try:
+            wait = float(retry_after) if retry_after else 0
+        except ValueError:
+            wait = 0
+        self.interval = min(self.max_interval, max(self.interval * 2, wait))
+
+    def poll_once(self):
+        """
+        1回だけ確認する。
+        :return: 今回「売り切れ → 在庫あり」に変わった variant_id のリスト。
+                 初回 (および reset() の後) の確認では、その時点で在庫ありの variant_id すべて
+        """
+        self.changed = False
+        response = self.session.get(self.product_url, headers=self._request_headers(), timeout=self.timeout)
+        if response.status_code == 304:
+            self.interval = min(self.max_interval, self.interval * 1.2)
+            return []
+        if response.status_code in BACKOFF_STATUSES:
+            print(f"  ⚠️ 在庫監視: HTTP {response.status_code} を受けたため間隔を空けます。")
+            self.backoff(response.headers.get('Retry-After'))
+            return []
+        if response.status_code != 200:
+            print(f"  ⚠️ 在庫監視: 商品ページの取得に失敗しました (HTTP {response.status_code})")
+            self.backoff()
+            return []
+
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+
+        json_text = slice_app_data(response.text)
+        if json_text is None:
+            print("  ⚠️ 在庫監視: 商品データ(item-page-app-data)が見つかりません。")
+            self.backoff()
+            return []
+
+        try:
+            data = json.loads(json_text)
+        except ValueError as e:
+            print(f"  ⚠️ 在庫監視: 商品データを読み取れませんでした ({e})")
+            self.backoff()
+            return []
+        fragment = _stock_fragment(data)
+        digest = hashlib.sha1(json.dumps(fragment, sort_keys=True).encode('utf-8')).hexdigest()
+        if digest == self._digest:
+            self.interval = min(self.max_interval, self.interval * 1.2)
+            return []
+
+        # 初回は以前の状態がないため、監視を始めた時点で在庫があればそれも検知として扱う
+        first_poll = self._digest is None
+        self._digest = digest
+        self.data = data
+        self.changed = True
+        restocked = []
+        for sku in fragment:
+            in_stock = sku['in_stock']
+            if in_stock and (first_poll or not self._in_stock.get(sku['variant_id'], False)):
+                restocked.append(sku['variant_id'])
+            self._in_stock[sku['variant_id']] = in_stock
+
+        # 在庫の内容が変わった直後は、続けて変化する可能性が高いので初期間隔に戻す
+        # (初回・reset() 直後の確認は変化ではないため、失敗後に空けた間隔を保つ)
+        if not first_poll:
+            self.interval = self.base_interval
+        return restocked
+
+    def reset(self):
+        """前回の内容を忘れ、次の確認で本文を取り直して、在庫ありのSKUを改めて検知する"""
+        self._etag = None
+        self._last_modified = None
+        self._digest = None
+
+    def forget(self, variant_ids):
+        """指定したSKUを売り切れのまま扱う (次に内容が変わった時、在庫ありなら改めて再入荷として検知する)"""
+        for variant_id in variant_ids:
+            self._in_stock[variant_id] = False
+
+    def in_stock_variants(self):
+        """直近の確認で在庫ありだった variant_id のリスト"""
+        return [variant_id for variant_id, in_stock in self._in_stock.items() if in_stock]
+
+    def watch(self, on_restock):
+        """
+        再入荷を検知するたびに on_restock(variant_ids) を呼び出す。
+        on_restock が True を返すまで監視を続ける (None は「条件に合わないため見送った」を表す)。
+        False (カート追加に失敗) の場合は reset() して間隔を空け、次の確認で在庫ありのSKUを改めて検知する。
+        """
+        print(f"🔎 在庫監視を開始します (間隔 {self.base_interval:.1f}～{self.max_interval:.1f} 秒): {self.product_url}")
+        while True:
+            try:
+                with tracer.span('stock_poll') as span_args:
+                    restocked = self.poll_once()
+                    span_args['restocked'] = len(restocked)
+            except requests.exceptions.RequestException as e:
+                print(f"  ⚠️ 在庫監視: 通信エラー ({e})")
+                self.backoff()
+                restocked = []
+
+            if restocked:
+                print(f"🎉 再入荷を検知しました！ {datetime.now().strftime('%H:%M:%S.%f')} (SKU: {', '.join(map(str, restocked))})")
+                tracer.instant('restock_detected', variants=restocked)
+                result = on_restock(restocked)
+                if result:
+                    return True
+                if result is False:
+                    # 失敗した場合は、間隔を空けて次の確認で改めて判定する
+                    self.reset()
+                    self.backoff()
+
+            # 複数の監視が同じ周期で揃わないよう、わずかにずらす
+            time.sleep(self.interval * random.uniform(0.9, 1.1))
@@ -0,0 +1,88 @@
+# sudo_session.py
+import threading
+from datetime import datetime
+import requests
+from tracer import tracer
+
+def _looks_authenticated(response):
+    """購入履歴ページの応答から、高セキュリティ認証(Sudoモード)が有効かを判定する"""
+    if 300 <= response.status_code < 400:
+        return 'login' not in response.headers.get('Location', '')
+    return response.status_code == 200 and 'type="password"' not in response.text
+
+class SudoSession:
+    """
+    高セキュリティ認証(Sudoモード)を最後に取得した時刻と、購入手続き中に表示されたログイン画面を記録する。
+    長い待機の間は、軽いリクエストで定期的にログイン状態を確認する (キープアライブ)。
+    """
+
+    def __init__(self):
+        self.authenticated_at = None  # 最後に認証を確認した日時
+        self.login_prompts = []       # 購入手続き中に表示されたログイン画面 (種類, URL)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def mark_authenticated(self):
+        """ensure_sudo_mode で認証を取得・確認できたときに呼ぶ"""
+        self.authenticated_at = datetime.now()
+
+    def age_seconds(self):
+        """最後に認証してからの経過秒数 (未取得なら None)"""
+        if self.authenticated_at is None:
+            return None
+        return (datetime.now() - self.authenticated_at).total_seconds()
+
+    def record_login_prompt(self, kind, url):
+        """購入手続き中にログイン画面が表示されたことを記録する"""
+        with self._lock:
+            self.login_prompts.append((kind, url))
+        tracer.instant('login_prompt', kind=kind, url=url)
+
+    def report(self):
+        """購入手続き中にログイン画面が表示されたかを表示する"""
+        age = self.age_seconds()
+        age_text = f"認証から {age / 60:.1f} 分後" if age is not None else "認証の記録なし"
+        if not self.login_prompts:
+            print(f"🔐 購入手続き中にログイン画面は表示されませんでした ({age_text})。")
+            return
+        kinds = ', '.join(kind for kind, url in self.login_prompts)
+        print(f"⚠️ 購入手続き中にログイン画面が {len(self.login_prompts)} 回表示されました ({age_text}): {kinds}")
+
+    def check(self, session, config):
+        """購入履歴ページへの軽いリクエストで、認証が有効かを確認する (リダイレクトは追わない)"""
+        url = config.get('order_history_url', "https://order.my.rakuten.co.jp/")
+        response = session.get(url, allow_redirects=False, timeout=5)
+        return _looks_authenticated(response)
+
+    def start_keepalive(self, session, config):
+        """
+        SessionKeepAliveSeconds ごとに check() を行うスレッドを開始する。
+        認証が切れたことを検知した場合は表示する (再取得は販売前の再認証で行う)。
+        """
+        interval = config.get('session_keepalive_seconds', 0)
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._keepalive_loop, args=(session, config, interval),
+                                        name='sudo-keepalive', daemon=True)
+        self._thread.start()
+
+    def _keepalive_loop(self, session, config, interval):
+        was_authenticated = True
+        while not self._stop_event.wait(interval):
+            try:
+                authenticated = self.check(session, config)
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ ログイン状態の確認に失敗しました: {e}")
+                continue
+            if was_authenticated and not authenticated:
+                print("⚠️ 高セキュリティ認証の有効期限が切れています (販売前に再認証します)。")
+            was_authenticated = authenticated
+
+    def stop_keepalive(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=6)
+
+sudo_session = SudoSession()
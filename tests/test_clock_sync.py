@@ -0,0 +1,18 @@
+# tests/test_clock_sync.py
+import pytest
+from clock_sync import estimate_offset
+from mock_server import MockRakutenServer
+
+@pytest.fixture
+def skewed_server():
+    server = MockRakutenServer(clock_skew=0.3).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_offset_is_within_reported_bounds(skewed_server):
+    result = estimate_offset(skewed_server.base_url, samples=8)
+    assert result['low'] <= 0.3 <= result['high']
+    assert abs(result['offset'] - 0.3) <= result['error']
+    # 秒の切り替わりを狙う計測ごとに範囲がほぼ半分になるため、8回で 1秒 / 2^7 程度まで絞り込める
+    assert result['error'] < 0.02
@@ -0,0 +1,142 @@
+# tests/test_session_store.py
+import time
+from urllib.parse import urlsplit
+import requests
+from session_store import (_to_jar_cookie, _to_cdp_cookie, copy_cookies_to_session, copy_cookies_to_driver,
+                           diff_cookie_jars)
+
+EXPIRES = int(time.time()) + 3600
+
+# Network.getAllCookies が返す形式のCookie
+DOMAIN_COOKIE = {
+    'name': 'Rz', 'value': 'abc', 'domain': '.rakuten.co.jp', 'path': '/',
+    'secure': True, 'httpOnly': True, 'expires': EXPIRES + 0.5, 'session': False,
+}
+HOST_ONLY_COOKIE = {
+    'name': 'basket', 'value': 'xyz', 'domain': 'basket.step.rakuten.co.jp', 'path': '/rms/',
+    'secure': True, 'httpOnly': False, 'expires': -1, 'session': True,
+}
+PLAIN_HOST_COOKIE = {
+    'name': 'local', 'value': '1', 'domain': '127.0.0.1', 'path': '/',
+    'secure': False, 'httpOnly': False, 'expires': -1, 'session': True,
+}
+
+class FakeDriver:
+    """execute_cdp_cmd だけを持つ、Cookieの保存先 (Network.setCookies の内容は getAllCookies に反映する)"""
+
+    def __init__(self, cookies=()):
+        self.cookies = list(cookies)
+        self.set_params = None
+        self.drop = set()  # setCookies で反映しない (ブラウザに拒否された) Cookie名
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == 'Network.getAllCookies':
+            return {'cookies': self.cookies}
+        if cmd == 'Network.setCookies':
+            self.set_params = params['cookies']
+            for param in self.set_params:
+                if param['name'] not in self.drop:
+                    self._store(param)
+            return {}
+        raise AssertionError(cmd)
+
+    def _store(self, param):
+        cookie = dict(param)
+        if 'url' in cookie:
+            cookie['domain'] = urlsplit(cookie.pop('url')).hostname
+        cookie['session'] = 'expires' not in cookie
+        self.cookies = [c for c in self.cookies
+                        if (c['name'], c['domain'], c['path']) != (cookie['name'], cookie['domain'], cookie['path'])]
+        self.cookies.append(cookie)
+
+def jar_header(jar, url):
+    """jar を使った場合に url へ送られる Cookie ヘッダー"""
+    session = requests.Session()
+    session.cookies = jar
+    return session.prepare_request(requests.Request('GET', url)).headers.get('Cookie', '')
+
+def test_domain_cookie_keeps_attributes():
+    jar_cookie = _to_jar_cookie(DOMAIN_COOKIE)
+    assert jar_cookie.domain == '.rakuten.co.jp'
+    assert jar_cookie.domain_specified
+    assert jar_cookie.path == '/'
+    assert jar_cookie.secure
+    assert jar_cookie.has_nonstandard_attr('HttpOnly')
+    assert jar_cookie.expires == EXPIRES
+
+    param = _to_cdp_cookie(jar_cookie)
+    assert param == {
+        'name': 'Rz', 'value': 'abc', 'domain': '.rakuten.co.jp', 'path': '/',
+        'secure': True, 'httpOnly': True, 'expires': EXPIRES,
+    }
+
+def test_host_only_cookie_round_trips_as_url():
+    jar_cookie = _to_jar_cookie(HOST_ONLY_COOKIE)
+    assert not jar_cookie.domain_specified
+    assert jar_cookie.expires is None
+    assert not jar_cookie.has_nonstandard_attr('HttpOnly')
+
+    param = _to_cdp_cookie(jar_cookie)
+    # ホスト限定のCookieは domain ではなく url で書き戻す (サブドメインに広げない)
+    assert 'domain' not in param
+    assert param['url'] == 'https://basket.step.rakuten.co.jp/rms/'
+    assert param['path'] == '/rms/'
+    assert param['secure'] is True
+    assert param['httpOnly'] is False
+    assert 'expires' not in param
+
+def test_jar_sends_cookies_only_where_the_browser_would():
+    jar = requests.cookies.RequestsCookieJar()
+    for cookie in (DOMAIN_COOKIE, HOST_ONLY_COOKIE):
+        jar.set_cookie(_to_jar_cookie(cookie))
+
+    assert jar_header(jar, 'https://item.rakuten.co.jp/') == 'Rz=abc'
+    assert jar_header(jar, 'http://item.rakuten.co.jp/') == ''  # secure
+    assert 'basket=xyz' in jar_header(jar, 'https://basket.step.rakuten.co.jp/rms/mall/cartAdd/')
+    assert 'basket' not in jar_header(jar, 'https://basket.step.rakuten.co.jp/other/')  # path
+    assert 'basket' not in jar_header(jar, 'https://www.rakuten.co.jp/rms/')  # 別ホスト
+
+def test_copy_between_driver_and_session():
+    driver = FakeDriver([DOMAIN_COOKIE, HOST_ONLY_COOKIE, PLAIN_HOST_COOKIE])
+    session = requests.Session()
+    config = {'cart_url': 'http://127.0.0.1:8000/cart/'}
+
+    assert copy_cookies_to_session(driver, session, config) == 3
+    assert copy_cookies_to_driver(driver, session) == 3
+    params = {p['name']: p for p in driver.set_params}
+    assert params['Rz']['domain'] == '.rakuten.co.jp'
+    assert params['Rz']['httpOnly'] is True
+    assert params['basket']['url'] == 'https://basket.step.rakuten.co.jp/rms/'
+    assert params['local']['url'] == 'http://127.0.0.1/'
+
+def test_cookies_of_other_sites_are_not_copied():
+    other = dict(PLAIN_HOST_COOKIE, name='ads', domain='.example.com')
+    driver = FakeDriver([DOMAIN_COOKIE, other])
+    session = requests.Session()
+    assert copy_cookies_to_session(driver, session, {}) == 1
+    assert [c.name for c in session.cookies] == ['Rz']
+
+def test_round_trip_leaves_no_difference():
+    driver = FakeDriver([DOMAIN_COOKIE, HOST_ONLY_COOKIE, PLAIN_HOST_COOKIE])
+    before = {(c['name'], c['domain'], c['path'], c['value']) for c in driver.cookies}
+    session = requests.Session()
+    copy_cookies_to_session(driver, session, {'cart_url': 'http://127.0.0.1:8000/cart/'})
+    # cartAdd の応答で Session 側のCookieが更新された場合も、書き戻した後は一致する
+    session.cookies.set_cookie(_to_jar_cookie(dict(DOMAIN_COOKIE, value='updated')))
+
+    copy_cookies_to_driver(driver, session)
+
+    assert diff_cookie_jars(driver, session) == []
+    after = {(c['name'], c['domain'], c['path'], c['value']) for c in driver.cookies}
+    assert after == before - {('Rz', '.rakuten.co.jp', '/', 'abc')} | {('Rz', '.rakuten.co.jp', '/', 'updated')}
+
+def test_dropped_cookie_is_reported():
+    driver = FakeDriver([DOMAIN_COOKIE, HOST_ONLY_COOKIE])
+    session = requests.Session()
+    copy_cookies_to_session(driver, session, {})
+    session.cookies.set_cookie(_to_jar_cookie(dict(HOST_ONLY_COOKIE, name='new_basket')))
+    driver.drop.add('new_basket')
+
+    copy_cookies_to_driver(driver, session)
+
+    assert diff_cookie_jars(driver, session) == [('new_basket', 'basket.step.rakuten.co.jp', '/rms/')]
@@ -0,0 +1,74 @@
+# tracer.py
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+class Tracer:
+    """
+    処理フェーズの所要時間を記録する軽量トレーサー。
+    タイムスタンプはモノトニッククロック(perf_counter)基準で、入れ子のスパンに対応する。
+    Chrome trace-event 形式で書き出せるので、chrome://tracing や Perfetto で開ける。
+    """
+
+    def __init__(self):
+        self.events = []
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    def _append(self, event):
+        thread = threading.current_thread()
+        event.update(pid=self._pid, tid=thread.ident)
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, cat='phase', **args):
+        """with tracer.span('login'): ... のように使い、ブロックの所要時間を記録する"""
+        if not self.enabled:
+            yield args
+            return
+        start = self._now_us()
+        try:
+            yield args  # 呼び出し側で結果などを args に追記できる
+        finally:
+            self._append({
+                'name': name, 'cat': cat, 'ph': 'X',
+                'ts': start, 'dur': self._now_us() - start,
+                'args': args,
+            })
+
+    def instant(self, name, cat='mark', **args):
+        """ページ遷移などの瞬間的なイベントを記録する"""
+        if self.enabled:
+            self._append({'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'ts': self._now_us(), 'args': args})
+
+    def export(self, directory='traces'):
+        """記録したイベントを Chrome trace-event 形式の JSON として書き出し、パスを返す"""
+        if not self.enabled or not self.events:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+        with self._lock:
+            events = list(self.events)
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid,
+             'args': {'name': thread_names.get(tid, str(tid))}}
+            for tid in {e['tid'] for e in events}
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        print(f"トレースを '{path}' に保存しました。(chrome://tracing で開けます)")
+        return path
+
+# プロセス全体で共有するトレーサー
+tracer = Tracer()
@@ -0,0 +1,109 @@
+# watchlist.py
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from stock_watcher import StockWatcher
+from rakuten_monitor import build_cart_form_data
+from tracer import tracer
+
+def _evaluate_item(item, data):
+    """
+    監視中の商品が購入条件 (希望SKUの在庫あり・上限価格以下) を満たすか判定する。
+    満たす場合は、カート追加APIの情報 (数量は上限数と在庫数の小さい方) を返す。
+    """
+    api_info = build_cart_form_data(data, sku_preference=item['sku_preference'],
+                                    units=item['max_quantity'], interactive=False)
+    if not api_info:
+        return None
+
+    sku = api_info['sku']
+    if sku is None:
+        # SKU情報のない商品は、在庫の判定をカート追加APIに任せる
+        sku = {'in_stock': True, 'quantity': None, 'price': api_info['price']}
+
+    if not sku['in_stock']:
+        return None
+
+    price = sku['price']
+    if price is not None and price > item['max_price']:
+        print(f"  [{item['name']}] 価格 {price:,}円 が上限 {item['max_price']:,}円 を超えているため見送ります。")
+        return None
+
+    quantity = sku['quantity']
+    if isinstance(quantity, int) and quantity < item['max_quantity']:
+        api_info['data']['units'] = str(quantity)
+    return api_info
+
+def _watch_item(item, session, headers, config, on_hit, purchase_lock, stop_event):
+    """
+    1商品分の監視ループ。購入に成功するか、stop_event がセットされるまで続ける。
+    on_hit が None を返した場合 (かごには追加できたが購入できなかった・結果が不明) も、
+    再びかごに追加して上限数を超えないよう、この商品の監視を終える。
+    """
+    watcher = StockWatcher(
+        session, item['url'], {'User-Agent': headers.get('User-Agent', '')},
+        base_interval=config['interval'], max_interval=config.get('restock_max_interval_seconds', 10),
+    )
+    while not stop_event.is_set():
+        try:
+            with tracer.span('stock_poll', item=item['name']):
+                watcher.poll_once()
+        except requests.exceptions.RequestException as e:
+            print(f"  ⚠️ [{item['name']}] 通信エラー ({e})")
+            watcher.backoff()
+
+        if watcher.changed:
+            api_info = _evaluate_item(item, watcher.data)
+            if api_info:
+                print(f"🎉 [{item['name']}] 購入条件を満たしました！カート追加に進みます。")
+                # ブラウザとSessionは1つなので、購入処理は1商品ずつ行う
+                with purchase_lock:
+                    if stop_event.is_set():
+                        return False
+                    result = on_hit(item, api_info)
+                    if result:
+                        return True
+                    if result is None:
+                        print(f"  [{item['name']}] かごに追加済みのため、この商品の監視を終えます。")
+                        return False
+                # 失敗した場合は、間隔を空けて次の確認で改めて判定する
+                watcher.reset()
+                watcher.backoff()
+
+        stop_event.wait(watcher.interval * random.uniform(0.9, 1.1))
+    return False
+
+def monitor_watchlist(config, session, headers, on_hit):
+    """
+    ウォッチリストの全商品を、ログイン済みの1つの Session で同時に監視する。
+    購入条件を満たした商品ごとに on_hit(item, api_info) を呼び出す。
+    on_hit は 購入成功なら True、かごに追加できなかった (次の確認で再判定する) なら False、
+    かごに追加した後に購入できなかった・結果が不明なら None を返し、True / None でその商品の監視を終える。
+    :return: 購入に成功した商品名のリスト
+    """
+    items = config['watchlist']
+    print(f"🔎 ウォッチリストの {len(items)} 商品を監視します:")
+    for item in items:
+        preference = ', '.join(item['sku_preference']) or '指定なし'
+        print(f"  - {item['name']}: 上限 {item['max_price']:,}円 / 最大 {item['max_quantity']}個 / SKU: {preference}")
+
+    purchase_lock = threading.Lock()
+    stop_event = threading.Event()
+    purchased = []
+    with ThreadPoolExecutor(max_workers=len(items), thread_name_prefix='watch') as executor:
+        futures = {
+            executor.submit(_watch_item, item, session, headers, config, on_hit, purchase_lock, stop_event): item
+            for item in items
+        }
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    if future.result():
+                        purchased.append(item['name'])
+                except Exception as e:
+                    print(f"  ❌ [{item['name']}] 監視中にエラーが発生しました: {e}")
+        finally:
+            stop_event.set()
+    return purchased